@@ -2,17 +2,14 @@ import sys
 sys.dont_write_bytecode = True
 
 from langchain_core.output_parsers import StrOutputParser
-from langchain_community.utilities.sql_database import SQLDatabase
-from langchain_core.runnables import RunnablePassthrough
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
-from langchain_pinecone import PineconeVectorStore
 from langchain.schema.runnable.base import Runnable
 from langchain_core.prompts import PromptTemplate
 from langchain.output_parsers import PydanticOutputParser
+from resources import registry, PAPER_INDEX_NAME
+from semantic_cache import make_semantic_cache, document_ids
+from res_fun import encode_texts
 #from operator import itemgetter
-from langchain_openai import OpenAIEmbeddings
-from pinecone import Index, Pinecone
 from typing import Type, Optional
 from langchain.tools import BaseTool
 from dotenv import load_dotenv
@@ -29,26 +26,11 @@ from langchain.prompts import (
 # -------------------------------------PREPARE------------------------------------------------------------------------------------
 load_dotenv()
 
-embeddings_model = OpenAIEmbeddings(model="text-embedding-3-small")
-pc = Pinecone()
-index: Index = pc.Index("total")
-vector_store = PineconeVectorStore(
-    index=index, embedding=embeddings_model
-)
-
 def format_docs(documents):
     return "\n\n".join(str(doc.metadata) + doc.page_content for doc in documents)
 
-retriever = vector_store.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={"k": 10, "score_threshold": 0.65},
-)
-
 #----------------------------------------------PINE---------------------------
 
-llm = ChatOpenAI(model="gpt-4o-mini")
-
-
 template = """Use the following pieces of context to give user scientific citations 
               for the paper user created. Be very specific on everything in your citations.
               You don't provide a citation of their paper, you provide citation they can use in their paper
@@ -64,12 +46,31 @@ Question: {question}
 
 custom_rag_prompt = PromptTemplate.from_template(template)
 
-rag_chain = (
-    {"context": retriever | format_docs, "question": RunnablePassthrough()}
-    | custom_rag_prompt
-    | llm
-    | StrOutputParser()
-)
+# Minimum relevance of the papers used (the shared search of "paper_retrieval" runs at the lowest threshold)
+SCORE_THRESHOLD = 0.65
+
+def build_rag_chain():
+    """Build the answer chain over retrieved documents (called once, through the registry)."""
+    return (
+        {"context": lambda x: format_docs(x["documents"]), "question": lambda x: x["question"]}
+        | custom_rag_prompt
+        | registry.get("chat_llm")
+        | StrOutputParser()
+    )
+
+
+registry.register("citation_rag_chain", build_rag_chain)
+
+
+def answer_question(question):
+    """Retrieve the papers and run the RAG chain, returning the answer and the ids of the documents it was based on."""
+    documents = registry.get("paper_retrieval").search(question, SCORE_THRESHOLD)
+    answer = registry.get("citation_rag_chain").invoke({"documents": documents, "question": question})
+    return answer, document_ids(documents)
+
+
+# Near-identical questions (i.e. students of the same course) get the answer already generated for the first one
+citation_answers = make_semantic_cache("citation_answers", encode_texts, PAPER_INDEX_NAME)
 
 #----------------------------------------------TOOL-PINE-----------------------------
 class CustomerInput(BaseModel):
@@ -88,7 +89,7 @@ class PineconeCitationTool(BaseTool):
             customer_id: int,
             customer_input: str,
     ) -> str:
-        return rag_chain.invoke(customer_input)
+        return citation_answers.get_or_compute(customer_input, answer_question)
     
 
 #------------------------------------------------AGENT-----------------------------------------------------------------------------------
@@ -120,8 +121,10 @@ prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-llm = ChatOpenAI(model="gpt-4o-mini")
-tools = [PineconeCitationTool()]
+def build_agent_executor():
+    """Build the citation agent (called once, through the registry as "citation_agent")."""
+    tools = [PineconeCitationTool()]
+
+    agent = create_tool_calling_agent(registry.get("chat_llm"), tools, prompt)
+    return AgentExecutor(agent=agent, tools=tools)
 
-agent = create_tool_calling_agent(llm, tools, prompt)
-agent_executor = AgentExecutor(agent=agent, tools=tools)
@@ -5,12 +5,13 @@ import warnings
 warnings.filterwarnings("ignore")
 
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 import json
 from langchain.schema.runnable.base import Runnable
 from langchain.output_parsers import PydanticOutputParser
 from langchain.tools import BaseTool
-from langchain_openai import ChatOpenAI
+from resources import registry
+from agents.common import PromptTemplate, generate_prompt_templates, get_chain
 from typing import Type
 from langchain.agents import AgentExecutor
 from langchain.agents import create_tool_calling_agent
@@ -21,65 +22,20 @@ from langchain.prompts import (
     MessagesPlaceholder,
 )
 
-class PromptTemplate(BaseModel):
-    """Defines templates for system and human messages used in a conversation."""
-
-    system_template: str = Field(
-        description="Template for the system message in the conversation"
-    )
-    human_template: str = Field(
-        description="Template for the human message in the conversation"
-    )
 
 class CustomerInput(BaseModel):
     customer_id: int 
     customer_input: str 
 
-def generate_prompt_templates(
-    prompt_template: PromptTemplate
-) -> ChatPromptTemplate:
-    """Generate a chat prompt template based on given templates and memory setting.
-
-    Args:
-        prompt_template: An instance of PromptTemplate containing system and human templates.
-
-    Returns:
-        A configured ChatPromptTemplate with specified message structure.
-    """
-
-    # Create prompt template without chat history
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            SystemMessagePromptTemplate.from_template(
-                prompt_template.system_template
-            ),
-            HumanMessagePromptTemplate.from_template(
-                prompt_template.human_template
-            ),
-        ]
-    )
-
-    return prompt
 
 ###############################################chain_tool_etc##############################################
+class QuizzQuestion(BaseModel):
+    question:str
+    options:str
+    answer:str
+
 class Quizz(BaseModel):
-    question1:str
-    question2:str
-    question3:str
-    question4:str
-    question5:str
-
-    options1:str
-    options2:str
-    options3:str
-    options4:str
-    options5:str
-
-    answer1:str
-    answer2:str
-    answer3:str
-    answer4:str
-    answer5:str
+    questions:List[QuizzQuestion]
 
 class QuizzChain(Runnable):
     def __init__(self, llm):
@@ -91,7 +47,7 @@ class QuizzChain(Runnable):
             system_template=""" 
             You are a part of the teaching assistant named Aurora. 
             Your task is to create questions for quizzes based on the text provided. 
-            Extract main concepts and create 5 questions of a quiz.
+            Extract main concepts and create {n_questions} questions of a quiz.
             For each question create 4 options for answer each of them defind by big latin letter (A, B, C or D)
             try to shuffle the correct option so the probability of being either of those letters is the same.
             For each question also given a big latin letter that will be the correct answer.
@@ -115,6 +71,7 @@ class QuizzChain(Runnable):
         return self.chain.invoke(
             {
                 "customer_input": inputs["customer_input"],
+                "n_questions": inputs.get("n_questions", 5),
                 "format_instructions": self.format_instructions
             }
         )
@@ -130,8 +87,7 @@ class QuizzCreateTool(BaseTool):
             customer_id: int,
             customer_input: str,
     ) -> str:
-        llm = ChatOpenAI(model="gpt-4o-mini")
-        change_info = QuizzChain(llm).invoke({"customer_input": customer_input})
+        change_info = get_chain(QuizzChain).invoke({"customer_input": customer_input})
 
         return change_info
     
@@ -185,8 +141,7 @@ class AnswerEvalTool(BaseTool):
     ) -> str:
         try:
             customer_input = json.loads(customer_input)
-            llm = ChatOpenAI(model="gpt-4o-mini")
-            change_info = QuizzChain(llm).invoke({"customer_input": "QUESTION:" + customer_input["question"] +
+            change_info = get_chain(AnswerChain).invoke({"customer_input": "QUESTION:" + customer_input["question"] +
                                                                     "OPTIONS:" + customer_input["options"] +
                                                                     "CUSTOMER" + customer_input["customer_input"]})
 
@@ -223,8 +178,9 @@ prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-llm = ChatOpenAI(model="gpt-4o-mini")
-tools = [QuizzCreateTool(), AnswerEvalTool()]
+def build_agent_executor():
+    """Build the quiz agent (called once, through the registry as "quizz_agent")."""
+    tools = [QuizzCreateTool(), AnswerEvalTool()]
 
-agent = create_tool_calling_agent(llm, tools, prompt)
-agent_executor = AgentExecutor(agent=agent, tools=tools)
\ No newline at end of file
+    agent = create_tool_calling_agent(registry.get("chat_llm"), tools, prompt)
+    return AgentExecutor(agent=agent, tools=tools)
@@ -2,22 +2,22 @@ import sys
 sys.dont_write_bytecode = True
 
 from langchain_core.output_parsers import StrOutputParser
-from langchain_community.utilities.sql_database import SQLDatabase
-from langchain_core.runnables import RunnablePassthrough
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
-from langchain_pinecone import PineconeVectorStore
 from langchain.schema.runnable.base import Runnable
 from langchain_core.prompts import PromptTemplate
 from langchain.output_parsers import PydanticOutputParser
-from res_fun import get_completion_from_messages, send_it
+from res_fun import get_completion_from_messages, send_it, encode_texts
+from resources import registry, PAPER_INDEX_NAME
+from semantic_cache import make_semantic_cache, document_ids
+from agents.common import PromptTemplate as PromptTemplate_, generate_prompt_templates, get_chain
+import database
+from reference_data import reference_data
 #from operator import itemgetter
-from langchain_openai import OpenAIEmbeddings
-from pinecone import Index, Pinecone
 from typing import Type, Optional
 from langchain.tools import BaseTool
 from dotenv import load_dotenv
 import random
+import sqlite3
 from langchain.agents import AgentExecutor
 from langchain.agents import create_tool_calling_agent
 from langchain.prompts import (
@@ -31,62 +31,12 @@ from langchain.prompts import (
 load_dotenv()
 
 
-class PromptTemplate_(BaseModel):
-    """Defines templates for system and human messages used in a conversation."""
-
-    system_template: str = Field(
-        description="Template for the system message in the conversation"
-    )
-    human_template: str = Field(
-        description="Template for the human message in the conversation"
-    )
-
-
-def generate_prompt_templates(
-    prompt_template: PromptTemplate_
-) -> ChatPromptTemplate:
-    """Generate a chat prompt template based on given templates and memory setting.
-
-    Args:
-        prompt_template: An instance of PromptTemplate containing system and human templates.
-
-    Returns:
-        A configured ChatPromptTemplate with specified message structure.
-    """
-
-    # Create prompt template without chat history
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            SystemMessagePromptTemplate.from_template(
-                prompt_template.system_template
-            ),
-            HumanMessagePromptTemplate.from_template(
-                prompt_template.human_template
-            ),
-        ]
-    )
-
-    return prompt
-
-embeddings_model = OpenAIEmbeddings(model="text-embedding-3-small")
-pc = Pinecone()
-index: Index = pc.Index("total")
-vector_store = PineconeVectorStore(
-    index=index, embedding=embeddings_model
-)
-
 def format_docs(documents):
+    if not documents:
+        return ""
     return f"{documents[0].metadata}" + "\n\n".join(doc.page_content for doc in documents if doc.metadata["file_path"] == documents[0].metadata["file_path"])
 
-retriever = vector_store.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={"k": 10, "score_threshold": 0.5},
-)
-
 #-------------------------------------------------------PINE---------------------------------------------------------------------
-llm = ChatOpenAI(model="gpt-4o-mini")
-
-
 template = """Use the following pieces of context to provide full and complete
               overview to question user. don't add anything from yourself only use 
               the provided context. at the end you must provide user with information of where the information
@@ -101,12 +51,31 @@ Question: {question}
 
 custom_rag_prompt = PromptTemplate.from_template(template)
 
-rag_chain = (
-    {"context": retriever | format_docs, "question": RunnablePassthrough()}
-    | custom_rag_prompt
-    | llm
-    | StrOutputParser()
-)
+# Minimum relevance of the papers used (the shared search of "paper_retrieval" runs at the lowest threshold)
+SCORE_THRESHOLD = 0.5
+
+def build_rag_chain():
+    """Build the answer chain over retrieved documents (called once, through the registry)."""
+    return (
+        {"context": lambda x: format_docs(x["documents"]), "question": lambda x: x["question"]}
+        | custom_rag_prompt
+        | registry.get("chat_llm")
+        | StrOutputParser()
+    )
+
+
+registry.register("resource_rag_chain", build_rag_chain)
+
+
+def answer_question(question):
+    """Retrieve the papers and run the RAG chain, returning the answer and the ids of the documents it was based on."""
+    documents = registry.get("paper_retrieval").search(question, SCORE_THRESHOLD)
+    answer = registry.get("resource_rag_chain").invoke({"documents": documents, "question": question})
+    return answer, document_ids(documents)
+
+
+# Near-identical questions (i.e. students of the same course) get the answer already generated for the first one
+resource_answers = make_semantic_cache("resource_answers", encode_texts, PAPER_INDEX_NAME)
 #----------------------------------------------TOOL-PINE-----------------------------
 class CustomerInput(BaseModel):
     customer_id: int 
@@ -124,7 +93,7 @@ class PineconeResourceTool(BaseTool):
             customer_id: int,
             customer_input: str,
     ) -> str:
-        return rag_chain.invoke(customer_input)
+        return resource_answers.get_or_compute(customer_input, answer_question)
 
 #-------------------------------------------------------SQL---------------------------------------------------------------------------
 class UserReadCourse(BaseModel):
@@ -143,9 +112,6 @@ class UserReadCourseInfoChain(Runnable):
 
         self.llm = llm
 
-        db_path = "files/aurora.db"
-        db = SQLDatabase.from_uri(f"sqlite:///{db_path}")
-
         prompt_template = PromptTemplate_(
             system_template=f""" 
             You are a part of the teaching assistant named Aurora. 
@@ -158,7 +124,7 @@ class UserReadCourseInfoChain(Runnable):
 
             Also you have to identify city in which they want to study and weather the curse has to be online or InPerson (spell exactly like this)
 
-            And list of topics that related to their search that can be either of those {[a[0] for a in eval(db.run("SELECT Name FROM topic"))]}
+            And list of topics that related to their search that can be either of those {{topics}}
 
             Here is the user input:
             {{customer_input}}
@@ -178,7 +144,9 @@ class UserReadCourseInfoChain(Runnable):
         return self.chain.invoke(
             {
                 "customer_input": inputs["customer_input"],
-                "format_instructions": self.format_instructions
+                "format_instructions": self.format_instructions,
+                # Passed on every call, so the shared chain follows changes to the topic table
+                "topics": reference_data.topics.all_names()
             }
         )
     
@@ -196,16 +164,14 @@ class ReadCourseInfoTool(BaseTool):
             customer_id: int,
             customer_input: str,
     ) -> str:
-        llm = ChatOpenAI(model="gpt-4o-mini")
-        change_info = UserReadCourseInfoChain(llm).invoke({"customer_input": customer_input})
-
-        db_path = "files/aurora.db"
-        db = SQLDatabase.from_uri(f"sqlite:///{db_path}")
+        change_info = get_chain(UserReadCourseInfoChain).invoke({"customer_input": customer_input})
 
+        # The city is compared by ID; fall back to the user's own city if the name is unknown
+        user_city = None
         if change_info.city:
-            user_city = change_info.city
-        else:
-            user_city = eval(db.run(f"SELECT CityID FROM clients WHERE UserID = {customer_id}"))[0][0]
+            user_city = reference_data.cities.id_of(change_info.city.strip())
+        if user_city is None:
+            user_city = database.fetch_value("SELECT CityID FROM clients WHERE UserID = ?", (customer_id,))
 
         select_base = "c.Name, CityName, Country, e.Name, e.Type"
         if change_info.course_syllabus:
@@ -219,8 +185,17 @@ class ReadCourseInfoTool(BaseTool):
         if change_info.course_credits:
             select_base += ", c.credits"
         
+        conditions, params = ["city.CityID = ?"], [user_city]
+        if change_info.tipo:
+            conditions.append("e.Type = ?")
+            params.append(change_info.tipo)
+        topics = [t for t in (change_info.topic or []) if t]
+        if topics:
+            conditions.append(f"topic.Name IN ({database.placeholders(topics)})")
+            params.extend(topics)
+
         try:
-            search = eval(db.run(f""" SELECT {select_base}
+            search = database.fetch_all(f""" SELECT DISTINCT {select_base}
                                     FROM course c
                                     JOIN course_location cl 
                                     ON c.CourseID = cl.CourseID
@@ -232,11 +207,10 @@ class ReadCourseInfoTool(BaseTool):
                                     ON c.CourseID = ct.CourseID
                                     JOIN topic
                                     ON topic.TopicID = ct.TopicID
-                                    WHERE city.CityID = '{user_city}' AND e.Type = '{change_info.tipo}'
-                                    AND topic.Name in {str(change_info.topic).replace("[", "(").replace("]", ")")};
-                                    """)) 
+                                    WHERE {" AND ".join(conditions)}
+                                    """, tuple(params))
 
-        except SyntaxError:
+        except sqlite3.OperationalError:
             search = None
 
         return "Here is the courses in users area I was able to find:\n" + str(search)
@@ -321,8 +295,7 @@ class EmailTool(BaseTool):
                                                                           "20221691@novaims.unl.pt",
                                                                           ])}
 
-        llm = ChatOpenAI(model="gpt-4o-mini")
-        change_info = EmailChain(llm).invoke({"customer_input": customer_input})
+        change_info = get_chain(EmailChain).invoke({"customer_input": customer_input})
 
         options = {person: em for (person, em) in zip(people_info.keys(), [change_info.joao,
                                                                           change_info.maria,
@@ -331,28 +304,21 @@ class EmailTool(BaseTool):
                                                                           change_info.vidhi,
                                                                           change_info.yehor])}
 
-        db_path = "files/aurora.db"
-        db = SQLDatabase.from_uri(f"sqlite:///{db_path}")
-
-        personal_info = db.run(f"""SELECT Name, Gender, Email
-                                   FROM clients 
-                                   WHERE UserID = {customer_id}""")
+        personal_info = database.fetch_one("""SELECT Name, Gender, Email
+                                              FROM clients 
+                                              WHERE UserID = ?""", (customer_id,))
         
-        languages = [a[0] for a in eval(db.run(f"""SELECT l.Language 
-                                   FROM clients c
-                                   JOIN user_language ul 
-                                   ON c.UserID = ul.UserID 
-                                   JOIN languages l 
-                                   ON ul.LanguageID = l.LanguageID
-                                   WHERE c.UserID={customer_id}"""))]
+        languages = database.fetch_column("""SELECT l.Language 
+                                             FROM user_language ul 
+                                             JOIN languages l 
+                                             ON ul.LanguageID = l.LanguageID
+                                             WHERE ul.UserID = ?""", (customer_id,))
         
-        courses = eval(db.run(f"""SELECT cc.Name, cc.Syllabus, pc.GPA
-                                   FROM clients c
-                                   JOIN previous_courses pc
-                                   ON pc.USERID = c.UserID
-                                   JOIN Course cc 
-                                   ON cc.CourseID = pc.CourseID
-                                   WHERE c.UserID={customer_id}"""))
+        courses = database.fetch_all("""SELECT cc.Name, cc.Syllabus, pc.GPA
+                                        FROM previous_courses pc
+                                        JOIN course cc 
+                                        ON cc.CourseID = pc.CourseID
+                                        WHERE pc.UserID = ?""", (customer_id,))
         
         sent=[]
         for name in people_info.keys():
@@ -410,11 +376,12 @@ prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-llm = ChatOpenAI(model="gpt-4o-mini")
-tools = [PineconeResourceTool(), 
-         ReadCourseInfoTool(), 
-         EmailTool()
-         ]
+def build_agent_executor():
+    """Build the resource agent (called once, through the registry as "resource_agent")."""
+    tools = [PineconeResourceTool(), 
+             ReadCourseInfoTool(), 
+             EmailTool()
+             ]
 
-agent = create_tool_calling_agent(llm, tools, prompt)
-agent_executor = AgentExecutor(agent=agent, tools=tools)
\ No newline at end of file
+    agent = create_tool_calling_agent(registry.get("chat_llm"), tools, prompt)
+    return AgentExecutor(agent=agent, tools=tools)
@@ -11,7 +11,8 @@ from langchain.tools import BaseTool
 from langchain.output_parsers import PydanticOutputParser
 import sqlite3
 import re
-from langchain_community.utilities.sql_database import SQLDatabase
+import database
+from reference_data import reference_data
 from langchain.agents import AgentExecutor
 from langchain.agents import create_tool_calling_agent
 from langchain.prompts import (
@@ -20,50 +21,14 @@ from langchain.prompts import (
     HumanMessagePromptTemplate,
     MessagesPlaceholder,
 )
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
+from resources import registry
+from agents.common import PromptTemplate, generate_prompt_templates, get_chain
+from profile_cache import profile_cache
 
 load_dotenv()
-llm = ChatOpenAI(model="gpt-4o-mini")
 
 
-class PromptTemplate(BaseModel):
-    """Defines templates for system and human messages used in a conversation."""
-
-    system_template: str = Field(
-        description="Template for the system message in the conversation"
-    )
-    human_template: str = Field(
-        description="Template for the human message in the conversation"
-    )
-
-
-def generate_prompt_templates(
-    prompt_template: PromptTemplate
-) -> ChatPromptTemplate:
-    """Generate a chat prompt template based on given templates and memory setting.
-
-    Args:
-        prompt_template: An instance of PromptTemplate containing system and human templates.
-
-    Returns:
-        A configured ChatPromptTemplate with specified message structure.
-    """
-
-    # Create prompt template without chat history
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            SystemMessagePromptTemplate.from_template(
-                prompt_template.system_template
-            ),
-            HumanMessagePromptTemplate.from_template(
-                prompt_template.human_template
-            ),
-        ]
-    )
-
-    return prompt
-
 ########################################CHANGE DATA####################################
 
 class UserChange(BaseModel):
@@ -147,232 +112,237 @@ class ChangeCustomerInfoTool(BaseTool):
             customer_id: int,
             customer_input: str,
     ) -> str:
-        llm = ChatOpenAI(model="gpt-4o-mini")
-        change_info = GetChangeableUserInfoChain(llm).invoke({"customer_input": customer_input})
+        change_info = get_chain(GetChangeableUserInfoChain).invoke({"customer_input": customer_input})
+        return apply_user_change(customer_id, change_info)
 
-        db_path = "files/aurora.db"
-        db = SQLDatabase.from_uri(f"sqlite:///{db_path}")
-        
-        connection = sqlite3.connect(db_path)
-        cursor = connection.cursor()
 
-        try:
-            #----------------------------------------------CLIENTS_TABLE-------------------------------------------------------------------------
-            to_change_clients = ""
-            vals_clients = []
+def apply_user_change(customer_id, change_info):
+    """
+    Apply the changes parsed from the user input to the user's profile.
+
+    The current state of the profile is read once, every write is collected first and then applied
+    in a single transaction (one `executemany` per statement), so the update is all-or-nothing.
 
-            if change_info.clients_city is not None: 
-                cities = {c[1].lower(): c[0] for c in eval(db.run("SELECT CityID, CityName from city"))}
+    Parameters:
+    customer_id (int): The ID of the user.
+    change_info (UserChange): The changes identified in the user input.
+
+    Returns:
+    str: The summary of the updated data.
+    """
+    writes = []
+    try:
+        #----------------------------------------------CLIENTS_TABLE-------------------------------------------------------------------------
+        to_change_clients = ""
+        vals_clients = []
+
+        if change_info.clients_city is not None: 
+            try:
+                key = reference_data.cities[change_info.clients_city.strip()]
+                to_change_clients += "CityID" + " = ?, "
+                vals_clients.append(key)
+            except KeyError:
+                pass
+
+        if change_info.clients_name is not None:
+            to_change_clients += "Name" + " = ?, "
+            vals_clients.append(change_info.clients_name)
+
+        if change_info.clients_username is not None: 
+            taken = database.fetch_one("SELECT 1 FROM clients WHERE Username = ?", (change_info.clients_username,))
+            if ((taken is None) and 
+                (len(re.findall(re.compile("\w+"), change_info.clients_username)) != 0) and 
+                (re.findall(re.compile("\w+"), change_info.clients_username)[0] == change_info.clients_username)):
+                to_change_clients += "Username" + " = ?, "
+                vals_clients.append(change_info.clients_username)
+
+        if (change_info.clients_dob is not None) and (re.findall(re.compile("\d{4}-\d{2}-\d{2}"), change_info.clients_dob.strip())):
+            to_change_clients += "DateOfBirth" + " = ?, "
+            vals_clients.append(change_info.clients_dob)
+
+        if (change_info.clients_password is not None) and ("'" not in change_info.clients_password) and (len(str(change_info.clients_password))>=8):
+            to_change_clients += "Password" + " = ?, "
+            vals_clients.append(str(change_info.clients_password))
+
+        if change_info.clients_email is not None: 
+            taken = database.fetch_one("SELECT 1 FROM clients WHERE Email = ?", (change_info.clients_email,))
+            if ((taken is None) and 
+                (len(re.findall(re.compile("[\w\.-]+@[\w\.-]+\.\w+"), change_info.clients_email)) != 0) and 
+                (re.findall(re.compile("[\w\.-]+@[\w\.-]+\.\w+"), change_info.clients_email)[0] == change_info.clients_email)):
+                to_change_clients += "Email" + " = ?, "
+                vals_clients.append(change_info.clients_email)
+
+        if change_info.clients_phone is not None: 
+            taken = database.fetch_one("SELECT 1 FROM clients WHERE REPLACE(PhoneNumber, '+', '') = ?",
+                                       (change_info.clients_phone.replace("+", ""),))
+            if ((taken is None) and 
+                (len(re.findall(re.compile("[+\d]\d+"), change_info.clients_phone)) != 0) and 
+                (re.findall(re.compile("[+\d]\d+"), change_info.clients_phone)[0] == change_info.clients_phone)):
+                to_change_clients += "PhoneNumber" + " = ?, "
+                vals_clients.append(change_info.clients_phone)
+
+        if (change_info.clients_gender is not None) and (change_info.clients_gender.lower() in 
+                                                         ["male", "female", "non-ninary", "prefer not to say"]): 
+            to_change_clients += "Gender" + " = ?, "
+            gender_spelling = {a: b for (a, b) in zip(["male", "female", "non-ninary", "prefer not to say"], 
+                                                      ["Male", "Female", "Non-Binary", "Prefer Not To Say"])}
+            vals_clients.append(gender_spelling[change_info.clients_gender.lower()])
+
+        if (change_info.clients_time is not None) and (re.findall(re.compile("\d{2}-\d{2}"), 
+                                                                 change_info.clients_time)[0] == change_info.clients_time.strip()): 
+            to_change_clients += "PreferredTime" + " = ?, "
+            vals_clients.append(change_info.clients_time)
+
+        if change_info.clients_mins is not None:
+            to_change_clients += "MinPerDay" + " = ?, "
+            vals_clients.append(change_info.clients_mins)
+
+        if len(vals_clients) > 0:
+            writes.append((f"UPDATE clients SET {to_change_clients[:-2]} WHERE UserID = ?",
+                           [tuple(vals_clients) + (customer_id,)]))
+
+        # Current state of the profile, read once instead of before every write
+        enrolled = set(database.fetch_column("SELECT CourseID FROM user_courses WHERE UserID = ?", (customer_id,)))
+        previous = set(database.fetch_column("SELECT CourseID FROM previous_courses WHERE UserID = ?", (customer_id,)))
+            
+        # ------------------------------------------PREV_COURSES---------------------------------------------------------------------------
+        to_change_prevcourse = []
+        vals_prevcourse = []
+        finished, gpa_updates, gpa_inserts = [], [], []
+        if change_info.prevcourse_course_gpa is not None:
+            for course, gpa in zip(change_info.prevcourse_course_gpa.keys(), change_info.prevcourse_course_gpa.values()):
                 try:
-                    key = cities[change_info.clients_city.lower().strip()]
-                    to_change_clients += "CityID" + " = ?, "
-                    vals_clients.append(key)
+                    c_id = reference_data.courses[course]
+                    if c_id in enrolled:
+                        finished.append(c_id)
+                        enrolled.discard(c_id)
+
+                    if c_id in previous:
+                        gpa_updates.append((gpa, customer_id, c_id))
+                    else:
+                        gpa_inserts.append((c_id, customer_id, gpa))
+                        previous.add(c_id)
+                    to_change_prevcourse.append(course)
+                    vals_prevcourse.append(gpa) 
                 except KeyError:
-                    pass
-
-            if change_info.clients_name is not None:
-                to_change_clients += "Name" + " = ?, "
-                vals_clients.append(change_info.clients_name)
-
-            if change_info.clients_username is not None: 
-                usernames = [c[0] for c in eval(db.run("SELECT username from clients"))]
-                if ((change_info.clients_username not in usernames) and 
-                    (len(re.findall(re.compile("\w+"), change_info.clients_username)) != 0) and 
-                    (re.findall(re.compile("\w+"), change_info.clients_username)[0] == change_info.clients_username)):
-                    to_change_clients += "Username" + " = ?, "
-                    vals_clients.append(change_info.clients_username)
-
-            if (change_info.clients_dob is not None) and (re.findall(re.compile("\d{4}-\d{2}-\d{2}"), change_info.clients_dob.strip())):
-                to_change_clients += "DateOfBirth" + " = ?, "
-                vals_clients.append(change_info.clients_dob)
-
-            if (change_info.clients_password is not None) and ("'" not in change_info.clients_password) and (len(str(change_info.client_password))>=8):
-                to_change_clients += "Password" + " = ?, "
-                vals_clients.append(str(change_info.clients_password))
-
-            if change_info.clients_email is not None: 
-                emails = [c[0] for c in eval(db.run("SELECT Email from clients"))]
-                if ((change_info.clients_email not in emails) and 
-                    (len(re.findall(re.compile("[\w\.-]+@[\w\.-]+\.\w+"), change_info.clients_email)) != 0) and 
-                    (re.findall(re.compile("[\w\.-]+@[\w\.-]+\.\w+"), change_info.clients_email)[0] == change_info.clients_email)):
-                    to_change_clients += "Email" + " = ?, "
-                    vals_clients.append(change_info.clients_email)
-
-            if change_info.clients_phone is not None: 
-                phones = [c[0].replace("+", "") for c in eval(db.run("SELECT PhoneNumber from clients"))]
-                if ((change_info.clients_phone.replace("+", "") not in phones) and 
-                    (len(re.findall(re.compile("[+\d]\d+"), change_info.clients_phone)) != 0) and 
-                    (re.findall(re.compile("[+\d]\d+"), change_info.clients_phone)[0] == change_info.clients_phone)):
-                    to_change_clients += "PhoneNumber" + " = ?, "
-                    vals_clients.append(change_info.clients_phone)
-
-            if (change_info.clients_gender is not None) and (change_info.clients_gender.lower() in 
-                                                             ["male", "female", "non-ninary", "prefer not to say"]): 
-                to_change_clients += "Gender" + " = ?, "
-                gender_spelling = {a: b for (a, b) in zip(["male", "female", "non-ninary", "prefer not to say"], 
-                                                          ["Male", "Female", "Non-Binary", "Prefer Not To Say"])}
-                vals_clients.append(gender_spelling[change_info.clients_gender.lower()])
-
-            if (change_info.clients_time is not None) and (re.findall(re.compile("\d{2}-\d{2}"), 
-                                                                     change_info.clients_time)[0] == change_info.clients_time.strip()): 
-                to_change_clients += "PreferredTime" + " = ?, "
-                vals_clients.append(change_info.clients_time)
-
-            if change_info.clients_mins is not None:
-                to_change_clients += "MinPerDay" + " = ?, "
-                vals_clients.append(change_info.clients_mins)
-
-            if len(vals_clients) > 0:
-                cursor.execute( 
-                    f"UPDATE clients SET {to_change_clients[:-2]} WHERE UserID = ?",
-                    tuple(list(vals_clients)) + tuple([customer_id])
-                )
-                
-            # ------------------------------------------PREV_COURSES---------------------------------------------------------------------------
-            to_change_prevcourse = []
-            vals_prevcourse = []
-            if change_info.prevcourse_course_gpa is not None:
-                for course, gpa in zip(change_info.prevcourse_course_gpa.keys(), change_info.prevcourse_course_gpa.values()):
-                    try:
-                        c_id = {b.lower(): a for (a, b) in eval(db.run("select CourseID, Name from Course"))}[course.lower()]
-                        if c_id in [a[0] for a in eval(db.run(f"SELECT CourseID FROM user_courses WHERE UserID = {customer_id}"))]:
-                            cursor.execute(
-                                f"DELETE FROM user_courses WHERE CourseID = ? AND UserID = ?",
-                                (c_id, customer_id)
-                            )
-
-                        if c_id in [a[0] for a in eval(db.run(f"SELECT CourseID FROM previous_courses WHERE UserID = {customer_id}"))]:
-                            cursor.execute(
-                                f"UPDATE previous_courses SET GPA = ? WHERE UserID = ? AND CourseID = ?",
-                                (gpa, customer_id, c_id)
-                            )
-                        else:
-                            cursor.execute(
-                                f"INSERT INTO previous_courses (CourseID, UserID, GPA) VALUES (?, ?, ?)",
-                                (c_id, customer_id, gpa)
-                            )
-                        to_change_prevcourse.append(course)
-                        vals_prevcourse.append(gpa) 
-                    except KeyError:
-                        warnings.warn(f"The name of Course ({course}) is not recognised") 
+                    warnings.warn(f"The name of Course ({course}) is not recognised") 
+
+        if finished:
+            writes.append((f"DELETE FROM user_courses WHERE UserID = ? AND CourseID IN ({database.placeholders(finished)})",
+                           [(customer_id, *finished)]))
+        writes.append(("UPDATE previous_courses SET GPA = ? WHERE UserID = ? AND CourseID = ?", gpa_updates))
+        writes.append(("INSERT INTO previous_courses (CourseID, UserID, GPA) VALUES (?, ?, ?)", gpa_inserts))
+        
+        # --------------------------------------CURRENT_COURSES-----------------------------------------------------------------------------
+
+        vals_currcourse = [] 
+        new_courses = []
+        if change_info.currcourse_course is not None:
+            for course in change_info.currcourse_course:
+                try:
+                    c_id = reference_data.courses[course]
+                    if c_id in enrolled:
+                        warnings.warn(f"The user already enrolled in ({course})")
+                    else:
+                        new_courses.append((c_id, customer_id))
+                        enrolled.add(c_id)
+                        vals_currcourse.append(course)
+                except KeyError:
+                    warnings.warn(f"The name of Course ({course}) is not recognised") 
+        writes.append(("INSERT INTO user_courses (CourseID, UserID) VALUES (?, ?)", new_courses))
             
-            # --------------------------------------CURRENT_COURSES-----------------------------------------------------------------------------
-
-            vals_currcourse = [] 
-            if change_info.currcourse_course is not None:
-                for course in change_info.currcourse_course:
-                    try:
-                        c_id = {b.lower(): a for (a, b) in eval(db.run("select CourseID, Name from Course"))}[course.lower()]
-                        if c_id in [a[0] for a in eval(db.run(f"SELECT CourseID FROM user_courses WHERE UserID = {customer_id}"))]:
-                            warnings.warn(f"The user already enrolled in ({course})")
-                        else:
-                            cursor.execute(
-                                f"INSERT INTO user_courses (CourseID, UserID) VALUES (?, ?)",
-                                (c_id, customer_id)
-                            )
-                            vals_currcourse.append(course)
-                    except KeyError:
-                        warnings.warn(f"The name of Course ({course}) is not recognised") 
-                
-            if len(vals_currcourse) == 0:
-                to_change_currcourse = []
-            else:
-                to_change_currcourse = ["new course"]*len(vals_currcourse)
-            #-----------------------------------------------------------LEARNING_STYLE----------------------------------------------------------
-            vals_styles = []
-            if change_info.styles_style is not None:
-                for style in change_info.styles_style:
-                    try:
-                        s_id = {a[1].lower(): a[0] for a in eval(db.run("SELECT LearningID, Name FROM learning_style "))}[style.lower()]
-                        if s_id in [a[0] for a in eval(db.run(f"SELECT LearningID FROM user_learning_style WHERE UserID = {customer_id}"))]:
-                            pass # letting this slide because it's not too significant
-                        else:
-                            cursor.execute(
-                                f"INSERT INTO user_learning_style (LearningID, UserID) VALUES (?, ?)",
-                                (s_id, customer_id)
-                            )
-                            vals_styles.append(style)
-                    except KeyError:
-                        warnings.warn(f"The name of learning style ({style}) is not recognised") 
-                
-            if len(vals_styles) == 0:
-                to_change_styles = []
-            else:
-                to_change_styles = ["new learning style"]*len(vals_styles)
-            #-------------------------------------------------------LANGUAGE---------------------------------------------------------------------
-            vals_language = []
-            if change_info.language_languages is not None:
-                for l in change_info.language_languages:
-                    try:
-                        l_id = {a[1].lower(): a[0] for a in eval(db.run("SELECT LanguageID, Language FROM languages"))}[l]
-                        if l_id in [a[0] for a in eval(db.run(f"SELECT LanguageID FROM user_language WHERE UserID = {customer_id}"))]:
-                            pass
-                        else:
-                            cursor.execute(
-                                f"INSERT INTO user_language (UserID, LanguageID, PrimaryLanguage) VALUES (?, ?, 0)",
-                                (customer_id, l_id)
-                            )
-                            vals_language.append(l)
-                    except KeyError:
-                        warnings.warn(f"Language {l} was not recognised")  
-                    
-            if len(vals_language) == 0:
-                to_change_language = []
-            else:
-                to_change_language = ["new language"] * len(vals_language)
-
-            if change_info.language_default is not None:
-                l = change_info.language_default.lower()
+        if len(vals_currcourse) == 0:
+            to_change_currcourse = []
+        else:
+            to_change_currcourse = ["new course"]*len(vals_currcourse)
+        #-----------------------------------------------------------LEARNING_STYLE----------------------------------------------------------
+        vals_styles = []
+        new_styles = []
+        if change_info.styles_style is not None:
+            styles = set(database.fetch_column("SELECT LearningID FROM user_learning_style WHERE UserID = ?", (customer_id,)))
+            for style in change_info.styles_style:
                 try:
-                    l_id = {a[1].lower(): a[0] for a in eval(db.run("SELECT LanguageID, Language FROM languages"))}[l]
-                    if l_id in [a[0] for a in eval(db.run(f"SELECT LanguageID FROM user_language WHERE UserID = {customer_id}"))]:
-                        cursor.execute(
-                            f"UPDATE user_language SET PrimaryLanguage = 0 WHERE UserID = ? AND PrimaryLanguage = 1",
-                            (customer_id)
-                        )
-                        cursor.execute(
-                                f"UPDATE user_language SET PrimaryLanguage = 1 WHERE UserID = ? AND LanguageID = ?",
-                                (customer_id, l_id)
-                            )
+                    s_id = reference_data.learning_styles[style]
+                    if s_id in styles:
+                        pass # letting this slide because it's not too significant
                     else:
-                        cursor.execute(
-                            f"UPDATE user_language SET PrimaryLanguage = 0 WHERE UserID = ? AND PrimaryLanguage = 1",
-                            (customer_id)
-                        )
-                        cursor.execute(
-                                f"INSERT INTO user_language (UserID, LanguageID, PrimaryLanguage) VALUES (?, ?, 1)",
-                                (customer_id, l_id)
-                            )
-                    vals_language.append(l)
-                    to_change_language.append("new primary language")
+                        new_styles.append((s_id, customer_id))
+                        styles.add(s_id)
+                        vals_styles.append(style)
                 except KeyError:
-                        warnings.warn(f"Language {l} was not recognised")
+                    warnings.warn(f"The name of learning style ({style}) is not recognised") 
+        writes.append(("INSERT INTO user_learning_style (LearningID, UserID) VALUES (?, ?)", new_styles))
+            
+        if len(vals_styles) == 0:
+            to_change_styles = []
+        else:
+            to_change_styles = ["new learning style"]*len(vals_styles)
+        #-------------------------------------------------------LANGUAGE---------------------------------------------------------------------
+        vals_language = []
+        new_languages = []
+        spoken = set(database.fetch_column("SELECT LanguageID FROM user_language WHERE UserID = ?", (customer_id,)))
+        if change_info.language_languages is not None:
+            for l in change_info.language_languages:
+                try:
+                    l_id = reference_data.languages[l]
+                    if l_id in spoken:
+                        pass
+                    else:
+                        new_languages.append((customer_id, l_id))
+                        spoken.add(l_id)
+                        vals_language.append(l)
+                except KeyError:
+                    warnings.warn(f"Language {l} was not recognised")  
+        writes.append(("INSERT INTO user_language (UserID, LanguageID, PrimaryLanguage) VALUES (?, ?, 0)", new_languages))
                 
-            connection.commit()
-
-            to_change = (to_change_clients.split(" = ?, ") + 
-                     to_change_prevcourse + 
-                     to_change_currcourse + 
-                     to_change_styles +
-                     to_change_language)
-        
-            if to_change[0] == "":
-                to_change = to_change[1:]
-
-            vals = (vals_clients + 
-                    vals_prevcourse + 
-                    vals_currcourse + 
-                    vals_styles + 
-                    vals_language)
-        except sqlite3.OperationalError as e:
-            print(f"Error: {e}") 
-            to_change = ["##UNKNOWN##"]
-            vals = ["##UNKNOWN##"]
-        finally:
-            cursor.close()
-            connection.close()
-
-        return f"Succesfully updated following data:\n{[(i, j) for i, j in zip(to_change, vals)]}"
+        if len(vals_language) == 0:
+            to_change_language = []
+        else:
+            to_change_language = ["new language"] * len(vals_language)
+
+        if change_info.language_default is not None:
+            l = change_info.language_default.lower()
+            try:
+                l_id = reference_data.languages[l]
+                writes.append(("UPDATE user_language SET PrimaryLanguage = 0 WHERE UserID = ? AND PrimaryLanguage = 1",
+                               [(customer_id,)]))
+                if l_id in spoken:
+                    writes.append(("UPDATE user_language SET PrimaryLanguage = 1 WHERE UserID = ? AND LanguageID = ?",
+                                   [(customer_id, l_id)]))
+                else:
+                    writes.append(("INSERT INTO user_language (UserID, LanguageID, PrimaryLanguage) VALUES (?, ?, 1)",
+                                   [(customer_id, l_id)]))
+                vals_language.append(l)
+                to_change_language.append("new primary language")
+            except KeyError:
+                    warnings.warn(f"Language {l} was not recognised")
+
+        with database.transaction() as cursor:
+            for sql, rows in writes:
+                if rows:
+                    cursor.executemany(sql, rows)
+        profile_cache.invalidate(customer_id)
+
+        to_change = (to_change_clients.split(" = ?, ") + 
+                 to_change_prevcourse + 
+                 to_change_currcourse + 
+                 to_change_styles +
+                 to_change_language)
+    
+        if to_change[0] == "":
+            to_change = to_change[1:]
+
+        vals = (vals_clients + 
+                vals_prevcourse + 
+                vals_currcourse + 
+                vals_styles + 
+                vals_language)
+    except sqlite3.OperationalError as e:
+        print(f"Error: {e}") 
+        to_change = ["##UNKNOWN##"]
+        vals = ["##UNKNOWN##"]
+
+    return f"Succesfully updated following data:\n{[(i, j) for i, j in zip(to_change, vals)]}"
     
 ################################################READ DATA#########################################
 
@@ -451,76 +421,75 @@ class ReadCustomerInfoTool(BaseTool):
             customer_input: str,
     ) -> str:
         total_text = ""
-        llm = ChatOpenAI(model="gpt-4o-mini")
-        change_info = ReadUserInfoChain(llm).invoke({"customer_input": customer_input})
+        change_info = get_chain(ReadUserInfoChain).invoke({"customer_input": customer_input})
+
+        client = database.get_client(customer_id)
 
-        db_path = "files/aurora.db"
-        db = SQLDatabase.from_uri(f"sqlite:///{db_path}")
-        
         if change_info.clients_city:
             total_text += "City: "
-            total_text += ", ".join(eval(db.run(f"SELECT CityName, Country FROM city c JOIN clients cs ON c.CityID = cs.CityID WHERE cs.UserID = {customer_id}"))[0])
+            total_text += ", ".join(database.fetch_one("""SELECT CityName, Country
+                                                          FROM city c
+                                                          JOIN clients cs ON c.CityID = cs.CityID
+                                                          WHERE cs.UserID = ?""", (customer_id,)))
             total_text += "\n"
 
         if change_info.clients_streak:
             total_text += "Streak: "
-            total_text += str(eval(db.run(f"SELECT Streak FROM clients WHERE UserID = {customer_id}"))[0][0])
+            total_text += str(client.streak)
             total_text += "\n"
 
         if change_info.clients_name:
             total_text += "Name: "
-            total_text += eval(db.run(f"SELECT Name FROM clients WHERE UserID = {customer_id}"))[0][0]
+            total_text += client.name
             total_text += "\n"
 
         if change_info.clients_username:
             total_text += "UserName: "
-            total_text += str(eval(db.run(f"SELECT Username FROM clients WHERE UserID = {customer_id}"))[0][0])
+            total_text += str(client.username)
             total_text += "\n"
 
         if change_info.clients_dob:
             total_text += "Date of birth: "
-            total_text += eval(db.run(f"SELECT DateOfBirth FROM clients WHERE UserID = {customer_id}"))[0][0]
+            total_text += client.date_of_birth
             total_text += "\n"
 
         if change_info.clients_password:
             total_text += "password: "
-            total_text += str(eval(db.run(f"SELECT Password FROM clients WHERE UserID = {customer_id}"))[0][0])
+            total_text += str(client.password)
             total_text += "\n"
 
         if change_info.clients_email:
             total_text += "email: "
-            total_text += eval(db.run(f"SELECT Email FROM clients WHERE UserID = {customer_id}"))[0][0]
+            total_text += client.email
             total_text += "\n"
 
         if change_info.clients_phone:
             total_text += "phone: "
-            total_text += str(eval(db.run(f"SELECT PhoneNumber FROM clients WHERE UserID = {customer_id}"))[0][0])
+            total_text += str(client.phone_number)
             total_text += "\n"
 
         if change_info.clients_gender:
             total_text += "Gender: "
-            total_text += eval(db.run(f"SELECT Gender FROM clients WHERE UserID = {customer_id}"))[0][0]
+            total_text += client.gender
             total_text += "\n"
 
         if change_info.clients_time:
             total_text += "Preffered study time: "
-            total_text += eval(db.run(f"SELECT PreferredTime FROM clients WHERE UserID = {customer_id}"))[0][0]
+            total_text += client.preferred_time
             total_text += "\n"
 
         if change_info.clients_mins:
             total_text += "Minutes per day: "
-            total_text += str(eval(db.run(f"SELECT MinPerDay FROM clients WHERE UserID = {customer_id}"))[0][0])
+            total_text += str(client.min_per_day)
             total_text += "\n"   
 
         if change_info.prevcourse_course_gpa:
             total_text += "Previous Courses Information: "
-            for pair in eval(db.run(f"""SELECT co.Name, p.GPA 
-                                        FROM course co 
-                                        JOIN previous_courses p 
-                                        ON co.CourseID = p.CourseID 
-                                        JOIN clients c 
-                                        ON p.UserID = c.UserID 
-                                        WHERE c.UserID = {customer_id}""")):
+            for pair in database.fetch_all("""SELECT co.Name, p.GPA 
+                                              FROM course co 
+                                              JOIN previous_courses p 
+                                              ON co.CourseID = p.CourseID 
+                                              WHERE p.UserID = ?""", (customer_id,)):
                 total_text += ": ".join((pair[0], str(pair[1])))
                 total_text += "; "
             total_text += "\n"
@@ -528,52 +497,41 @@ class ReadCustomerInfoTool(BaseTool):
 
         if change_info.currcourse_course:
             total_text += "Current Courses Information: "
-            cs = eval(db.run(f"""SELECT co.Name 
-                                 FROM course co 
-                                 JOIN user_courses p 
-                                 ON co.CourseID = p.CourseID 
-                                 JOIN clients c 
-                                 ON p.UserID = c.UserID 
-                                 WHERE c.UserID = {customer_id}"""))
-            cs = [a[0] for a in cs]
+            cs = database.fetch_column("""SELECT co.Name 
+                                          FROM course co 
+                                          JOIN user_courses p 
+                                          ON co.CourseID = p.CourseID 
+                                          WHERE p.UserID = ?""", (customer_id,))
             total_text += ", ".join(cs)
             total_text += "\n"   
 
         if change_info.styles_style:
             total_text += "Styles Information: "
-            cs = eval(db.run(f"""SELECT co.Name 
-                                 FROM learning_style  co 
-                                 JOIN user_learning_style  p 
-                                 ON co.LearningID = p.LearningID 
-                                 JOIN clients c 
-                                 ON p.UserID = c.UserID 
-                                 WHERE c.UserID = {customer_id}"""))
-            cs = [a[0] for a in cs]
+            cs = database.fetch_column("""SELECT co.Name 
+                                          FROM learning_style co 
+                                          JOIN user_learning_style p 
+                                          ON co.LearningID = p.LearningID 
+                                          WHERE p.UserID = ?""", (customer_id,))
             total_text += ", ".join(cs)
             total_text += "\n"      
 
         if change_info.language_languages:
             total_text += "Languages Information: "
-            cs = eval(db.run(f"""SELECT co.language 
-                                 FROM languages  co 
-                                 JOIN user_language  p 
-                                 ON co.LanguageID = p.LanguageID 
-                                 JOIN clients c 
-                                 ON p.UserID = c.UserID 
-                                 WHERE c.UserID = {customer_id}"""))
-            cs = [a[0] for a in cs]
+            cs = database.fetch_column("""SELECT co.Language 
+                                          FROM languages co 
+                                          JOIN user_language p 
+                                          ON co.LanguageID = p.LanguageID 
+                                          WHERE p.UserID = ?""", (customer_id,))
             total_text += ", ".join(cs)
             total_text += "\n"         
 
         if change_info.language_default:
             total_text += "Primary Language: "   
-            cs = eval(db.run(f"""SELECT co.language 
-                                 FROM languages  co 
-                                 JOIN user_language  p 
-                                 ON co.LanguageID = p.LanguageID 
-                                 JOIN clients c 
-                                 ON p.UserID = c.UserID 
-                                 WHERE c.UserID = {customer_id} and p.PrimaryLanguage=1"""))[0][0]
+            cs = database.fetch_value("""SELECT co.Language 
+                                         FROM languages co 
+                                         JOIN user_language p 
+                                         ON co.LanguageID = p.LanguageID 
+                                         WHERE p.UserID = ? AND p.PrimaryLanguage = 1""", (customer_id,))
             total_text += cs
             total_text += "\n"   
 
@@ -639,71 +597,75 @@ class DeleteCustomerInfoTool(BaseTool):
             customer_id: int,
             customer_input: str,
     ) -> str:
-        total_text = ""
-        llm = ChatOpenAI(model="gpt-4o-mini")
-        change_info = DeleteUserInfoChain(llm).invoke({"customer_input": customer_input})
-
-        db_path = "files/aurora.db"
-        db = SQLDatabase.from_uri(f"sqlite:///{db_path}")
+        change_info = get_chain(DeleteUserInfoChain).invoke({"customer_input": customer_input})
+        return apply_user_delete(customer_id, change_info)
 
-        connection = sqlite3.connect(db_path)
-        cursor = connection.cursor()
 
-        deleted_info = ""
-        if change_info.languages is not None:
-            for lan in change_info.languages:
-                try:
-                    l_id = {a[1].lower(): a[0] for a in eval(db.run("SELECT LanguageID, Language FROM languages"))}[lan]
-                    if not(eval(db.run(f"""SELECT PrimaryLanguage 
-                                       FROM user_language 
-                                       WHERE LanguageID = {l_id} AND UserID = {customer_id}"""))[0][0] == 1):
-                        cursor.execute(
-                            "DELETE FROM user_language WHERE UserID = ? and LanguageID = ?",
-                            (customer_id, l_id)
-                        )
-                        deleted_info += f"Language: {lan}; "
-                    else:
-                        warnings.warn(f"Cannot delete primary language")
-                except KeyError:
-                    warnings.warn(f"Language {lan} was not recognised")
+def apply_user_delete(customer_id, change_info):
+    """
+    Delete the items parsed from the user input from the user's profile.
 
-        if change_info.styles is not None:
-            for st in change_info.styles:
-                try:
-                    st_id = {a[1].lower(): a[0] for a in eval(db.run("SELECT LearningID, Name FROM languages"))}[st]
-                    cursor.execute(
-                        "DELETE FROM user_language WHERE UserID = ? and LearningID = ?",
-                        (customer_id, st_id)
-                    )
-                    deleted_info += f"Learning style: {st}; "
-                except KeyError:
-                    warnings.warn(f"Learning style {st} was not recognised")
+    The ids of every table are collected first and removed with one set-based `DELETE ... IN (...)`
+    per table, all in a single transaction.
 
-        if change_info.curr_courses is not None:
-            for cc in change_info.curr_courses:
-                try:
-                    cc_id = {a[1].lower(): a[0] for a in eval(db.run("SELECT CourseID, Name FROM course"))}[cc]
-                    cursor.execute(
-                        "DELETE FROM user_courses WHERE UserID = ? and CourseID = ?",
-                        (customer_id, cc_id)
-                    )
-                    deleted_info += f"Current course information: {cc}; "
-                except KeyError:
-                    warnings.warn(f"Course {cc} was not recognised")
+    Parameters:
+    customer_id (int): The ID of the user.
+    change_info (UserDelete): The items identified in the user input.
 
-        if change_info.prev_courses is not None:
-            for pc in change_info.prev_courses:
-                try:
-                    pc_id = {a[1].lower(): a[0] for a in eval(db.run("SELECT CourseID, Name FROM course"))}[pc]
-                    cursor.execute(
-                        "DELETE FROM previous_courses WHERE UserID = ? and CourseID = ?",
-                        (customer_id, pc_id)
-                    )
-                    deleted_info += f"Previous course information: {pc}; "
-                except KeyError:
-                    warnings.warn(f"Course {pc} was not recognised")
-        
-        return "Succesfully deleted the following information:\n" + deleted_info
+    Returns:
+    str: The summary of the deleted data.
+    """
+    deleted_info = ""
+    to_delete = {"user_language": ("LanguageID", []),
+                 "user_learning_style": ("LearningID", []),
+                 "user_courses": ("CourseID", []),
+                 "previous_courses": ("CourseID", [])}
+
+    if change_info.languages is not None:
+        primary = database.fetch_value("SELECT LanguageID FROM user_language WHERE UserID = ? AND PrimaryLanguage = 1",
+                                       (customer_id,))
+        for lan in change_info.languages:
+            try:
+                l_id = reference_data.languages[lan]
+                if l_id != primary:
+                    to_delete["user_language"][1].append(l_id)
+                    deleted_info += f"Language: {lan}; "
+                else:
+                    warnings.warn(f"Cannot delete primary language")
+            except KeyError:
+                warnings.warn(f"Language {lan} was not recognised")
+
+    if change_info.styles is not None:
+        for st in change_info.styles:
+            try:
+                to_delete["user_learning_style"][1].append(reference_data.learning_styles[st])
+                deleted_info += f"Learning style: {st}; "
+            except KeyError:
+                warnings.warn(f"Learning style {st} was not recognised")
+
+    if change_info.curr_courses is not None:
+        for cc in change_info.curr_courses:
+            try:
+                to_delete["user_courses"][1].append(reference_data.courses[cc])
+                deleted_info += f"Current course information: {cc}; "
+            except KeyError:
+                warnings.warn(f"Course {cc} was not recognised")
+
+    if change_info.prev_courses is not None:
+        for pc in change_info.prev_courses:
+            try:
+                to_delete["previous_courses"][1].append(reference_data.courses[pc])
+                deleted_info += f"Previous course information: {pc}; "
+            except KeyError:
+                warnings.warn(f"Course {pc} was not recognised")
+
+    with database.transaction() as cursor:
+        for table, (column, ids) in to_delete.items():
+            if ids:
+                cursor.execute(f"DELETE FROM {table} WHERE UserID = ? AND {column} IN ({database.placeholders(ids)})",
+                               (customer_id, *ids))
+    profile_cache.invalidate(customer_id)
+    return "Succesfully deleted the following information:\n" + deleted_info
     
 
 ################################################AGENT######################################
@@ -734,8 +696,9 @@ prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-llm = ChatOpenAI(model="gpt-4o-mini")
-tools = [ChangeCustomerInfoTool(), ReadCustomerInfoTool(), DeleteCustomerInfoTool()]
+def build_agent_executor():
+    """Build the user info agent (called once, through the registry as "userinfo_agent")."""
+    tools = [ChangeCustomerInfoTool(), ReadCustomerInfoTool(), DeleteCustomerInfoTool()]
 
-agent = create_tool_calling_agent(llm, tools, prompt)
-agent_executor = AgentExecutor(agent=agent, tools=tools)
\ No newline at end of file
+    agent = create_tool_calling_agent(registry.get("chat_llm"), tools, prompt)
+    return AgentExecutor(agent=agent, tools=tools)
@@ -0,0 +1,68 @@
+import sys
+sys.dont_write_bytecode = True
+
+from pydantic import BaseModel, Field
+from langchain.prompts import (
+    ChatPromptTemplate,
+    SystemMessagePromptTemplate,
+    HumanMessagePromptTemplate,
+)
+from resources import registry
+
+
+# ----------------------------------------------------PROMPTS---------------------------------------------------------------------- #
+class PromptTemplate(BaseModel):
+    """Defines templates for system and human messages used in a conversation."""
+
+    system_template: str = Field(
+        description="Template for the system message in the conversation"
+    )
+    human_template: str = Field(
+        description="Template for the human message in the conversation"
+    )
+
+
+def generate_prompt_templates(
+    prompt_template: PromptTemplate
+) -> ChatPromptTemplate:
+    """Generate a chat prompt template based on given templates and memory setting.
+
+    Args:
+        prompt_template: An instance of PromptTemplate containing system and human templates.
+
+    Returns:
+        A configured ChatPromptTemplate with specified message structure.
+    """
+
+    # Create prompt template without chat history
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            SystemMessagePromptTemplate.from_template(
+                prompt_template.system_template
+            ),
+            HumanMessagePromptTemplate.from_template(
+                prompt_template.human_template
+            ),
+        ]
+    )
+
+    return prompt
+
+
+# ----------------------------------------------------CHAINS---------------------------------------------------------------------- #
+def get_chain(chain_cls):
+    """
+    Return the shared instance of a tool chain, building it on first use.
+
+    A chain compiles its prompt, creates its output parser and renders the format instructions
+    when it is built. Tools call this instead of `chain_cls(ChatOpenAI(...))`, so that work is done
+    once per process and every call reuses the shared chat model and its pooled HTTP client.
+
+    Parameters:
+    chain_cls (type): The chain class, built as `chain_cls(llm)`.
+
+    Returns:
+    Runnable: The shared instance of the chain.
+    """
+    return registry.get_or_register(f"chain:{chain_cls.__module__}.{chain_cls.__qualname__}",
+                                    lambda: chain_cls(registry.get("chat_llm")))
@@ -0,0 +1,62 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+# Building clients and chains does not call the API, but the clients refuse to start without a key
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+# ----------------------------------------------------BENCHMARK-------------------------------------------------------------------------- #
+CHAINS = [
+    ("agents.agent_userinfo", "GetChangeableUserInfoChain"),
+    ("agents.agent_userinfo", "ReadUserInfoChain"),
+    ("agents.agent_userinfo", "DeleteUserInfoChain"),
+    ("agents.agent_resource", "UserReadCourseInfoChain"),
+    ("agents.agent_resource", "EmailChain"),
+    ("agents.agent_quizz", "QuizzChain"),
+    ("agents.agent_quizz", "AnswerChain"),
+]
+
+
+def time_calls(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e3
+
+
+def measure(repeats):
+    """
+    Per-call setup cost of the tool chains: a fresh client and chain on every call (as the tools did)
+    against the shared chain returned by `get_chain`.
+    """
+    import importlib
+    from langchain_openai import ChatOpenAI
+    from agents.common import get_chain
+
+    report = {"repeats": repeats, "chains": {}}
+    for module_name, class_name in CHAINS:
+        chain_cls = getattr(importlib.import_module(module_name), class_name)
+        fresh = time_calls(lambda: chain_cls(ChatOpenAI(model="gpt-4o-mini")), repeats)
+        get_chain(chain_cls)
+        shared = time_calls(lambda: get_chain(chain_cls), repeats)
+        report["chains"][class_name] = {"fresh_ms": fresh, "shared_ms": shared}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Setup cost of the LLM client and chain of every tool call.")
+    parser.add_argument("--repeats", type=int, default=50, help="Number of setups timed per chain")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    print(json.dumps(measure(args.repeats), indent=2))
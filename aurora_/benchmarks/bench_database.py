@@ -0,0 +1,93 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import database
+
+# ----------------------------------------------------QUERIES-------------------------------------------------------------------------- #
+QUERIES = {
+    "client_field": ("SELECT Email FROM clients WHERE UserID = ?", lambda user_id: (user_id,)),
+    "user_courses": ("""SELECT cs.Name, t.Name
+                        FROM user_courses u
+                        JOIN course cs ON u.CourseID = cs.CourseID
+                        JOIN course_topic ct ON cs.CourseID = ct.CourseID
+                        JOIN topic t ON ct.TopicID = t.TopicID
+                        WHERE u.UserID = ?""", lambda user_id: (user_id,)),
+    "lookup_table": ("SELECT CourseID, Name FROM course", lambda user_id: ()),
+}
+
+
+# ----------------------------------------------------LEGACY-------------------------------------------------------------------------- #
+def legacy_runner(db_path):
+    """
+    Return a function running a query the way the code did before: through `SQLDatabase.run`,
+    with the values pasted in the SQL string and the stringified rows parsed back with `eval`.
+
+    Without LangChain installed, the same round trip (a fresh connection per call, `str` of the
+    rows, `eval`) is reproduced with `sqlite3`, which is a lower bound of the real cost.
+    """
+    try:
+        from langchain_community.utilities.sql_database import SQLDatabase
+        db = SQLDatabase.from_uri(f"sqlite:///{db_path}")
+
+        def run(sql):
+            result = db.run(sql)
+            return eval(result) if result else []
+        return run, "SQLDatabase.run"
+    except ImportError:
+        def run(sql):
+            connection = sqlite3.connect(db_path)
+            try:
+                result = str(connection.execute(sql).fetchall())
+            finally:
+                connection.close()
+            return eval(result)
+        return run, "sqlite3 (str + eval emulation)"
+
+
+def inline(sql, params):
+    """Paste the parameters in the SQL, as the f-strings did."""
+    for value in params:
+        sql = sql.replace("?", repr(value), 1)
+    return sql
+
+
+# ----------------------------------------------------BENCHMARK-------------------------------------------------------------------------- #
+def time_calls(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"median_us": statistics.median(times) * 1e6, "p95_us": sorted(times)[int(0.95 * (len(times) - 1))] * 1e6}
+
+
+def measure(db_path, repeats):
+    legacy, legacy_name = legacy_runner(db_path)
+    user_id = database.fetch_value("SELECT MIN(UserID) FROM clients", db_path=db_path)
+    report = {"legacy": legacy_name, "repeats": repeats, "queries": {}}
+
+    for name, (sql, make_params) in QUERIES.items():
+        params = make_params(user_id)
+        old = time_calls(lambda: legacy(inline(sql, params)), repeats)
+        new = time_calls(lambda: database.fetch_all(sql, params, db_path=db_path), repeats)
+        report["queries"][name] = {"legacy": old, "database": new,
+                                   "speedup": old["median_us"] / max(new["median_us"], 1e-9)}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Legacy stringify-then-eval queries vs the `database` layer.")
+    parser.add_argument("--db", default=database.DB_PATH, help="Path to the SQLite database")
+    parser.add_argument("--repeats", type=int, default=500, help="Number of calls timed per query")
+    args = parser.parse_args()
+
+    os.chdir(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    print(json.dumps(measure(args.db, args.repeats), indent=2))
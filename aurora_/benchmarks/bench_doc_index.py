@@ -0,0 +1,95 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sentence_transformers import SentenceTransformer, util
+from doc_index import DocumentIndex
+
+# ----------------------------------------------------SETUP-------------------------------------------------------------------------- #
+WORDS = ("cell membrane protein enzyme energy photosynthesis genome evolution species tissue "
+         "text mining corpus token sentiment classifier vector embedding regression model "
+         "market price demand supply contract law court evidence music copyright metadata").split()
+
+
+class MemoryTextStore:
+    """Stand-in for `PdfTextStore` serving synthetic documents from memory."""
+
+    def __init__(self, texts):
+        self.texts = texts
+
+    def digest(self, path):
+        return hashlib.sha256(self.texts[path].encode("utf-8")).hexdigest()
+
+    def get_text(self, path):
+        return self.texts[path]
+
+
+def make_documents(n_docs, n_words, seed=0):
+    """Generate `n_docs` synthetic documents of `n_words` random words each."""
+    rng = random.Random(seed)
+    return {f"doc_{i}.pdf": " ".join(rng.choice(WORDS) for _ in range(n_words)) for i in range(n_docs)}
+
+
+# ----------------------------------------------------BENCHMARK-------------------------------------------------------------------------- #
+def legacy_turn(model, query, texts):
+    """The previous per-turn loop: encode the query and every document, one pair at a time."""
+    best, best_score = None, 0
+    for path, text in texts.items():
+        query_embedding = model.encode(query, convert_to_tensor=True)
+        pdf_embedding = model.encode(text, convert_to_tensor=True)
+        score = util.pytorch_cos_sim(query_embedding, pdf_embedding).item()
+        if score > best_score:
+            best, best_score = path, score
+    return best
+
+
+def run(sizes, n_words, turns, legacy_max, mode, aggregate):
+    model = SentenceTransformer('all-MiniLM-L6-v2')
+    encode = lambda texts: model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    queries = ["Create a quiz about " + " ".join(random.Random(t).sample(WORDS, 3)) for t in range(turns)]
+
+    print(f"{'docs':>6} | {'legacy ms/turn':>15} | {'index ms/turn':>14} | {'index build s':>13}")
+    for n_docs in sizes:
+        texts = make_documents(n_docs, n_words)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            index = DocumentIndex(tmp, encode, MemoryTextStore(texts), mode=mode, aggregate=aggregate)
+            t0 = time.perf_counter()
+            index.sync(list(texts))
+            build = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            for query in queries:
+                index.sync(list(texts))
+                index.most_relevant(query)
+            indexed = (time.perf_counter() - t0) / turns * 1000
+
+        if n_docs <= legacy_max:
+            t0 = time.perf_counter()
+            for query in queries:
+                legacy_turn(model, query, texts)
+            legacy = f"{(time.perf_counter() - t0) / turns * 1000:15.1f}"
+        else:
+            legacy = f"{'skipped':>15}"
+
+        print(f"{n_docs:>6} | {legacy} | {indexed:14.1f} | {build:13.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-turn latency of relevant-PDF selection: legacy loop vs embedding index.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="Number of documents to test")
+    parser.add_argument("--words", type=int, default=2000, help="Words per synthetic document")
+    parser.add_argument("--turns", type=int, default=5, help="Turns (queries) averaged per size")
+    parser.add_argument("--legacy-max", type=int, default=1000, help="Skip the legacy loop above this many documents")
+    parser.add_argument("--mode", choices=["document", "chunk"], default="chunk", help="Index scoring mode")
+    parser.add_argument("--aggregate", choices=["max", "mean"], default="mean", help="Chunk score aggregate")
+    args = parser.parse_args()
+    run(args.sizes, args.words, args.turns, args.legacy_max, args.mode, args.aggregate)
@@ -0,0 +1,79 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import os
+import re
+import time
+from collections import Counter
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from pdf_extract import LAYOUT_BACKEND, PAGE_READERS, iter_pages
+
+# ----------------------------------------------------AGREEMENT-------------------------------------------------------------------------- #
+def words(text):
+    return Counter(re.findall(r"\w+", text.lower()))
+
+
+def agreement(text, reference):
+    """F1 of the words of a text against the words of the reference text (1.0 when both are empty)."""
+    a, b = words(text), words(reference)
+    if not a and not b:
+        return 1.0
+    common = sum((a & b).values())
+    if not common:
+        return 0.0
+    precision, recall = common / sum(a.values()), common / sum(b.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+# ----------------------------------------------------BENCHMARK-------------------------------------------------------------------------- #
+def read_all(paths, backend):
+    """Extract every file serially; returns the texts, the page count and the seconds it took."""
+    start = time.perf_counter()
+    texts, pages = {}, 0
+    for path in paths:
+        records = list(iter_pages(path, backend))
+        texts[path] = "".join(record.text for record in records)
+        pages += len(records)
+    return texts, pages, time.perf_counter() - start
+
+
+def read_previews(paths, backend):
+    """Extract the first page of every file; returns the seconds per file."""
+    start = time.perf_counter()
+    for path in paths:
+        list(iter_pages(path, backend, [0]))
+    return (time.perf_counter() - start) / max(len(paths), 1)
+
+
+def run(pdf_dirs, backends, reference):
+    print(f"Agreement: word F1 against {reference}\n")
+    print(f"{'folder':>14} | {'backend':>10} | {'files':>5} | {'pages':>6} | {'pages/s':>8} | {'preview ms':>10} | {'agreement':>9}")
+    for pdf_dir in pdf_dirs:
+        paths = [os.path.join(pdf_dir, f) for f in sorted(os.listdir(pdf_dir)) if f.endswith(".pdf")]
+        if not paths:
+            print(f"{os.path.basename(pdf_dir):>14} | no PDF")
+            continue
+        reference_texts = read_all(paths, reference)[0]
+        for backend in backends:
+            texts, pages, elapsed = read_all(paths, backend)
+            preview_ms = read_previews(paths, backend) * 1000
+            score = sum(agreement(texts[p], reference_texts[p]) for p in paths) / len(paths)
+            print(f"{os.path.basename(pdf_dir):>14} | {backend:>10} | {len(paths):>5} | {pages:>6} | "
+                  f"{pages / elapsed:8.1f} | {preview_ms:10.1f} | {score:9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF extraction backends: pages per second and text agreement.")
+    parser.add_argument("--pdf-dirs", nargs="+",
+                        default=[os.path.join(ROOT, "files", "user_files"), os.path.join(ROOT, "files", "pinecone_pdfs")],
+                        help="Folders of the PDFs")
+    parser.add_argument("--backends", nargs="+", choices=sorted(PAGE_READERS), default=sorted(PAGE_READERS),
+                        help="Extraction backends to test")
+    parser.add_argument("--reference", choices=sorted(PAGE_READERS), default=LAYOUT_BACKEND,
+                        help="Backend whose text the others are compared to")
+    args = parser.parse_args()
+    run(args.pdf_dirs, args.backends, args.reference)
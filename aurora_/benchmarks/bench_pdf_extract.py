@@ -0,0 +1,50 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import os
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from pdf_extract import PAGE_READERS, extract_pages, make_pool, read_pages
+
+# ----------------------------------------------------BENCHMARK-------------------------------------------------------------------------- #
+def serial(paths, backend):
+    """The previous approach: every file read page by page in this process."""
+    return sum(len(read_pages(backend, path, 0, sys.maxsize)) for path in paths)
+
+
+def parallel(paths, backend, workers, pages_per_task):
+    """Files and page ranges fanned out over a process pool (its start-up included)."""
+    pool = make_pool(max_workers=workers)
+    try:
+        return sum(1 for _ in extract_pages(paths, backend, pool, pages_per_task))
+    finally:
+        pool.shutdown()
+
+
+def run(pdf_dir, backends, workers_list, pages_per_task):
+    paths = [os.path.join(pdf_dir, f) for f in sorted(os.listdir(pdf_dir)) if f.endswith(".pdf")]
+    print(f"{len(paths)} PDFs in {pdf_dir}\n")
+    print(f"{'backend':>10} | {'mode':>12} | {'pages':>6} | {'seconds':>8} | {'pages/s':>8}")
+    for backend in backends:
+        runs = [("serial", lambda: serial(paths, backend))]
+        runs += [(f"{w} workers", lambda w=w: parallel(paths, backend, w, pages_per_task)) for w in workers_list]
+        for mode, fn in runs:
+            start = time.perf_counter()
+            pages = fn()
+            elapsed = time.perf_counter() - start
+            print(f"{backend:>10} | {mode:>12} | {pages:>6} | {elapsed:8.2f} | {pages / elapsed:8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF extraction throughput: serial vs process pool.")
+    parser.add_argument("--pdf-dir", default=os.path.join(ROOT, "files", "pinecone_pdfs"), help="Folder of the PDFs")
+    parser.add_argument("--backends", nargs="+", choices=sorted(PAGE_READERS), default=["pymupdf", "pdfplumber"],
+                        help="Extraction backends to test")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1], help="Pool sizes to test")
+    parser.add_argument("--pages-per-task", type=int, default=16, help="Pages of a file read by one task")
+    args = parser.parse_args()
+    run(args.pdf_dir, args.backends, args.workers, args.pages_per_task)
@@ -0,0 +1,80 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from pdf_extract import PAGE_READERS, extract_text
+
+# ----------------------------------------------------SAMPLE-------------------------------------------------------------------------- #
+def make_sample_pdf(path, n_pages=300, lines_per_page=45):
+    """Write a PDF of `n_pages` pages of plain text (requires pymupdf)."""
+    import fitz
+    doc = fitz.open()
+    line = "The mitochondria is the powerhouse of the cell, and its membrane potential drives ATP synthesis. "
+    for page_number in range(n_pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), f"Page {page_number + 1}\n" + (line * 2 + "\n") * lines_per_page,
+                            fontsize=7)
+    doc.save(path)
+    doc.close()
+
+
+# ----------------------------------------------------BENCHMARK-------------------------------------------------------------------------- #
+def legacy(path, backend):
+    """The previous approach: `text += page.extract_text()` over every page."""
+    text = ""
+    for record in PAGE_READERS[backend][0](path):
+        text += record.text
+    return text
+
+
+def measure(fn):
+    """Run fn, returning its result, the seconds it took and the peak of the Python allocations in MB."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def run(path, backends, max_chars, max_tokens):
+    print(f"{path}\n")
+    print(f"{'backend':>10} | {'mode':>22} | {'chars':>9} | {'seconds':>8} | {'peak MB':>8}")
+    for backend in backends:
+        runs = [("text += (legacy)", lambda: legacy(path, backend)),
+                ("generator + join", lambda: extract_text(path, backend)),
+                ("first 10 pages", lambda: extract_text(path, backend, pages=range(10))),
+                (f"max_chars={max_chars}", lambda: extract_text(path, backend, max_chars=max_chars))]
+        if max_tokens:
+            runs.append((f"max_tokens={max_tokens}", lambda: extract_text(path, backend, max_tokens=max_tokens)))
+        for mode, fn in runs:
+            text, elapsed, peak = measure(fn)
+            print(f"{backend:>10} | {mode:>22} | {len(text):>9} | {elapsed:8.2f} | {peak:8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF text extraction: quadratic concatenation vs page generator and budget.")
+    parser.add_argument("--pdf", default=None, help="PDF to read (default: a generated 300-page PDF)")
+    parser.add_argument("--pages", type=int, default=300, help="Pages of the generated PDF")
+    parser.add_argument("--backends", nargs="+", choices=sorted(PAGE_READERS), default=["pymupdf", "pdfplumber"],
+                        help="Extraction backends to test")
+    parser.add_argument("--max-chars", type=int, default=50000, help="Character budget tested")
+    parser.add_argument("--max-tokens", type=int, default=10000, help="Token budget tested (0 to skip, needs tiktoken)")
+    args = parser.parse_args()
+
+    if args.pdf:
+        run(args.pdf, args.backends, args.max_chars, args.max_tokens)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"sample_{args.pages}_pages.pdf")
+            make_sample_pdf(path, args.pages)
+            run(path, args.backends, args.max_chars, args.max_tokens)
@@ -0,0 +1,99 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+import migrations
+
+# ----------------------------------------------------HOT_QUERIES-------------------------------------------------------------------------- #
+# (name, sql, params) of the queries run on every turn or on every user info / course search request
+HOT_QUERIES = [
+    ("course_by_name", "SELECT CourseID FROM course WHERE Name = ?", ("Text Mining",)),
+    ("primary_language", """SELECT l.Language
+                            FROM user_language ul
+                            JOIN languages l ON ul.LanguageID = l.LanguageID
+                            WHERE ul.UserID = ? AND ul.PrimaryLanguage = 1""", (1,)),
+    ("profile_courses", """SELECT cs.Name, t.Name
+                           FROM user_courses u
+                           JOIN course cs ON u.CourseID = cs.CourseID
+                           JOIN course_topic ct ON cs.CourseID = ct.CourseID
+                           JOIN topic t ON ct.TopicID = t.TopicID
+                           WHERE u.UserID = ?""", (1,)),
+    ("phone_exists", "SELECT 1 FROM clients WHERE REPLACE(PhoneNumber, '+', '') = ?", ("351912345678",)),
+    ("course_search", """SELECT DISTINCT c.Name, CityName, Country, e.Name, e.Type
+                         FROM course c
+                         JOIN course_location cl ON c.CourseID = cl.CourseID
+                         JOIN educational_provider e ON e.ProviderID = cl.ProviderID
+                         JOIN city ON e.CityID = city.CityID
+                         JOIN course_topic ct ON c.CourseID = ct.CourseID
+                         JOIN topic ON topic.TopicID = ct.TopicID
+                         WHERE city.CityID = ? AND e.Type = ? AND topic.Name IN (?, ?)""",
+     (1, "InPerson", "Data Science", "Mathematics")),
+]
+
+
+# ----------------------------------------------------REPORT-------------------------------------------------------------------------- #
+def plan(connection, sql, params):
+    """Return the EXPLAIN QUERY PLAN of a query, one line per step."""
+    return [row[-1] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+def median_us(connection, sql, params, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        connection.execute(sql, params).fetchall()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e6
+
+
+def report(db_path, repeats):
+    connection = sqlite3.connect(db_path)
+    result = {"schema_version": migrations.schema_version(connection),
+              "journal_mode": connection.execute("PRAGMA journal_mode").fetchone()[0],
+              "queries": {}}
+    for name, sql, params in HOT_QUERIES:
+        result["queries"][name] = {"plan": plan(connection, sql, params),
+                                   "median_us": median_us(connection, sql, params, repeats)}
+    connection.close()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN of the hot queries before and after the migrations.")
+    parser.add_argument("--db", default=os.path.join(ROOT, "files", "aurora.db"), help="Path to the SQLite database")
+    parser.add_argument("--repeats", type=int, default=200, help="Number of runs timed per query")
+    args = parser.parse_args()
+
+    # Work on a copy at schema version 0, so the real database is never written to
+    workdir = tempfile.mkdtemp(prefix="aurora_plans_")
+    try:
+        copy = os.path.join(workdir, "aurora.db")
+        source = sqlite3.connect(args.db)
+        target = sqlite3.connect(copy)
+        source.backup(target)
+        source.close()
+        for (name,) in target.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'").fetchall():
+            target.execute(f"DROP INDEX {name}")
+        if target.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+            target.execute("DELETE FROM sqlite_stat1")
+        target.execute("PRAGMA user_version = 0")
+        target.execute("PRAGMA journal_mode = delete")
+        target.commit()
+        target.close()
+
+        before = report(copy, args.repeats)
+        migrations.migrate(copy)
+        after = report(copy, args.repeats)
+        print(json.dumps({"before": before, "after": after}, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,74 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from local_router import LocalRouter, load_intentions, stratified_split
+
+# ----------------------------------------------------BENCHMARK-------------------------------------------------------------------------- #
+def evaluate(route_fn, test):
+    """Route the test messages one at a time, as the chat does; returns (accuracy, per-message latencies in ms)."""
+    correct, latencies = 0, []
+    for message, label in test:
+        start = time.perf_counter()
+        name = route_fn(message).name
+        latencies.append((time.perf_counter() - start) * 1000)
+        correct += name == label
+    return correct / len(test), latencies
+
+
+def print_row(name, accuracy, latencies, build):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    print(f"{name:>12} | {accuracy * 100:8.1f}% | {statistics.median(latencies):10.1f} | {p95:8.1f} | {build:7.2f}")
+
+
+def run(intentions_path, test_size, seed, top_k, aggregation, layer_path):
+    from sentence_transformers import SentenceTransformer
+
+    train, test = stratified_split(load_intentions(intentions_path), test_size, seed)
+    print(f"{len(test)} test messages")
+    print(f"local: trained on {len(train)} messages of {os.path.basename(intentions_path)}")
+    if layer_path:
+        with open(layer_path, "r", encoding="utf-8") as f:
+            utterances = sum(len(route["utterances"]) for route in json.load(f)["routes"])
+        print(f"layer: trained on the {utterances} utterances of {os.path.basename(layer_path)}")
+        # Not the same training data: the gap measures the routers as shipped, not the two engines
+        print("The routers learn from different data: this compares the shipped routers, not their engines.")
+    print()
+    print(f"{'router':>12} | {'accuracy':>9} | {'p50 ms':>10} | {'p95 ms':>8} | {'build s':>7}")
+
+    start = time.perf_counter()
+    model = SentenceTransformer('all-MiniLM-L6-v2')
+    encode = lambda texts: model.encode(texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+    router = LocalRouter.build(encode, train, top_k=top_k, aggregation=aggregation)
+    build = time.perf_counter() - start
+    router("warm up")
+    print_row("local", *evaluate(router, test), build)
+
+    if layer_path:
+        from semantic_router import RouteLayer
+        start = time.perf_counter()
+        layer = RouteLayer.from_json(layer_path)
+        build = time.perf_counter() - start
+        print_row("layer", *evaluate(layer, test), build)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy and per-turn latency of the local router vs the OpenAI RouteLayer, as shipped (different training data).")
+    parser.add_argument("--intentions", default=os.path.join(ROOT, "files", "intentions.json"), help="Labelled utterances")
+    parser.add_argument("--test-size", type=float, default=0.15, help="Share of every route kept for the test set")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the split")
+    parser.add_argument("--top-k", type=int, default=5, help="Nearest utterances voting in the local router")
+    parser.add_argument("--aggregation", choices=["mean", "sum", "max"], default="sum", help="Aggregation of the votes")
+    parser.add_argument("--layer", default=os.path.join(ROOT, "files", "layer.json"),
+                        help="RouteLayer to compare with (needs OPENAI_API_KEY); empty to skip it")
+    args = parser.parse_args()
+    run(args.intentions, args.test_size, args.seed, args.top_k, args.aggregation, args.layer)
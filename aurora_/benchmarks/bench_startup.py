@@ -0,0 +1,51 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+
+# ----------------------------------------------------BENCHMARK-------------------------------------------------------------------------- #
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+SNIPPET = """
+import sys, time, json
+sys.path.insert(0, '.')
+t0 = time.perf_counter()
+import session
+t1 = time.perf_counter()
+from resources import registry
+loaded = [name for name in ("embedding_model", "openai_client", "chat_llm",
+                            "paper_vector_store", "route_layer") if registry.is_loaded(name)]
+print(json.dumps({"import_s": t1 - t0, "loaded": loaded, "modules": len(sys.modules)}))
+"""
+
+
+def measure(runs):
+    """Time `import session` in fresh interpreters, so nothing is cached between runs."""
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", SNIPPET], cwd=ROOT, capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    times = [r["import_s"] for r in results]
+    return {"runs": runs,
+            "median_s": statistics.median(times),
+            "min_s": min(times),
+            "max_s": max(times),
+            "modules": results[-1]["modules"],
+            "eagerly_loaded_resources": results[-1]["loaded"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup time of `import session` (cold interpreter).")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh interpreters to time")
+    parser.add_argument("--output", help="Optional JSON file to append the result to, to track it over time")
+    args = parser.parse_args()
+
+    report = measure(args.runs)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report) + "\n")
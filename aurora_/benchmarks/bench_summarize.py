@@ -0,0 +1,54 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import os
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from summarize import MapReduceSummarizer
+
+# ----------------------------------------------------BENCHMARK-------------------------------------------------------------------------- #
+def simulated_completion(latency, summary_words):
+    """A completion function that waits like a request and returns a summary of a fixed length."""
+    def complete(messages, model=None, temperature=None):
+        time.sleep(latency)
+        return " ".join(messages[-1]["content"].split()[:summary_words])
+    return complete
+
+
+def document(n_pages, words_per_page=500):
+    line = "Enzymes lower the activation energy of reactions without being consumed by them. "
+    return "\n".join(f"Page {page + 1}\n" + line * (words_per_page // 13) for page in range(n_pages))
+
+
+def run(pages_list, workers_list, latency, section_tokens, summary_words):
+    print(f"Simulated request latency: {latency:.2f}s\n")
+    print(f"{'pages':>6} | {'workers':>7} | {'requests':>8} | {'cold s':>7} | {'again s':>7}")
+    for n_pages in pages_list:
+        text = document(n_pages)
+        for workers in workers_list:
+            with tempfile.TemporaryDirectory() as tmp:
+                summarizer = MapReduceSummarizer(tmp, simulated_completion(latency, summary_words),
+                                                 section_tokens=section_tokens, max_workers=workers)
+                start = time.perf_counter()
+                summarizer.final_messages(text, "Summarize.")
+                cold = time.perf_counter() - start
+                start = time.perf_counter()
+                summarizer.final_messages(text, "Summarize.")
+                again = time.perf_counter() - start
+                print(f"{n_pages:>6} | {workers:>7} | {summarizer.misses:>8} | {cold:7.2f} | {again:7.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Map-reduce summarization: wall-clock time vs document length and concurrency.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[20, 100, 300], help="Document lengths to test, in pages")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8], help="Concurrency limits to test")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds a simulated request takes")
+    parser.add_argument("--section-tokens", type=int, default=6000, help="Maximum tokens per section")
+    parser.add_argument("--summary-words", type=int, default=300, help="Words of a simulated partial summary")
+    args = parser.parse_args()
+    run(args.pages, args.workers, args.latency, args.section_tokens, args.summary_words)
@@ -0,0 +1,128 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+import database
+from reference_data import reference_data
+
+# ----------------------------------------------------TRACE-------------------------------------------------------------------------- #
+class StatementCounter:
+    """Count the statements and the commits run on a connection, through its trace callback."""
+
+    def __init__(self, connection):
+        self.statements = 0
+        self.commits = 0
+        connection.set_trace_callback(self)
+
+    def __call__(self, statement):
+        self.statements += 1
+        if statement.strip().upper().startswith("COMMIT"):
+            self.commits += 1
+
+    def take(self):
+        counts = {"statements": self.statements, "commits": self.commits}
+        self.statements = self.commits = 0
+        return counts
+
+
+# ----------------------------------------------------LEGACY-------------------------------------------------------------------------- #
+def legacy_add_user(connection, name_, email, password, username, language, learning_styles, city, prev_course, curr_course):
+    """The previous write path of the signup: one lookup and one commit per row."""
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO clients (Name, Email, Password, Username, DateOfBirth, Gender, MinPerDay, PreferredTime, CityID) "
+                   "VALUES (?, ?, ?, ?, '2000-01-01', 'Prefer Not To Say', 30, '10-00', ?)",
+                   (name_, email, password, username,
+                    connection.execute("SELECT CityID FROM city WHERE CityName = ?", (city,)).fetchone()[0]))
+    connection.commit()
+    id_ = cursor.lastrowid
+    cursor.execute("INSERT INTO user_language (UserID, LanguageID, PrimaryLanguage) VALUES (?, ?, 1)",
+                   (id_, connection.execute("SELECT LanguageID FROM languages WHERE Language = ?", (language,)).fetchone()[0]))
+    connection.commit()
+    for ls in learning_styles:
+        cursor.execute("INSERT INTO user_learning_style (UserID, LearningID) VALUES (?, ?)",
+                       (id_, connection.execute("SELECT LearningID FROM learning_style WHERE Name = ?", (ls,)).fetchone()[0]))
+        connection.commit()
+    for pc in prev_course:
+        cursor.execute("INSERT INTO previous_courses (UserID, CourseID, GPA) VALUES (?, ?, 0.0)",
+                       (id_, connection.execute("SELECT CourseID FROM course WHERE Name = ?", (pc,)).fetchone()[0]))
+        connection.commit()
+    for cc in curr_course:
+        cursor.execute("INSERT INTO user_courses (UserID, CourseID) VALUES (?, ?)",
+                       (id_, connection.execute("SELECT CourseID FROM course WHERE Name = ?", (cc,)).fetchone()[0]))
+        connection.commit()
+    cursor.close()
+
+
+# ----------------------------------------------------BENCHMARK-------------------------------------------------------------------------- #
+def timed(counter, fn):
+    start = time.perf_counter()
+    fn()
+    return {**counter.take(), "ms": (time.perf_counter() - start) * 1e3}
+
+
+def measure(styles, courses):
+    """
+    Run a signup, a profile update and a profile deletion on a temporary copy of the database
+    and count the statements and commits of each.
+    """
+    from website.account import add_user
+    from agents.agent_userinfo import UserChange, UserDelete, apply_user_change, apply_user_delete
+
+    connection = database.get_connection()
+    counter = StatementCounter(connection)
+    city = reference_data.cities.all_names()[0]
+    language = reference_data.languages.all_names()[0]
+    learning_styles = reference_data.learning_styles.all_names()[:styles]
+    all_courses = reference_data.courses.all_names()
+    prev_course, curr_course = all_courses[:courses], all_courses[courses:2 * courses]
+    report = {"styles": styles, "courses": courses}
+
+    report["signup_legacy"] = timed(counter, lambda: legacy_add_user(
+        connection, "Legacy", "legacy@bench.io", "password", "legacy_bench", language, learning_styles, city,
+        prev_course, curr_course))
+    report["signup"] = timed(counter, lambda: add_user(
+        "Bench", "bench@bench.io", "password", "bench_user", "2000-01-01", "Prefer Not To Say", "+0000000000",
+        30, "10-00", language, learning_styles, city, prev_course, curr_course, database.DB_PATH))
+
+    user_id = database.fetch_value("SELECT UserID FROM clients WHERE Username = ?", ("bench_user",))
+    counter.take()
+
+    next_courses = all_courses[2 * courses:3 * courses]
+    report["profile_update"] = timed(counter, lambda: apply_user_change(user_id, UserChange(
+        clients_mins=45,
+        prevcourse_course_gpa={c: 3.5 for c in curr_course},
+        currcourse_course=next_courses,
+        styles_style=reference_data.learning_styles.all_names()[styles:2 * styles],
+        language_languages=reference_data.languages.all_names()[1:3])))
+    report["profile_delete"] = timed(counter, lambda: apply_user_delete(user_id, UserDelete(
+        languages=reference_data.languages.all_names()[1:3],
+        styles=learning_styles,
+        curr_courses=next_courses,
+        prev_courses=prev_course)))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Commits and statements per signup and per profile update.")
+    parser.add_argument("--styles", type=int, default=3, help="Learning styles picked at signup")
+    parser.add_argument("--courses", type=int, default=3, help="Previous (and current) courses picked at signup")
+    args = parser.parse_args()
+
+    # Work on a copy, so the real database is never written to
+    workdir = tempfile.mkdtemp(prefix="aurora_bench_")
+    try:
+        os.makedirs(os.path.join(workdir, "files"))
+        shutil.copy(os.path.join(ROOT, database.DB_PATH), os.path.join(workdir, database.DB_PATH))
+        os.chdir(workdir)
+        print(json.dumps(measure(args.styles, args.courses), indent=2))
+    finally:
+        database.close_connection()
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,217 @@
+import sys
+sys.dont_write_bytecode = True
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import migrations
+
+# ----------------------------------------------------CONNECTION---------------------------------------------------------------------- #
+DB_PATH = os.path.join("files", "aurora.db")
+
+# Applied to every new connection. WAL (set by the migrations) is durable with synchronous=NORMAL,
+# the page cache and the memory map keep the whole database in memory, and the busy timeout makes a
+# session wait for another one's write instead of failing with "database is locked".
+CONNECTION_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -16000,          # KiB, i.e. 16 MB
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,          # ms
+}
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def _ensure_migrated(db_path):
+    """Apply the pending schema migrations once per database and process."""
+    if db_path in _migrated:
+        return
+    with _migrate_lock:
+        if db_path not in _migrated:
+            migrations.migrate(db_path)
+            _migrated.add(db_path)
+
+
+def get_connection(db_path=DB_PATH):
+    """
+    Return the SQLite connection of the current thread, opening it on first use.
+
+    Each thread keeps one connection per database file, so statements are prepared once
+    and reused from the connection's statement cache instead of being parsed on every call.
+    The first connection of the process also applies the pending schema migrations.
+
+    Parameters:
+    db_path (str, optional): The path to the database. Default is `files/aurora.db`.
+
+    Returns:
+    sqlite3.Connection: The connection of the current thread.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    connection = connections.get(db_path)
+    if connection is None:
+        _ensure_migrated(db_path)
+        connection = sqlite3.connect(db_path, cached_statements=256)
+        for name, value in CONNECTION_PRAGMAS.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        connections[db_path] = connection
+    return connection
+
+
+def close_connection(db_path=DB_PATH):
+    """Close the connection of the current thread, if it is open."""
+    connection = getattr(_local, "connections", {}).pop(db_path, None)
+    if connection is not None:
+        connection.close()
+
+
+# ----------------------------------------------------QUERIES---------------------------------------------------------------------- #
+def fetch_all(sql, params=(), row_type=None, db_path=DB_PATH):
+    """
+    Run a parameterized query and return every row.
+
+    Parameters:
+    sql (str): The query, with `?` placeholders.
+    params (tuple, optional): The values bound to the placeholders.
+    row_type (type, optional): A dataclass (or any callable) built from each row's columns. Default returns tuples.
+    db_path (str, optional): The path to the database.
+
+    Returns:
+    list: The rows, as tuples or as `row_type` instances.
+    """
+    rows = get_connection(db_path).execute(sql, params).fetchall()
+    if row_type is None:
+        return rows
+    return [row_type(*row) for row in rows]
+
+
+def fetch_one(sql, params=(), row_type=None, db_path=DB_PATH):
+    """
+    Run a parameterized query and return its first row.
+
+    Parameters:
+    sql (str): The query, with `?` placeholders.
+    params (tuple, optional): The values bound to the placeholders.
+    row_type (type, optional): A dataclass (or any callable) built from the row's columns.
+    db_path (str, optional): The path to the database.
+
+    Returns:
+    tuple or row_type or None: The first row, or None if the query returned nothing.
+    """
+    row = get_connection(db_path).execute(sql, params).fetchone()
+    if row is None or row_type is None:
+        return row
+    return row_type(*row)
+
+
+def fetch_value(sql, params=(), default=None, db_path=DB_PATH):
+    """
+    Run a parameterized query and return the first column of its first row.
+
+    Parameters:
+    sql (str): The query, with `?` placeholders.
+    params (tuple, optional): The values bound to the placeholders.
+    default (optional): The value returned when the query returns nothing. Default is None.
+    db_path (str, optional): The path to the database.
+
+    Returns:
+    The value of the first column, or `default`.
+    """
+    row = get_connection(db_path).execute(sql, params).fetchone()
+    return default if row is None else row[0]
+
+
+def fetch_column(sql, params=(), db_path=DB_PATH):
+    """
+    Run a parameterized query and return the first column of every row.
+
+    Parameters:
+    sql (str): The query, with `?` placeholders.
+    params (tuple, optional): The values bound to the placeholders.
+    db_path (str, optional): The path to the database.
+
+    Returns:
+    list: The values of the first column.
+    """
+    return [row[0] for row in get_connection(db_path).execute(sql, params).fetchall()]
+
+
+def placeholders(values):
+    """Return the `?, ?, ...` list to bind a sequence of values in an `IN (...)` clause."""
+    return ", ".join("?" for _ in values)
+
+
+@contextmanager
+def transaction(db_path=DB_PATH):
+    """
+    Run a block of writes as one transaction on the thread's connection.
+
+    The transaction is committed when the block ends and rolled back if it raises.
+
+    Parameters:
+    db_path (str, optional): The path to the database.
+
+    Yields:
+    sqlite3.Cursor: The cursor to execute the writes with.
+    """
+    connection = get_connection(db_path)
+    cursor = connection.cursor()
+    try:
+        yield cursor
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# ----------------------------------------------------ROWS---------------------------------------------------------------------- #
+@dataclass(frozen=True)
+class UserDetails:
+    """The identifiers of a user, as needed by the login."""
+    user_id: int
+    username: str
+
+
+@dataclass(frozen=True)
+class Client:
+    """A row of the `clients` table."""
+    user_id: int
+    city_id: int
+    username: str
+    name: str
+    date_of_birth: str
+    password: str
+    email: str
+    gender: str
+    phone_number: str
+    streak: int
+    preferred_time: str
+    min_per_day: int
+
+
+CLIENT_COLUMNS = ("UserID, CityID, Username, Name, DateOfBirth, Password, Email, Gender, "
+                  "PhoneNumber, Streak, PreferredTime, MinPerDay")
+
+
+def get_client(user_id, db_path=DB_PATH):
+    """
+    Return the `clients` row of a user.
+
+    Parameters:
+    user_id (int): The ID of the user.
+    db_path (str, optional): The path to the database.
+
+    Returns:
+    Client or None: The user's row, or None if the user does not exist.
+    """
+    return fetch_one(f"SELECT {CLIENT_COLUMNS} FROM clients WHERE UserID = ?", (user_id,),
+                     row_type=Client, db_path=db_path)
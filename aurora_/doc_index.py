@@ -0,0 +1,257 @@
+import sys
+sys.dont_write_bytecode = True
+
+import json
+import os
+import threading
+import numpy as np
+
+
+# ----------------------------------------------------CHUNKING---------------------------------------------------------------------- #
+def chunk_text(text, chunk_words=150, overlap=30):
+    """
+    Split a text into overlapping windows of words.
+
+    The default window stays below the ~256 word pieces that `all-MiniLM-L6-v2` reads,
+    so no part of a chunk is silently truncated by the model.
+
+    Parameters:
+    text (str): The text to split.
+    chunk_words (int, optional): Number of words per chunk. Default is 150.
+    overlap (int, optional): Number of words shared by consecutive chunks. Default is 30.
+
+    Returns:
+    list: The chunks, as strings (at least one, even for an empty text).
+    """
+    words = text.split()
+    if len(words) <= chunk_words:
+        return [" ".join(words)]
+    step = max(chunk_words - overlap, 1)
+    return [" ".join(words[start:start + chunk_words])
+            for start in range(0, len(words) - overlap, step)]
+
+
+# ----------------------------------------------------DOCUMENT_INDEX---------------------------------------------------------------------- #
+class DocumentIndex:
+    """
+    Persistent embedding index of the uploaded PDF documents.
+
+    The embeddings are kept as a single normalized NumPy matrix, next to a metadata list mapping
+    every document to its content hash, file path and number of rows. In "document" mode each
+    document is one row (its whole text); in "chunk" mode each document is split into overlapping
+    windows and every chunk is a row, so the whole document is compared and not only what fits in
+    the model input. A document's score is then the max, or the mean of the top k, of its chunk scores.
+
+    Embeddings are also cached per content hash, so a new upload only embeds its own chunks and a
+    file that is removed and uploaded again is not embedded twice. Scoring is one query encode and
+    one matrix-vector product over all rows.
+
+    Attributes:
+    index_dir (str): The folder where the matrix, the metadata and the per-hash cache are saved.
+    encode_fn (callable): Function mapping a list of texts to an (n, dim) array of embeddings.
+    text_store (PdfTextStore): Store used to get the content hash and the text of each PDF.
+    mode (str): "document" or "chunk".
+    aggregate (str): "max" or "mean" (mean of the `top_k` best chunks), used in chunk mode.
+    top_k (int): Number of chunks averaged when `aggregate` is "mean".
+    chunk_words (int): Number of words per chunk.
+    overlap (int): Number of words shared by consecutive chunks.
+    """
+
+    def __init__(self, index_dir, encode_fn, text_store, mode="document", aggregate="max", top_k=3,
+                 chunk_words=150, overlap=30):
+        if mode not in ("document", "chunk"):
+            raise ValueError(f"Unknown index mode: {mode}")
+        if aggregate not in ("max", "mean"):
+            raise ValueError(f"Unknown aggregate: {aggregate}")
+        self.index_dir = index_dir
+        self.encode_fn = encode_fn
+        self.text_store = text_store
+        self.mode = mode
+        self.aggregate = aggregate
+        self.top_k = top_k
+        self.chunk_words = chunk_words
+        self.overlap = overlap
+        self.config = {"mode": mode, "chunk_words": chunk_words, "overlap": overlap}
+
+        subdir = mode if mode == "document" else f"chunk_{chunk_words}_{overlap}"
+        self.matrix_path = os.path.join(index_dir, f"{subdir}.npy")
+        self.meta_path = os.path.join(index_dir, f"{subdir}.json")
+        self.cache_dir = os.path.join(index_dir, subdir)
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.matrix, self.meta = self._load()
+
+    def _load(self):
+        """Load the matrix and the metadata from disk (empty index if missing or inconsistent)."""
+        try:
+            matrix = np.load(self.matrix_path)
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            meta = saved["documents"]
+            if saved["config"] == self.config and sum(m["rows"] for m in meta) == matrix.shape[0]:
+                return matrix.astype(np.float32), meta
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None, []
+
+    def _save(self):
+        """Atomically write the matrix and the metadata to disk."""
+        if self.matrix is None:
+            for path in (self.matrix_path, self.meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return
+        tmp_matrix = self.matrix_path + ".tmp.npy"
+        np.save(tmp_matrix, self.matrix)
+        os.replace(tmp_matrix, self.matrix_path)
+        tmp_meta = self.meta_path + ".tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"config": self.config, "documents": self.meta}, f)
+        os.replace(tmp_meta, self.meta_path)
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _split(self, text):
+        if self.mode == "document":
+            return [text]
+        return chunk_text(text, self.chunk_words, self.overlap)
+
+    def _embed_documents(self, docs):
+        """
+        Return the row embeddings of each (path, digest) pair, reading the per-hash cache first.
+
+        All chunks of the documents missing from the cache are embedded in a single batched call.
+        """
+        embedded, missing = {}, []
+        for path, digest in docs:
+            try:
+                embedded[digest] = np.load(os.path.join(self.cache_dir, f"{digest}.npy"))
+            except (OSError, ValueError):
+                missing.append((path, digest))
+
+        if missing:
+            chunks = [self._split(self.text_store.get_text(path)) for path, _ in missing]
+            vectors = self._normalize(self.encode_fn([c for doc_chunks in chunks for c in doc_chunks]))
+            start = 0
+            for (_, digest), doc_chunks in zip(missing, chunks):
+                embedded[digest] = vectors[start:start + len(doc_chunks)]
+                start += len(doc_chunks)
+                np.save(os.path.join(self.cache_dir, f"{digest}.npy"), embedded[digest])
+
+        return [embedded[digest] for _, digest in docs]
+
+    def sync(self, pdf_files):
+        """
+        Bring the index in line with the given files.
+
+        New or modified files are embedded (in one batch) and appended, rows of files that are
+        no longer present are dropped. Unchanged files are not touched.
+
+        Parameters:
+        pdf_files (list): The paths of the PDF files that should be indexed.
+
+        Returns:
+        bool: True if the index changed, False otherwise.
+        """
+        wanted = {os.path.abspath(p): self.text_store.digest(p) for p in pdf_files}
+
+        with self._lock:
+            keep = [i for i, m in enumerate(self.meta) if wanted.get(m["path"]) == m["id"]]
+            indexed = {self.meta[i]["path"] for i in keep}
+            new = [(path, digest) for path, digest in wanted.items() if path not in indexed]
+            if not new and len(keep) == len(self.meta):
+                return False
+
+            offsets = np.cumsum([0] + [m["rows"] for m in self.meta])
+            blocks = [self.matrix[offsets[i]:offsets[i + 1]] for i in keep]
+            meta = [self.meta[i] for i in keep]
+
+            for (path, digest), rows in zip(new, self._embed_documents(new)):
+                blocks.append(rows)
+                meta.append({"id": digest, "path": path, "name": os.path.basename(path), "rows": len(rows)})
+
+            self.matrix = np.vstack(blocks).astype(np.float32) if blocks else None
+            self.meta = meta
+            self._save()
+            return True
+
+    def add(self, pdf_path):
+        """
+        Add (or refresh) a single PDF in the index.
+
+        Parameters:
+        pdf_path (str): The path to the PDF.
+
+        Returns:
+        None
+        """
+        self.sync([m["path"] for m in self.meta if m["path"] != os.path.abspath(pdf_path)] + [pdf_path])
+
+    def remove(self, pdf_path):
+        """
+        Remove a single PDF from the index.
+
+        Parameters:
+        pdf_path (str): The path to the PDF.
+
+        Returns:
+        None
+        """
+        self.sync([m["path"] for m in self.meta if m["path"] != os.path.abspath(pdf_path)])
+
+    def _aggregate(self, row_scores, rows):
+        """Reduce the row scores to one score per document, in a single vectorized pass."""
+        if self.mode == "document" or self.aggregate == "max":
+            return np.maximum.reduceat(row_scores, np.cumsum([0] + rows[:-1]))
+
+        # Pad the chunk scores into a (documents, max chunks) matrix and average the top k of each row
+        k = self.top_k
+        width = max(rows)
+        doc_of_row = np.repeat(np.arange(len(rows)), rows)
+        col_of_row = np.arange(len(row_scores)) - np.repeat(np.cumsum([0] + rows[:-1]), rows)
+        padded = np.full((len(rows), width), -np.inf, dtype=np.float32)
+        padded[doc_of_row, col_of_row] = row_scores
+        if width > k:
+            padded = np.partition(padded, width - k, axis=1)[:, width - k:]
+        valid = np.isfinite(padded)
+        return np.where(valid, padded, 0).sum(axis=1) / valid.sum(axis=1)
+
+    def scores(self, query):
+        """
+        Compute the similarity between a query and every indexed document.
+
+        Parameters:
+        query (str): The text to compare against the documents.
+
+        Returns:
+        tuple: (list of metadata dicts, NumPy array of scores), in the same order.
+        """
+        with self._lock:
+            matrix, meta = self.matrix, list(self.meta)
+        if matrix is None:
+            return meta, np.zeros(0, dtype=np.float32)
+        query_embedding = self._normalize(self.encode_fn([query]))[0]
+        return meta, self._aggregate(matrix @ query_embedding, [m["rows"] for m in meta])
+
+    def most_relevant(self, query):
+        """
+        Find the indexed document most similar to the query.
+
+        Parameters:
+        query (str): The text to compare against the documents.
+
+        Returns:
+        tuple: (path of the best document or None, its similarity score). None is returned when no
+               document has a positive similarity, matching the behaviour of the previous loop.
+        """
+        meta, scores = self.scores(query)
+        if len(meta) == 0:
+            return None, 0.0
+        best = int(np.argmax(scores))
+        if scores[best] <= 0:
+            return None, float(scores[best])
+        return meta[best]["path"], float(scores[best])
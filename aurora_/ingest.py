@@ -0,0 +1,316 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+from pdf_extract import FAST_BACKEND, extract_pages
+from pdf_text_store import PdfTextStore
+from resources import registry, PAPER_INDEX_NAME, VECTOR_STORE_DIR, paper_embeddings_name
+from semantic_cache import bump_index_generation
+
+load_dotenv()
+
+PDF_DIR = os.path.join("files", "pinecone_pdfs")
+
+
+# ----------------------------------------------------CHUNKS---------------------------------------------------------------------- #
+def split_pages(records, chunk_size=1000, chunk_overlap=250):
+    """
+    Split extracted pages into chunks, as `add_to_pinecone.ipynb` did with the pages of `PyMuPDFLoader`.
+
+    Parameters:
+    records (list): `PageRecord`s of the pages.
+    chunk_size (int, optional): Maximum number of characters per chunk. Default is 1000.
+    chunk_overlap (int, optional): Characters shared by consecutive chunks. Default is 250.
+
+    Returns:
+    list: The chunks, as LangChain documents with the page metadata and their start index.
+    """
+    from langchain_core.documents import Document
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(separators="\n", chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                              add_start_index=True)
+    return splitter.split_documents([Document(page_content=r.text, metadata=r.metadata) for r in records])
+
+
+def stream_file_chunks(pdf_dir, names, **extract_kwargs):
+    """
+    Extract PDFs in the process pool and chunk their pages as they arrive, yielding every file once complete.
+
+    Parameters:
+    pdf_dir (str): The folder of the PDFs.
+    names (list): The file names to extract.
+    **extract_kwargs: Options of `pdf_extract.extract_pages` (pool, pages_per_task, max_workers, max_memory_mb).
+
+    Yields:
+    tuple: (file name, its chunks in page order, its number of pages).
+    """
+    if not names:
+        return
+    chunks, pages_seen = defaultdict(list), Counter()
+    for record in extract_pages([os.path.join(pdf_dir, name) for name in names], FAST_BACKEND, **extract_kwargs):
+        name = os.path.basename(record.path)
+        chunks[name] += [(record.page, chunk) for chunk in split_pages([record])]
+        pages_seen[name] += 1
+        if pages_seen[name] == record.total_pages:
+            # The sort is stable, so the chunks of a page stay in their order
+            yield name, [chunk for _, chunk in sorted(chunks.pop(name), key=lambda item: item[0])], pages_seen[name]
+    # PDFs without any page
+    for name in names:
+        if name not in pages_seen:
+            yield name, [], 0
+
+
+def chunk_ids(name, chunks):
+    """
+    Give every chunk an id derived from its content.
+
+    The id hashes the file name, the page and the text of the chunk (plus its rank among identical
+    chunks of the same page), so it does not depend on the order of the files or of the chunks: an
+    unchanged chunk keeps its id when the file, or any other file, is edited.
+
+    Parameters:
+    name (str): The file name of the PDF.
+    chunks (list): Its chunks.
+
+    Returns:
+    list: One id per chunk.
+    """
+    seen = Counter()
+    ids = []
+    for chunk in chunks:
+        key = (str(chunk.metadata.get("page")), chunk.page_content)
+        ids.append(hashlib.sha256("\0".join((name, key[0], str(seen[key]), key[1])).encode("utf-8")).hexdigest())
+        seen[key] += 1
+    return ids
+
+
+# ----------------------------------------------------MANIFEST---------------------------------------------------------------------- #
+class Manifest:
+    """
+    Record of what was ingested into one index, saved after every batch so an interrupted run resumes.
+
+    `files` maps every fully ingested PDF to its content hash and the ids of its chunks. `pending` maps
+    a PDF being ingested to its content hash and the ids already written, so a run that crashed only
+    embeds the chunks that were not written yet.
+
+    Attributes:
+    path (str): The path to the manifest file.
+    data (dict): {"embedding", "files", "pending"}.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+        self.data.setdefault("files", {})
+        self.data.setdefault("pending", {})
+
+    @property
+    def files(self):
+        return self.data["files"]
+
+    @property
+    def pending(self):
+        return self.data["pending"]
+
+    def save(self):
+        """Atomically write the manifest."""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.data, f)
+            os.replace(self.path + ".tmp", self.path)
+
+    def mark_written(self, name, digest, ids):
+        """Record that some chunks of a file being ingested were written, and save."""
+        with self._lock:
+            entry = self.pending.setdefault(name, {"digest": digest, "done": []})
+            entry["done"].extend(ids)
+        self.save()
+
+
+# ----------------------------------------------------INGESTION---------------------------------------------------------------------- #
+def delete_ids(vector_store, ids, batch_size=1000):
+    """Delete vectors in batches (Pinecone accepts at most 1000 ids per call)."""
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        vector_store.delete(ids=ids[start:start + batch_size])
+
+
+def write_chunks(vector_store, manifest, name, digest, chunks, ids, batch_size, concurrency):
+    """
+    Embed and upsert chunks in batches, `concurrency` batches at a time, recording every batch written.
+
+    Parameters:
+    vector_store (VectorStore): The store to write to.
+    manifest (Manifest): The manifest of the store.
+    name (str): The file name of the PDF.
+    digest (str): Its content hash.
+    chunks (list): The chunks to write.
+    ids (list): Their ids.
+    batch_size (int): Chunks embedded per call.
+    concurrency (int): Number of batches in flight.
+
+    Returns:
+    None
+    """
+    def write(start):
+        batch_ids = ids[start:start + batch_size]
+        vector_store.add_documents(chunks[start:start + batch_size], ids=batch_ids)
+        manifest.mark_written(name, digest, batch_ids)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in as_completed([pool.submit(write, start) for start in range(0, len(chunks), batch_size)]):
+            future.result()
+
+
+def ingest(vector_store, manifest, pdf_dir, batch_size=64, concurrency=4, dry_run=False, **extract_kwargs):
+    """
+    Bring the vector store in line with the PDFs of a folder.
+
+    Only the chunks that are not in the store yet are embedded. The vectors of removed files, and the
+    chunks that disappeared from an edited file, are deleted.
+
+    Parameters:
+    vector_store (VectorStore): The store to write to.
+    manifest (Manifest): The manifest of the store.
+    pdf_dir (str): The folder of the PDFs.
+    batch_size (int, optional): Chunks embedded per call. Default is 64.
+    concurrency (int, optional): Number of batches in flight. Default is 4.
+    dry_run (bool, optional): Only report what would change (the changed files are still extracted). Default is False.
+    **extract_kwargs: Options of the PDF extraction (pages_per_task, max_workers, max_memory_mb).
+
+    Returns:
+    dict: Number of files added/changed/removed/unchanged, of chunks embedded/deleted and of pages extracted.
+    """
+    current = {name: PdfTextStore.file_hash(os.path.join(pdf_dir, name))
+               for name in sorted(os.listdir(pdf_dir)) if name.endswith(".pdf")}
+    report = Counter()
+
+    # The local store merges the writes of the run into one new generation (and one IVF build) at the end
+    with deferred_writes(vector_store):
+        for name in sorted(set(manifest.files) | set(manifest.pending)):
+            if name in current:
+                continue
+            stale = set(manifest.files.get(name, {}).get("chunks", [])) | set(manifest.pending.get(name, {}).get("done", []))
+            print(f"Removed: {name} ({len(stale)} chunks)")
+            report["removed_files"] += 1
+            report["deleted_chunks"] += len(stale)
+            if not dry_run:
+                delete_ids(vector_store, stale)
+                manifest.files.pop(name, None)
+                manifest.pending.pop(name, None)
+                manifest.save()
+
+        stale_files = [name for name, digest in current.items()
+                       if manifest.files.get(name, {}).get("digest") != digest or name in manifest.pending]
+        report["unchanged_files"] = len(current) - len(stale_files)
+
+        start = time.perf_counter()
+        for name, chunks, n_pages in stream_file_chunks(pdf_dir, stale_files, **extract_kwargs):
+            report["pages"] += n_pages
+            digest = current[name]
+            done = manifest.files.get(name)
+            ids = chunk_ids(name, chunks)
+            stored = set(done["chunks"]) if done else set()
+            pending = manifest.pending.get(name, {})
+            stored |= set(pending.get("done", []))
+            todo = [i for i, chunk_id in enumerate(ids) if chunk_id not in stored]
+            stale = stored - set(ids)
+
+            print(f"{'Changed' if done else 'New'}: {name} ({len(todo)} of {len(ids)} chunks to embed, {len(stale)} to delete)")
+            report["changed_files" if done else "new_files"] += 1
+            report["embedded_chunks"] += len(todo)
+            report["deleted_chunks"] += len(stale)
+            if dry_run:
+                continue
+
+            if pending.get("digest") != digest:
+                manifest.pending[name] = {"digest": digest, "done": list(pending.get("done", []))}
+                manifest.save()
+            write_chunks(vector_store, manifest, name, digest, [chunks[i] for i in todo], [ids[i] for i in todo],
+                         batch_size, concurrency)
+            delete_ids(vector_store, stale)
+            manifest.files[name] = {"digest": digest, "chunks": ids}
+            manifest.pending.pop(name, None)
+            manifest.save()
+
+    if report["pages"]:
+        # Includes the embedding of the files that finished first, while the others were extracted
+        report["pages_per_s"] = round(report["pages"] / (time.perf_counter() - start), 1)
+    return dict(report)
+
+
+def deferred_writes(vector_store):
+    """Return a context in which the writes to the store are batched until its end (local store only)."""
+    from local_vector_store import LocalVectorStore
+    if isinstance(vector_store, LocalVectorStore):
+        return vector_store.deferred_writes()
+    return nullcontext()
+
+
+def reset_store(vector_store):
+    """Delete every vector of the store (i.e. the positional ids written by `add_to_pinecone.ipynb`)."""
+    from local_vector_store import LocalVectorStore
+    if isinstance(vector_store, LocalVectorStore):
+        with vector_store.deferred_writes():
+            delete_ids(vector_store, [record["id"] for record in vector_store.index.records])
+    else:
+        vector_store.delete(delete_all=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally ingest the paper PDFs into the configured vector store.")
+    parser.add_argument("--pdf-dir", default=PDF_DIR, help="Folder of the PDFs")
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks embedded per call")
+    parser.add_argument("--concurrency", type=int, default=4, help="Batches embedded and written at the same time")
+    parser.add_argument("--workers", type=int, default=None, help="PDF extraction processes (default: CPUs, at most 8)")
+    parser.add_argument("--max-memory-mb", type=int, default=2048, help="Memory cap of every extraction process")
+    parser.add_argument("--pages-per-task", type=int, default=16, help="Pages of a file read by one extraction task")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would change")
+    parser.add_argument("--reset", action="store_true",
+                        help="Empty the index first (once, to replace the positional ids of the notebook)")
+    args = parser.parse_args()
+
+    backend = os.getenv("AURORA_VECTOR_BACKEND", "pinecone")
+    manifest = Manifest(os.path.join(VECTOR_STORE_DIR, f"{PAPER_INDEX_NAME}.{backend}.manifest.json"))
+    if manifest.data.get("embedding", paper_embeddings_name()) != paper_embeddings_name() and not args.reset:
+        sys.exit(f"The index was built with {manifest.data['embedding']}: run with --reset to rebuild it "
+                 f"with {paper_embeddings_name()}")
+
+    if args.reset and not args.dry_run and backend == "local":
+        # The local store refuses to open an index built with another model: remove it before opening the store
+        shutil.rmtree(os.path.join(VECTOR_STORE_DIR, PAPER_INDEX_NAME), ignore_errors=True)
+
+    # A dry run only reads the manifest and the PDFs
+    vector_store = None if args.dry_run else registry.get("paper_vector_store")
+    if args.reset:
+        if not args.dry_run:
+            reset_store(vector_store)
+        manifest.data.update(files={}, pending={})
+    manifest.data["embedding"] = paper_embeddings_name()
+
+    report = ingest(vector_store, manifest, args.pdf_dir, args.batch_size, args.concurrency, args.dry_run,
+                    max_workers=args.workers, max_memory_mb=args.max_memory_mb, pages_per_task=args.pages_per_task)
+    if not args.dry_run:
+        manifest.save()
+        if args.reset or report.get("embedded_chunks") or report.get("deleted_chunks"):
+            # Cached answers were built on the previous content of the index
+            bump_index_generation(PAPER_INDEX_NAME)
+    print(json.dumps(report, indent=2, sort_keys=True))
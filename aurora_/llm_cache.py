@@ -0,0 +1,199 @@
+import sys
+sys.dont_write_bytecode = True
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# ----------------------------------------------------KEYS---------------------------------------------------------------------- #
+def make_key(model, messages, temperature, **kwargs):
+    """
+    Compute the canonical hash of a completion request.
+
+    The request is serialized as JSON with sorted keys and no whitespace, so two requests with the
+    same model, messages, temperature and options get the same key whatever the order of their fields.
+
+    Parameters:
+    model (str): The model of the request.
+    messages (list): The messages of the request.
+    temperature (float): The temperature of the request.
+    **kwargs: The other options of the request (i.e. max_tokens).
+
+    Returns:
+    str: The SHA-256 hex digest of the request.
+    """
+    payload = {"model": model, "messages": messages, "temperature": float(temperature), "kwargs": kwargs}
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# ----------------------------------------------------CACHE---------------------------------------------------------------------- #
+class LLMResponseCache:
+    """
+    Persistent exact-match cache of chat completions, stored in a local SQLite file.
+
+    Only the calls that name a route are candidates: a call is served from the cache if its route is
+    enabled and its temperature is not above `max_temperature` (above it the answers are meant to vary,
+    so the call always goes to the API). Entries expire after `ttl` seconds and the least recently used
+    ones are evicted when there are more than `max_entries`.
+
+    Attributes:
+    db_path (str): The path to the cache database.
+    enabled (bool): Global switch of the cache.
+    routes (set): The routes whose calls may be cached.
+    max_temperature (float): The highest temperature that is still cached.
+    ttl (float): Lifetime of an entry, in seconds.
+    max_entries (int): Maximum number of entries kept.
+    """
+
+    def __init__(self, db_path, enabled=True, routes=(), max_temperature=0.2, ttl=7 * 24 * 3600, max_entries=5000):
+        self.db_path = db_path
+        self.enabled = enabled
+        self.routes = set(routes)
+        self.max_temperature = max_temperature
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_prompt_tokens = 0
+        self.saved_completion_tokens = 0
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode = wal")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("""CREATE TABLE IF NOT EXISTS responses
+                                  (key TEXT PRIMARY KEY,
+                                   route TEXT,
+                                   model TEXT,
+                                   response TEXT NOT NULL,
+                                   prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                                   completion_tokens INTEGER NOT NULL DEFAULT 0,
+                                   created REAL NOT NULL,
+                                   last_used REAL NOT NULL,
+                                   hits INTEGER NOT NULL DEFAULT 0)""")
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+            self._connection = connection
+        return self._connection
+
+    def should_cache(self, route, temperature):
+        """
+        Tell whether a call may be served from (and stored in) the cache.
+
+        Parameters:
+        route (str or None): The route of the call.
+        temperature (float): The temperature of the call.
+
+        Returns:
+        bool: True if the cache is enabled for this route and temperature.
+        """
+        cacheable = (self.enabled and route is not None and route in self.routes
+                     and temperature <= self.max_temperature)
+        if route is not None and not cacheable:
+            with self._lock:
+                self.bypassed += 1
+        return cacheable
+
+    def get(self, key):
+        """
+        Look up a response, counting the hit or the miss.
+
+        Parameters:
+        key (str): The key of the request (see `make_key`).
+
+        Returns:
+        str or None: The cached response, or None on a miss or if the entry expired.
+        """
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT response, prompt_tokens, completion_tokens, created FROM responses WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None or now - row[3] > self.ttl:
+                if row is not None:
+                    connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            connection.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self.hits += 1
+            self.saved_prompt_tokens += row[1]
+            self.saved_completion_tokens += row[2]
+            return row[0]
+
+    def put(self, key, response, route=None, model=None, prompt_tokens=0, completion_tokens=0):
+        """
+        Store a response and evict the least recently used entries above `max_entries`.
+
+        Parameters:
+        key (str): The key of the request (see `make_key`).
+        response (str): The text of the response.
+        route (str, optional): The route of the call, kept for the statistics.
+        model (str, optional): The model of the call.
+        prompt_tokens (int, optional): The prompt tokens the call used, i.e. saved by every later hit.
+        completion_tokens (int, optional): The completion tokens the call used.
+
+        Returns:
+        None
+        """
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute("""INSERT OR REPLACE INTO responses
+                                  (key, route, model, response, prompt_tokens, completion_tokens, created, last_used, hits)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)""",
+                               (key, route, model, response, prompt_tokens or 0, completion_tokens or 0, now, now))
+            connection.execute("""DELETE FROM responses WHERE key IN
+                                  (SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)""",
+                               (self.max_entries,))
+
+    def purge_expired(self):
+        """Delete every expired entry; returns the number of entries deleted."""
+        with self._lock:
+            cursor = self._connect().execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            return cursor.rowcount
+
+    def clear(self):
+        """Delete every entry."""
+        with self._lock:
+            self._connect().execute("DELETE FROM responses")
+
+    def stats(self):
+        """
+        Return the counters of the cache since the process started.
+
+        Returns:
+        dict: Hits, misses, bypassed calls, hit rate, saved tokens and number of stored entries.
+        """
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "bypassed": self.bypassed,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "saved_prompt_tokens": self.saved_prompt_tokens,
+                    "saved_completion_tokens": self.saved_completion_tokens,
+                    "entries": entries}
+
+
+# ----------------------------------------------------CONFIGURATION---------------------------------------------------------------------- #
+# AURORA_LLM_CACHE=0 turns the cache off. AURORA_LLM_CACHE_ROUTES lists the routes that may be cached: by
+# default the temperature-0 rewrites of the last message and the injection check; add i.e. "summarize_file"
+# to also reuse the summaries given on the same unchanged PDF.
+llm_cache = LLMResponseCache(
+    os.path.join("files", "cache", "llm_cache.db"),
+    enabled=os.getenv("AURORA_LLM_CACHE", "1") == "1",
+    routes=[r.strip() for r in os.getenv("AURORA_LLM_CACHE_ROUTES", "history_rewrite,injection_check").split(",") if r.strip()],
+    max_temperature=float(os.getenv("AURORA_LLM_CACHE_MAX_TEMPERATURE", "0.2")),
+    ttl=float(os.getenv("AURORA_LLM_CACHE_TTL", str(7 * 24 * 3600))),
+    max_entries=int(os.getenv("AURORA_LLM_CACHE_MAX_ENTRIES", "5000")),
+)
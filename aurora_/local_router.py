@@ -0,0 +1,289 @@
+import sys
+sys.dont_write_bytecode = True
+
+import hashlib
+import json
+import os
+import random
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+
+# Label of the messages that belong to no route (`intentions.json` writes it as a string)
+NONE_LABEL = "None"
+
+
+# ----------------------------------------------------DATA---------------------------------------------------------------------- #
+@dataclass
+class RouteChoice:
+    """Result of routing a message; `name` is None when no route is confident enough (as with `RouteLayer`)."""
+    name: Optional[str] = None
+    score: float = 0.0
+
+
+def load_intentions(path):
+    """
+    Read the labelled utterances.
+
+    Parameters:
+    path (str): The path to the JSON list of {"Intention", "Message", "Id"} records.
+
+    Returns:
+    list: (message, route name or None) pairs, in file order.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    return [(r["Message"], None if r["Intention"] == NONE_LABEL else r["Intention"]) for r in records]
+
+
+def stratified_split(samples, test_size=0.15, seed=0):
+    """
+    Split labelled samples into a train and a test set with the same share of every label.
+
+    Parameters:
+    samples (list): (message, label) pairs.
+    test_size (float, optional): Share of every label kept for the test set. Default is 0.15.
+    seed (int, optional): Seed of the shuffle. Default is 0.
+
+    Returns:
+    tuple: (train, test) lists of (message, label) pairs.
+    """
+    by_label = {}
+    for sample in samples:
+        by_label.setdefault(sample[1], []).append(sample)
+    rng = random.Random(seed)
+    train, test = [], []
+    for label in sorted(by_label, key=str):
+        group = by_label[label][:]
+        rng.shuffle(group)
+        n_test = max(1, round(len(group) * test_size)) if len(group) > 1 else 0
+        test += group[:n_test]
+        train += group[n_test:]
+    return train, test
+
+
+def file_digest(path):
+    """Return the SHA-256 of a file, used to tell whether the router was built from its current content."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+# ----------------------------------------------------ROUTER---------------------------------------------------------------------- #
+class LocalRouter:
+    """
+    Semantic router running on a local sentence-transformer instead of the OpenAI embedding API.
+
+    The labelled utterances are embedded once, when the router is built, into a single normalized
+    matrix. A message is routed with one local encode and one matrix-vector product: its `top_k`
+    nearest utterances vote for their routes, the votes of every route are aggregated (like the
+    `aggregation` of `RouteLayer`) and the best route is returned if its score reaches the threshold
+    of that route. Thresholds are calibrated on the labelled set, the "None" utterances included, so
+    off-topic messages fall through to the default answer.
+
+    Calling the router gives a `RouteChoice`, so `router(text).name` works as with `RouteLayer`.
+
+    Attributes:
+    encode_fn (callable): Function mapping a list of texts to an (n, dim) array of embeddings.
+    routes (list): The route names.
+    matrix (np.ndarray): The normalized (n_utterances, dim) utterance embeddings.
+    labels (np.ndarray): The route index of every row of `matrix`.
+    thresholds (np.ndarray): The minimum score of every route.
+    top_k (int): Number of nearest utterances that vote.
+    aggregation (str): "mean", "sum" or "max" of the votes of a route.
+    meta (dict): What the router was built from (encoder, source digest), saved along with it.
+    """
+
+    def __init__(self, encode_fn, routes, matrix, labels, thresholds, top_k=5, aggregation="sum", meta=None):
+        if aggregation not in ("mean", "sum", "max"):
+            raise ValueError(f"Unknown aggregation: {aggregation}")
+        self.encode_fn = encode_fn
+        self.routes = list(routes)
+        self.matrix = np.asarray(matrix, dtype=np.float32)
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)
+        self.top_k = top_k
+        self.aggregation = aggregation
+        self.meta = dict(meta or {})
+
+    # ----------------------------------------------------BUILD---------------------------------------------------------------------- #
+    @classmethod
+    def build(cls, encode_fn, samples, top_k=5, aggregation="sum", default_threshold=0.3, meta=None):
+        """
+        Embed the labelled utterances and calibrate the route thresholds.
+
+        Every utterance (the "None" ones included) is embedded in one batch. Thresholds are then chosen
+        with leave-one-out routing of the labelled set: every utterance is routed against all the others,
+        and the threshold of a route is the one that accepts the most utterances it got right while
+        rejecting the most it got wrong.
+
+        Parameters:
+        encode_fn (callable): Function mapping a list of texts to an (n, dim) array of embeddings.
+        samples (list): (message, route name or None) pairs.
+        top_k (int, optional): Number of nearest utterances that vote. Default is 5.
+        aggregation (str, optional): "mean", "sum" or "max". Default is "sum" (similarity-weighted kNN vote).
+        default_threshold (float, optional): Threshold of the routes that cannot be calibrated. Default is 0.3.
+        meta (dict, optional): Information saved along with the router.
+
+        Returns:
+        LocalRouter: The router.
+        """
+        routes = sorted({label for _, label in samples if label is not None})
+        route_index = {name: i for i, name in enumerate(routes)}
+        embeddings = _normalize(encode_fn([message for message, _ in samples]))
+        truth = np.array([route_index.get(label, -1) for _, label in samples])
+
+        positive = truth >= 0
+        router = cls(encode_fn, routes, embeddings[positive], truth[positive],
+                     np.full(len(routes), default_threshold), top_k, aggregation, meta)
+
+        # Leave-one-out: an utterance must not vote for itself
+        scores = embeddings @ router.matrix.T
+        rows = np.flatnonzero(positive)
+        scores[rows, np.arange(len(rows))] = -np.inf
+        predicted, best = router._decide(scores)
+        router.thresholds = router._calibrate(predicted, best, truth, default_threshold)
+        return router
+
+    def _calibrate(self, predicted, best, truth, default_threshold):
+        """Pick, per route, the threshold maximizing accepted right answers plus rejected wrong ones."""
+        thresholds = []
+        for route in range(len(self.routes)):
+            mask = predicted == route
+            if not mask.any() or not (truth[mask] == route).any():
+                thresholds.append(default_threshold)
+                continue
+            order = np.argsort(best[mask])
+            scores = best[mask][order]
+            correct = (truth[mask] == route)[order]
+            # Threshold scores[i] accepts scores[i:] and rejects scores[:i]
+            accepted_right = np.cumsum(correct[::-1])[::-1]
+            rejected_wrong = np.concatenate([[0], np.cumsum(~correct)[:-1]])
+            thresholds.append(float(scores[int(np.argmax(accepted_right + rejected_wrong))]))
+        return np.array(thresholds, dtype=np.float32)
+
+    # ----------------------------------------------------ROUTING---------------------------------------------------------------------- #
+    def _decide(self, scores):
+        """
+        Aggregate the votes of the `top_k` nearest utterances of every message.
+
+        Parameters:
+        scores (np.ndarray): The (n_messages, n_utterances) cosine similarities.
+
+        Returns:
+        tuple: (best route index, its aggregated score) arrays, one entry per message.
+        """
+        n = scores.shape[0]
+        k = min(self.top_k, scores.shape[1])
+        nearest = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        votes = np.take_along_axis(scores, nearest, axis=1)
+        valid = np.isfinite(votes)
+        rows = np.repeat(np.arange(n), k)
+        voted = self.labels[nearest].ravel()
+
+        counts = np.zeros((n, len(self.routes)))
+        np.add.at(counts, (rows, voted), valid.ravel())
+        if self.aggregation == "max":
+            aggregated = np.full((n, len(self.routes)), -np.inf)
+            np.maximum.at(aggregated, (rows, voted), np.where(valid, votes, -np.inf).ravel())
+        else:
+            aggregated = np.zeros((n, len(self.routes)))
+            np.add.at(aggregated, (rows, voted), np.where(valid, votes, 0.0).ravel())
+            if self.aggregation == "mean":
+                aggregated = aggregated / np.maximum(counts, 1)
+        aggregated[counts == 0] = -np.inf
+
+        predicted = np.argmax(aggregated, axis=1)
+        return predicted, aggregated[np.arange(n), predicted]
+
+    def route_batch(self, texts):
+        """
+        Route several messages with one encode.
+
+        Parameters:
+        texts (list): The messages.
+
+        Returns:
+        list: One `RouteChoice` per message.
+        """
+        if not texts:
+            return []
+        predicted, best = self._decide(_normalize(self.encode_fn(list(texts))) @ self.matrix.T)
+        return [RouteChoice(self.routes[p] if s >= self.thresholds[p] else None, float(s))
+                for p, s in zip(predicted, best)]
+
+    def __call__(self, text):
+        """Route one message; same interface as `RouteLayer.__call__`."""
+        return self.route_batch([text])[0]
+
+    # ----------------------------------------------------PERSISTENCE---------------------------------------------------------------------- #
+    def save(self, router_dir):
+        """Atomically write the utterance matrix and the routing configuration to a folder."""
+        os.makedirs(router_dir, exist_ok=True)
+        tmp_matrix = os.path.join(router_dir, "utterances.tmp.npy")
+        np.save(tmp_matrix, self.matrix)
+        os.replace(tmp_matrix, os.path.join(router_dir, "utterances.npy"))
+        config = {"routes": self.routes,
+                  "labels": self.labels.tolist(),
+                  "thresholds": {r: float(t) for r, t in zip(self.routes, self.thresholds)},
+                  "top_k": self.top_k,
+                  "aggregation": self.aggregation,
+                  "meta": self.meta}
+        tmp_config = os.path.join(router_dir, "router.json.tmp")
+        with open(tmp_config, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+        os.replace(tmp_config, os.path.join(router_dir, "router.json"))
+
+    @classmethod
+    def load(cls, router_dir, encode_fn):
+        """
+        Load a router saved with `save`.
+
+        Parameters:
+        router_dir (str): The folder of the router.
+        encode_fn (callable): The encoder, which must be the one the router was built with.
+
+        Returns:
+        LocalRouter: The router.
+        """
+        matrix = np.load(os.path.join(router_dir, "utterances.npy"))
+        with open(os.path.join(router_dir, "router.json"), "r", encoding="utf-8") as f:
+            config = json.load(f)
+        if len(config["labels"]) != matrix.shape[0]:
+            raise ValueError(f"Inconsistent router in {router_dir}")
+        return cls(encode_fn, config["routes"], matrix, config["labels"],
+                   [config["thresholds"][r] for r in config["routes"]],
+                   config["top_k"], config["aggregation"], config.get("meta"))
+
+    @classmethod
+    def load_or_build(cls, router_dir, intentions_path, encode_fn, encoder_name, **build_kwargs):
+        """
+        Load the saved router, or build and save it if it is missing or out of date.
+
+        The router is rebuilt when `intentions_path` changed or another encoder is used, so editing the
+        labelled utterances is enough to retrain it on the next start.
+
+        Parameters:
+        router_dir (str): The folder of the router.
+        intentions_path (str): The labelled utterances (see `load_intentions`).
+        encode_fn (callable): Function mapping a list of texts to an (n, dim) array of embeddings.
+        encoder_name (str): The name of the encoder, saved to detect a change of model.
+        **build_kwargs: Options of `build` (top_k, aggregation, default_threshold).
+
+        Returns:
+        LocalRouter: The router.
+        """
+        meta = {"encoder": encoder_name, "source_digest": file_digest(intentions_path)}
+        try:
+            router = cls.load(router_dir, encode_fn)
+            if router.meta == meta:
+                return router
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        router = cls.build(encode_fn, load_intentions(intentions_path), meta=meta, **build_kwargs)
+        router.save(router_dir)
+        return router
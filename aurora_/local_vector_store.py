@@ -0,0 +1,414 @@
+import sys
+sys.dont_write_bytecode = True
+
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+# ----------------------------------------------------INDEX---------------------------------------------------------------------- #
+class MemmapVectorIndex:
+    """
+    On-disk cosine index of float32 vectors, searched through a memory map.
+
+    A generation of the index is a set of files written next to each other: the normalized vectors
+    (`vectors.<gen>.npy`), the records sidecar with the id, text and metadata of every row
+    (`records.<gen>.json`) and, for large corpora, the IVF partition (`ivf.<gen>.npz`). `index.json`
+    names the current generation and is replaced last, so a crash while writing leaves the previous
+    generation in use. Readers that opened an older generation keep their memory map until they reload;
+    the files of the older generations are removed once no longer mapped (on a later write or refresh,
+    as a mapped file cannot be removed on Windows).
+
+    Updates are appended to the current generation as pending segments (`segment.<gen>.<seq>.npy` and
+    `.json`), which only cost the size of the update, and `flush` merges them into a new generation,
+    building the IVF partition once. Searches only see the rows of the current generation, so a batch
+    of updates (i.e. an ingestion run) should be flushed once at its end; a segment left by a crash is
+    merged by the next flush.
+
+    Up to `ivf_min_size` rows, a search is one matrix-vector product over all rows. Above it, the rows
+    are partitioned with spherical k-means into about sqrt(n) lists, and a search only scores the rows
+    of the `n_probe` lists whose centroids are the closest to the query.
+
+    Attributes:
+    index_dir (str): The folder of the index.
+    ivf_min_size (int): Number of rows from which the IVF partition is built.
+    n_probe (int): Number of lists scored per search.
+    """
+
+    def __init__(self, index_dir, ivf_min_size=20000, n_probe=8):
+        self.index_dir = index_dir
+        self.ivf_min_size = ivf_min_size
+        self.n_probe = n_probe
+        self._lock = threading.Lock()
+        self._load()
+
+    # ----------------------------------------------------STORAGE---------------------------------------------------------------------- #
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def _load(self):
+        """Open the current generation (empty index if there is none)."""
+        try:
+            mtime = os.stat(self._path("index.json")).st_mtime_ns
+            with open(self._path("index.json"), "r", encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            self.generation, self.info, self._mtime = 0, {}, None
+            self.vectors, self.records, self.ivf, self._rows = np.zeros((0, 0), dtype=np.float32), [], None, {}
+            return
+        gen = info["generation"]
+        vectors = np.load(self._path(f"vectors.{gen}.npy"), mmap_mode="r")
+        with open(self._path(f"records.{gen}.json"), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        if len(records) != vectors.shape[0]:
+            raise ValueError(f"Inconsistent vector index in {self.index_dir}")
+        ivf = None
+        if info.get("ivf"):
+            with np.load(self._path(f"ivf.{gen}.npz")) as data:
+                ivf = {key: data[key] for key in ("centroids", "order", "offsets")}
+        self.generation, self.info, self._mtime = gen, info, mtime
+        self.vectors, self.records, self.ivf = vectors, records, ivf
+        self._rows = {record["id"]: i for i, record in enumerate(records)}
+
+    def _sync(self):
+        """Reopen the index if `index.json` changed since it was opened."""
+        try:
+            mtime = os.stat(self._path("index.json")).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self._load()
+
+    def _files(self):
+        """Return (name, generation, sequence) for the files of the index (sequence is None outside segments)."""
+        try:
+            names = os.listdir(self.index_dir)
+        except OSError:
+            return []
+        files = []
+        for name in names:
+            parts = name.split(".")
+            if len(parts) == 3 and parts[0] in ("vectors", "records", "ivf") and parts[1].isdigit():
+                files.append((name, int(parts[1]), None))
+            elif len(parts) == 4 and parts[0] == "segment" and parts[1].isdigit() and parts[2].isdigit():
+                files.append((name, int(parts[1]), int(parts[2])))
+        return files
+
+    def _segments(self):
+        """Return the sequence numbers of the complete pending segments of the current generation, in order."""
+        return sorted(seq for name, gen, seq in self._files()
+                      if gen == self.generation and seq is not None and name.endswith(".json"))
+
+    def _sweep(self):
+        """Remove the files of the previous generations, skipping the ones still open elsewhere."""
+        for name, gen, _ in self._files():
+            if gen < self.generation:
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    # Still memory-mapped by a reader (Windows): removed by a later write or refresh
+                    pass
+
+    def _append_segment(self, ids, vectors, texts, metadatas, deleted, info):
+        """Write a pending segment of the current generation: rows to upsert and ids to delete."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        seq = max((seq for _, gen, seq in self._files() if gen == self.generation and seq is not None), default=0) + 1
+        stem = self._path(f"segment.{self.generation}.{seq}")
+        if len(ids):
+            np.save(f"{stem}.npy", np.ascontiguousarray(vectors, dtype=np.float32))
+        records = [{"id": i, "text": t, "metadata": m or {}} for i, t, m in zip(ids, texts, metadatas)]
+        # The json is written last: a segment without it is incomplete and ignored
+        with open(f"{stem}.json.tmp", "w", encoding="utf-8") as f:
+            json.dump({"records": records, "deleted": list(deleted), "info": info or {}}, f)
+        os.replace(f"{stem}.json.tmp", f"{stem}.json")
+
+    def _write(self, vectors, records, info):
+        """Write a new generation, switch `index.json` to it and remove the previous ones."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        gen = self.generation + 1
+        np.save(self._path(f"vectors.{gen}.npy"), np.ascontiguousarray(vectors, dtype=np.float32))
+        with open(self._path(f"records.{gen}.json"), "w", encoding="utf-8") as f:
+            json.dump(records, f)
+        ivf = self._build_ivf(vectors) if len(records) >= self.ivf_min_size else None
+        if ivf is not None:
+            np.savez(self._path(f"ivf.{gen}.npz"), **ivf)
+
+        info = dict(info, generation=gen, count=len(records), dim=int(vectors.shape[1]) if len(records) else 0,
+                    ivf=ivf is not None)
+        with open(self._path("index.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        os.replace(self._path("index.json.tmp"), self._path("index.json"))
+
+        # Release the memory map of the previous generation before removing its files
+        self._load()
+        self._sweep()
+
+    def _build_ivf(self, vectors, iterations=10, seed=0):
+        """Partition the rows with spherical k-means; returns the centroids and the rows sorted by list."""
+        n_lists = max(1, int(np.sqrt(len(vectors))))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(len(vectors), size=min(len(vectors), 256 * n_lists), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assigned = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assigned, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # A list that got no row keeps its previous centroid
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+        assigned = np.concatenate([np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+                                   for start in range(0, len(vectors), 65536)])
+        order = np.argsort(assigned, kind="stable")
+        offsets = np.searchsorted(assigned[order], np.arange(n_lists + 1))
+        return {"centroids": centroids.astype(np.float32), "order": order.astype(np.int64), "offsets": offsets.astype(np.int64)}
+
+    def refresh(self):
+        """Reopen the index if another process (i.e. the ingestion) switched it to a new generation."""
+        try:
+            mtime = os.stat(self._path("index.json")).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            with self._lock:
+                try:
+                    self._load()
+                except OSError:
+                    # The generation was replaced again while it was being opened: keep the current one
+                    return
+                self._sweep()
+
+    # ----------------------------------------------------UPDATES---------------------------------------------------------------------- #
+    def upsert(self, ids, vectors, texts, metadatas, info=None, flush=True):
+        """
+        Add rows, replacing the rows that already have one of the ids.
+
+        Parameters:
+        ids (list): The ids of the rows.
+        vectors (np.ndarray): Their (n, dim) embeddings (normalized here).
+        texts (list): Their texts.
+        metadatas (list): Their metadata dicts.
+        info (dict, optional): Information saved in `index.json` (i.e. the embedding model).
+        flush (bool, optional): Write a new generation now; otherwise the rows stay in a pending segment
+                                until `flush`. Default is True.
+
+        Returns:
+        None
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            self._sync()
+            if len(self.records) and vectors.shape[1] != self.vectors.shape[1]:
+                raise ValueError(f"Dimension {vectors.shape[1]} does not match the index ({self.vectors.shape[1]})")
+            self._append_segment(ids, vectors, texts, metadatas, [], info)
+            if flush:
+                self._flush()
+
+    def delete(self, ids, flush=True):
+        """
+        Remove the rows with the given ids.
+
+        Parameters:
+        ids (list): The ids of the rows.
+        flush (bool, optional): Write a new generation now; otherwise the deletion stays in a pending
+                                segment until `flush`. Default is True.
+
+        Returns:
+        int: The number of those ids in the current generation.
+        """
+        with self._lock:
+            self._sync()
+            ids = list(ids)
+            count = sum(1 for i in ids if i in self._rows)
+            if not count and not self._segments():
+                return 0
+            self._append_segment([], None, [], [], ids, None)
+            if flush:
+                self._flush()
+            return count
+
+    def flush(self):
+        """
+        Merge the pending segments into a new generation (a no-op when there is none).
+
+        Returns:
+        bool: Whether a new generation was written.
+        """
+        with self._lock:
+            self._sync()
+            return self._flush()
+
+    def _flush(self):
+        segments = self._segments()
+        if not segments:
+            return False
+        # id -> (source array, row, record); an upserted id moves to the end, as in a fresh insert
+        arrays = [self.vectors]
+        rows = {record["id"]: (0, i, record) for i, record in enumerate(self.records)}
+        info = dict(self.info)
+        for seq in segments:
+            stem = self._path(f"segment.{self.generation}.{seq}")
+            with open(f"{stem}.json", "r", encoding="utf-8") as f:
+                segment = json.load(f)
+            for i in segment["deleted"]:
+                rows.pop(i, None)
+            if segment["records"]:
+                arrays.append(np.load(f"{stem}.npy"))
+                for row, record in enumerate(segment["records"]):
+                    rows.pop(record["id"], None)
+                    rows[record["id"]] = (len(arrays) - 1, row, record)
+            info.update(segment["info"])
+
+        dims = {array.shape[1] for array in arrays if len(array)}
+        if len(dims) > 1:
+            raise ValueError(f"Pending rows of dimensions {sorted(dims)} in {self.index_dir}")
+        vectors = np.zeros((len(rows), dims.pop() if dims else 0), dtype=np.float32)
+        if rows:
+            sources = np.fromiter((source for source, _, _ in rows.values()), dtype=np.int64, count=len(rows))
+            indexes = np.fromiter((row for _, row, _ in rows.values()), dtype=np.int64, count=len(rows))
+            for source, array in enumerate(arrays):
+                mask = sources == source
+                if mask.any():
+                    vectors[mask] = array[indexes[mask]]
+        # The segments of the previous generation are swept with its other files
+        self._write(vectors, [record for _, _, record in rows.values()], info)
+        return True
+
+    # ----------------------------------------------------SEARCH---------------------------------------------------------------------- #
+    def search(self, query, k):
+        """
+        Find the rows closest to a query vector.
+
+        Parameters:
+        query (np.ndarray): The query embedding.
+        k (int): Number of rows to return.
+
+        Returns:
+        list: (record, cosine similarity) pairs, best first.
+        """
+        self.refresh()
+        vectors, records, ivf = self.vectors, self.records, self.ivf
+        if not records:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        if ivf is None:
+            rows = None
+            scores = vectors @ query
+        else:
+            probe = np.argsort(-(ivf["centroids"] @ query))[:self.n_probe]
+            rows = np.concatenate([ivf["order"][ivf["offsets"][c]:ivf["offsets"][c + 1]] for c in probe])
+            rows.sort()
+            scores = vectors[rows] @ query
+
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(records[i if rows is None else rows[i]], float(scores[i])) for i in best]
+
+    def get(self, ids):
+        """Return the records with the given ids (unknown ids are skipped)."""
+        return [self.records[self._rows[i]] for i in ids if i in self._rows]
+
+
+# ----------------------------------------------------LANGCHAIN---------------------------------------------------------------------- #
+class LocalVectorStore(VectorStore):
+    """
+    LangChain vector store over a `MemmapVectorIndex`, usable wherever `PineconeVectorStore` is.
+
+    Every write is searchable once it returns, at the cost of a new generation of the index; inside
+    `deferred_writes` (i.e. an ingestion run) the writes are only merged, once, at the end of the block.
+
+    Relevance scores follow `PineconeVectorStore` with the cosine metric, (cosine + 1) / 2, so the
+    `similarity_score_threshold` retrievers of the agents keep the same thresholds on both backends.
+    """
+
+    def __init__(self, index_dir, embedding, embedding_name=None, ivf_min_size=20000, n_probe=8, autoflush=True):
+        self.index = MemmapVectorIndex(index_dir, ivf_min_size=ivf_min_size, n_probe=n_probe)
+        self._embedding = embedding
+        self.embedding_name = embedding_name
+        self.autoflush = autoflush
+        saved = self.index.info.get("embedding")
+        if embedding_name and saved and saved != embedding_name:
+            raise ValueError(f"The index in {index_dir} was built with {saved}, not {embedding_name}")
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        vectors = self._embedding.embed_documents(texts)
+        self.index.upsert(ids, vectors, texts, metadatas, info={"embedding": self.embedding_name}, flush=self.autoflush)
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        if ids is None:
+            return False
+        self.index.delete(ids, flush=self.autoflush)
+        return True
+
+    def flush(self):
+        """Make the rows added or deleted since the last flush searchable (see `MemmapVectorIndex`)."""
+        return self.index.flush()
+
+    @contextmanager
+    def deferred_writes(self):
+        """Keep the writes of a block in pending segments and merge them into one generation at its end."""
+        autoflush, self.autoflush = self.autoflush, False
+        try:
+            yield self
+        finally:
+            self.autoflush = autoflush
+            self.flush()
+
+    def get_by_ids(self, ids):
+        return [Document(id=r["id"], page_content=r["text"], metadata=r["metadata"]) for r in self.index.get(ids)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        """Return the k closest documents with their cosine similarity."""
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k)
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4):
+        return [(Document(id=r["id"], page_content=r["text"], metadata=r["metadata"]), score)
+                for r, score in self.index.search(embedding, k)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, index_dir=None, **kwargs):
+        store = cls(index_dir, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """LangChain embeddings over a local sentence-transformer, to run the paper retrieval without the OpenAI API."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def embed_documents(self, texts):
+        return self.model.encode(list(texts), batch_size=64, convert_to_numpy=True, normalize_embeddings=True).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
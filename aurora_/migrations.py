@@ -0,0 +1,123 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import sqlite3
+
+# ----------------------------------------------------MIGRATIONS---------------------------------------------------------------------- #
+# Each migration is (version, description, statements). The version applied last is recorded in
+# `PRAGMA user_version`, so every migration runs exactly once per database file. Never edit a
+# migration that was released: add a new one with the next version instead.
+MIGRATIONS = [
+    (1, "Indexes for the lookups and joins of the app", [
+        # Course search by exact name (signup, GPA editor, user info tools)
+        "CREATE INDEX IF NOT EXISTS idx_course_name ON course (Name)",
+        # ReadCourseInfoTool joins courses to topics and providers by course, and filters providers by city and type.
+        # course_location is already indexed by ProviderID through its primary key (ProviderID, CourseID).
+        "CREATE INDEX IF NOT EXISTS idx_course_topic_topic ON course_topic (TopicID, CourseID)",
+        "CREATE INDEX IF NOT EXISTS idx_course_location_course ON course_location (CourseID, ProviderID)",
+        "CREATE INDEX IF NOT EXISTS idx_educational_provider_city ON educational_provider (CityID, Type)",
+        # Primary language of a user (profile snapshot, delete tool)
+        "CREATE INDEX IF NOT EXISTS idx_user_language_primary ON user_language (UserID, PrimaryLanguage)",
+        # Duplicate phone check, which compares the numbers without their '+'
+        "CREATE INDEX IF NOT EXISTS idx_clients_phone_digits ON clients (REPLACE(PhoneNumber, '+', ''))",
+        # Give the query planner statistics about the new indexes
+        "ANALYZE",
+    ]),
+    (2, "Question bank of the quizzes", [
+        # Generated quiz questions, shared by every user who quizzes themselves on the same document
+        """CREATE TABLE IF NOT EXISTS question_bank
+             (QuestionID INTEGER PRIMARY KEY,
+              DocumentHash TEXT NOT NULL,
+              SectionHash TEXT NOT NULL,
+              TopicID INTEGER,
+              Question TEXT NOT NULL,
+              Options TEXT NOT NULL,
+              Answer TEXT NOT NULL,
+              CreatedAt REAL NOT NULL,
+              FOREIGN KEY (TopicID) REFERENCES topic(TopicID),
+              UNIQUE (DocumentHash, SectionHash, Question))""",
+        # The unique constraint indexes the sampling by (DocumentHash, SectionHash)
+        "CREATE INDEX IF NOT EXISTS idx_question_bank_topic ON question_bank (TopicID)",
+        # Questions already shown to a user, so a quiz samples the ones they have not seen
+        """CREATE TABLE IF NOT EXISTS question_seen
+             (UserID INTEGER,
+              QuestionID INTEGER,
+              SeenAt REAL NOT NULL,
+              FOREIGN KEY (UserID) REFERENCES clients(UserID),
+              FOREIGN KEY (QuestionID) REFERENCES question_bank(QuestionID),
+              PRIMARY KEY (UserID, QuestionID))""",
+        # One row per quiz, to report the bank hit rate and the LLM calls it saved
+        """CREATE TABLE IF NOT EXISTS quiz_requests
+             (RequestID INTEGER PRIMARY KEY,
+              UserID INTEGER,
+              DocumentHash TEXT NOT NULL,
+              RequestedAt REAL NOT NULL,
+              FromBank INTEGER NOT NULL,
+              Generated INTEGER NOT NULL,
+              LLMCalls INTEGER NOT NULL,
+              LLMCallsAvoided INTEGER NOT NULL)""",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(connection):
+    """Return the schema version recorded in the database."""
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db_path, target=LATEST_VERSION, journal_mode="wal"):
+    """
+    Bring a database to the latest schema version and switch it to the given journal mode.
+
+    Every pending migration runs in its own transaction together with the update of `user_version`,
+    so a failure leaves the database at the last version that was fully applied. The version is read
+    again after taking the write lock, so concurrent processes never apply a migration twice.
+
+    Parameters:
+    db_path (str): The path to the database.
+    target (int, optional): The version to migrate to. Default is the latest one.
+    journal_mode (str, optional): The journal mode to set ("wal" lets readers run while a session writes).
+
+    Returns:
+    list: The versions that were applied (empty if the database was already up to date).
+    """
+    connection = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    applied = []
+    try:
+        if journal_mode:
+            connection.execute(f"PRAGMA journal_mode = {journal_mode}")
+
+        for version, _, statements in MIGRATIONS:
+            if version > target or version <= schema_version(connection):
+                continue
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                if version <= schema_version(connection):
+                    connection.execute("ROLLBACK")
+                    continue
+                for statement in statements:
+                    connection.execute(statement)
+                connection.execute(f"PRAGMA user_version = {int(version)}")
+                connection.execute("COMMIT")
+                applied.append(version)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+    finally:
+        connection.close()
+    return applied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply the pending schema migrations to the database.")
+    parser.add_argument("--db", default="files/aurora.db", help="Path to the SQLite database")
+    args = parser.parse_args()
+
+    applied = migrate(args.db)
+    connection = sqlite3.connect(args.db)
+    print(f"Applied: {applied or 'nothing'}; schema version {schema_version(connection)}; "
+          f"journal mode {connection.execute('PRAGMA journal_mode').fetchone()[0]}")
+    connection.close()
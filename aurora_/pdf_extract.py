@@ -0,0 +1,269 @@
+import sys
+sys.dont_write_bytecode = True
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+
+# ----------------------------------------------------PAGES---------------------------------------------------------------------- #
+@dataclass
+class PageRecord:
+    """Text of one PDF page, with the metadata `PyMuPDFLoader` gives its documents."""
+    path: str
+    page: int
+    total_pages: int
+    text: str
+    metadata: dict = field(default_factory=dict)
+
+
+def _page_indexes(pages, total):
+    """Resolve the requested pages (None for all, negative indexes from the end) against the page count."""
+    if pages is None:
+        return range(total)
+    return [i + total if i < 0 else i for i in pages if -total <= i < total]
+
+
+def _pymupdf_pages(path, pages=None):
+    import fitz
+    with fitz.open(path) as doc:
+        # Same metadata as PyMuPDFLoader, so the ingested chunks keep the fields format_docs shows
+        info = {k: v for k, v in (doc.metadata or {}).items() if type(v) in (str, int)}
+        total = len(doc)
+        for i in _page_indexes(pages, total):
+            yield PageRecord(path, i, total, doc[i].get_text() or "",
+                             dict({"source": path, "file_path": path, "page": i, "total_pages": total}, **info))
+
+
+def _pdfplumber_pages(path, pages=None):
+    import pdfplumber
+    with pdfplumber.open(path) as pdf:
+        total = len(pdf.pages)
+        for i in _page_indexes(pages, total):
+            page = pdf.pages[i]
+            # extract_text() gives None on pages without any text layer (i.e. scanned images)
+            text = page.extract_text() or ""
+            # Drop the parsed layout of the page, so a long PDF does not keep every page in memory
+            page.close()
+            yield PageRecord(path, i, total, text, {"source": path, "file_path": path, "page": i, "total_pages": total})
+
+
+def _pymupdf_count(path):
+    import fitz
+    with fitz.open(path) as doc:
+        return len(doc)
+
+
+def _pdfplumber_count(path):
+    import pdfplumber
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+# backend -> (generator of the pages of a file, count the pages of a file)
+PAGE_READERS = {
+    "pymupdf": (_pymupdf_pages, _pymupdf_count),
+    "pdfplumber": (_pdfplumber_pages, _pdfplumber_count),
+}
+
+# PyMuPDF reads the text layer directly: many times faster, fine for scoring, summaries and quizzes.
+# pdfplumber rebuilds the lines from the character positions: slower, closer to the visual layout.
+FAST_BACKEND = "pymupdf"
+LAYOUT_BACKEND = "pdfplumber"
+
+
+def register_page_reader(backend, pages_fn, count_fn):
+    """
+    Add an extraction backend.
+
+    Parameters:
+    backend (str): The name of the backend.
+    pages_fn (callable): (path, pages) -> generator of `PageRecord`, with `pages` as in `iter_pages`.
+                         It must be a module-level function, as it is sent by name to the worker processes.
+    count_fn (callable): path -> number of pages.
+
+    Returns:
+    None
+    """
+    PAGE_READERS[backend] = (pages_fn, count_fn)
+
+
+def iter_pages(path, backend=LAYOUT_BACKEND, pages=None):
+    """
+    Yield the pages of a PDF one by one, parsing each page only when it is requested.
+
+    Parameters:
+    path (str): The path to the PDF.
+    backend (str, optional): A key of `PAGE_READERS`. Default is "pdfplumber".
+    pages (iterable, optional): The 0-based indexes of the pages (negative ones count from the end),
+                                i.e. `range(10)` or `[0, -1]`. Default is every page.
+
+    Yields:
+    PageRecord: The pages, in the requested order.
+    """
+    return PAGE_READERS[backend][0](path, pages)
+
+
+def _read_range(pages_fn, path, start, end):
+    """Read a range of pages with a page reader (runs in the worker processes)."""
+    return list(pages_fn(path, range(start, end) if end != sys.maxsize else None))
+
+
+def read_pages(backend, path, start, end):
+    """Read a range of pages with a backend."""
+    return _read_range(PAGE_READERS[backend][0], path, start, end)
+
+
+def page_count(path, backend=FAST_BACKEND):
+    """Return the number of pages of a PDF."""
+    return PAGE_READERS[backend][1](path)
+
+
+# ----------------------------------------------------BUDGET---------------------------------------------------------------------- #
+def token_encoding():
+    """Return the tokenizer of the gpt-4o models (o200k_base), used to count the tokens of a budget."""
+    import tiktoken
+    return tiktoken.get_encoding("o200k_base")
+
+
+def within_budget(texts, max_chars=None, max_tokens=None):
+    """
+    Yield texts until a character and/or token budget is used up, cutting the last one to fit.
+
+    The input is consumed lazily, so when `texts` is a page generator the pages after the budget are
+    never parsed.
+
+    Parameters:
+    texts (iterable): The texts (i.e. page texts).
+    max_chars (int, optional): Maximum number of characters in total. Default is no limit.
+    max_tokens (int, optional): Maximum number of tokens in total (gpt-4o tokenizer). Default is no limit.
+
+    Yields:
+    str: The texts, the last one possibly cut.
+    """
+    encoding = token_encoding() if max_tokens is not None else None
+    chars = tokens = 0
+    for text in texts:
+        if max_chars is not None and chars + len(text) > max_chars:
+            text = text[:max_chars - chars]
+        if encoding is not None:
+            ids = encoding.encode(text, disallowed_special=())
+            if tokens + len(ids) > max_tokens:
+                text = encoding.decode(ids[:max_tokens - tokens])
+                ids = ids[:max_tokens - tokens]
+            tokens += len(ids)
+        chars += len(text)
+        if text:
+            yield text
+        if (max_chars is not None and chars >= max_chars) or (max_tokens is not None and tokens >= max_tokens):
+            return
+
+
+def truncate_text(text, max_chars=None, max_tokens=None):
+    """Cut a text to a character and/or token budget (see `within_budget`)."""
+    if max_chars is None and max_tokens is None:
+        return text
+    return "".join(within_budget([text], max_chars, max_tokens))
+
+
+# ----------------------------------------------------POOL---------------------------------------------------------------------- #
+def _limit_memory(max_memory_mb):
+    """Cap the address space of a worker, so one huge PDF fails alone instead of exhausting the machine."""
+    try:
+        import resource
+        limit = int(max_memory_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        # Not available on Windows: the workers run without a cap
+        pass
+
+
+def make_pool(max_workers=None, max_memory_mb=2048, max_tasks_per_child=50):
+    """
+    Create the process pool of the PDF extraction.
+
+    Workers are spawned (not forked), so the pool can be created from the threads of Streamlit.
+
+    Parameters:
+    max_workers (int, optional): Number of worker processes. Default is the number of CPUs, at most 8.
+    max_memory_mb (int, optional): Address space cap of every worker, in MB (None for no cap). Default is 2048.
+    max_tasks_per_child (int, optional): Tasks after which a worker is replaced, to give back the memory
+                                         a large PDF left behind (Python 3.11+). Default is 50.
+
+    Returns:
+    ProcessPoolExecutor: The pool.
+    """
+    max_workers = max_workers or min(os.cpu_count() or 1, 8)
+    kwargs = {}
+    if max_memory_mb:
+        kwargs.update(initializer=_limit_memory, initargs=(max_memory_mb,))
+    if sys.version_info >= (3, 11) and max_tasks_per_child:
+        kwargs["max_tasks_per_child"] = max_tasks_per_child
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"), **kwargs)
+
+
+# ----------------------------------------------------EXTRACTION---------------------------------------------------------------------- #
+def extract_pages(paths, backend=FAST_BACKEND, pool=None, pages_per_task=16, **pool_kwargs):
+    """
+    Extract the pages of several PDFs in parallel, yielding them as they are ready.
+
+    Every file is cut into tasks of at most `pages_per_task` pages, so the pages of a large file are
+    spread over the workers too. Tasks are submitted largest file first and their pages are yielded as
+    soon as a task finishes: the order is not the page order, use `PageRecord.page` and
+    `PageRecord.total_pages` to reassemble a file.
+
+    Parameters:
+    paths (list): The paths to the PDFs.
+    backend (str, optional): A key of `PAGE_READERS`. Default is "pymupdf".
+    pool (ProcessPoolExecutor, optional): The pool to use. Default is a new pool, closed at the end.
+    pages_per_task (int, optional): Maximum number of pages read by one task. Default is 16.
+    **pool_kwargs: Options of `make_pool` when no pool is given.
+
+    Yields:
+    PageRecord: The pages, in the order they are extracted.
+    """
+    counts = {path: page_count(path, backend) for path in paths}
+    tasks = [(path, start, start + pages_per_task)
+             for path in sorted(counts, key=counts.get, reverse=True)
+             for start in range(0, counts[path], pages_per_task)]
+    own_pool = pool is None
+    pool = pool or make_pool(**pool_kwargs)
+    try:
+        # The reader itself is sent, so the backends registered in this process work in the workers too
+        pages_fn = PAGE_READERS[backend][0]
+        futures = [pool.submit(_read_range, pages_fn, path, start, end) for path, start, end in tasks]
+        for future in as_completed(futures):
+            yield from future.result()
+    finally:
+        if own_pool:
+            pool.shutdown(cancel_futures=True)
+
+
+def extract_text(path, backend=LAYOUT_BACKEND, pool=None, pages=None, max_chars=None, max_tokens=None,
+                 parallel_min_pages=64, pages_per_task=16):
+    """
+    Extract the text of a PDF, joined once, optionally only some pages or only up to a budget.
+
+    With a budget the pages are parsed one at a time and parsing stops as soon as the budget is used
+    up. Without a budget or page selection, a long PDF is read in parallel by the pool.
+
+    Parameters:
+    path (str): The path to the PDF.
+    backend (str, optional): A key of `PAGE_READERS`. Default is "pdfplumber".
+    pool (ProcessPoolExecutor, optional): The pool used for long files. Default is None (always serial).
+    pages (iterable, optional): The 0-based indexes of the pages to read. Default is every page.
+    max_chars (int, optional): Maximum number of characters returned. Default is no limit.
+    max_tokens (int, optional): Maximum number of tokens returned (gpt-4o tokenizer). Default is no limit.
+    parallel_min_pages (int, optional): Page count from which the pool is used. Default is 64.
+    pages_per_task (int, optional): Maximum number of pages read by one task. Default is 16.
+
+    Returns:
+    str: The text of the pages, in page order.
+    """
+    budget = max_chars is not None or max_tokens is not None
+    if pool is not None and not budget and pages is None and page_count(path, backend) >= parallel_min_pages:
+        records = sorted(extract_pages([path], backend, pool, pages_per_task), key=lambda record: record.page)
+        return "".join(record.text for record in records)
+    texts = (record.text for record in iter_pages(path, backend, pages))
+    return "".join(within_budget(texts, max_chars, max_tokens) if budget else texts)
@@ -0,0 +1,178 @@
+import sys
+sys.dont_write_bytecode = True
+
+import hashlib
+import json
+import os
+import threading
+
+from pdf_extract import truncate_text
+
+
+# ----------------------------------------------------PDF_TEXT_STORE---------------------------------------------------------------------- #
+class PdfTextStore:
+    """
+    Content-addressed store for the text extracted from PDF files.
+
+    Each PDF is extracted once and its text is saved under the SHA-256 hash of the file content.
+    The size and modification time of every known path are kept in an index, so an unchanged
+    file is resolved without hashing it again. A file that was replaced or edited gets a new hash
+    and is therefore extracted again automatically.
+
+    Texts are kept per extraction backend, and the first-page previews apart from the full texts.
+
+    Attributes:
+    cache_dir (str): The folder where the extracted texts and the index are saved.
+    extract_fn (callable): The function used to extract the text from a PDF path; called with
+                           `backend`, `pages`, `max_chars` and `max_tokens` keyword arguments.
+    backend (str): The extraction backend used when a call names none (see `pdf_extract.PAGE_READERS`).
+    hits (int): Number of lookups served from the store.
+    misses (int): Number of lookups that had to extract the PDF.
+    """
+
+    def __init__(self, cache_dir, extract_fn, backend="pdfplumber"):
+        self.cache_dir = cache_dir
+        self.extract_fn = extract_fn
+        self.backend = backend
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        """Load the path -> {size, mtime, hash} index from disk (empty if missing or corrupt)."""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        """Atomically write the index to disk."""
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _text_path(self, digest, backend, preview=False):
+        return os.path.join(self.cache_dir, f"{digest}.{backend}{'.page1' if preview else ''}.txt")
+
+    @staticmethod
+    def file_hash(pdf_path, block_size=1 << 20):
+        """
+        Compute the SHA-256 hash of a file, reading it in blocks.
+
+        Parameters:
+        pdf_path (str): The path to the file.
+        block_size (int, optional): Number of bytes read at a time. Default is 1 MiB.
+
+        Returns:
+        str: The hexadecimal digest of the file content.
+        """
+        sha = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def digest(self, pdf_path):
+        """
+        Return the content hash of a PDF, using size and mtime as a fast pre-check.
+
+        Parameters:
+        pdf_path (str): The path to the PDF.
+
+        Returns:
+        str: The content hash of the file.
+        """
+        key = os.path.abspath(pdf_path)
+        stat = os.stat(pdf_path)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                return entry["hash"]
+
+        digest = self.file_hash(pdf_path)
+        with self._lock:
+            self._index[key] = {"size": stat.st_size, "mtime": stat.st_mtime, "hash": digest}
+            self._save_index()
+        return digest
+
+    def add(self, pdf_path, backend=None):
+        """
+        Register a PDF in the store, extracting its text only if that content was never seen.
+
+        Parameters:
+        pdf_path (str): The path to the PDF (i.e. a freshly uploaded file).
+        backend (str, optional): The extraction backend. Default is the backend of the store.
+
+        Returns:
+        str: The content hash under which the text is stored.
+        """
+        backend = backend or self.backend
+        digest = self.digest(pdf_path)
+        if not os.path.exists(self._text_path(digest, backend)):
+            self._extract(pdf_path, digest, backend)
+        return digest
+
+    def get_text(self, pdf_path, max_chars=None, max_tokens=None, backend=None, preview=False):
+        """
+        Return the extracted text of a PDF, extracting and saving it on a miss.
+
+        With a budget, only the beginning of the text that fits in it is returned. On a miss, only
+        that beginning is extracted (the rest of the file is not parsed) and it is not saved, since
+        it is not the full text.
+
+        Parameters:
+        pdf_path (str): The path to the PDF.
+        max_chars (int, optional): Maximum number of characters returned. Default is no limit.
+        max_tokens (int, optional): Maximum number of tokens returned (gpt-4o tokenizer). Default is no limit.
+        backend (str, optional): The extraction backend. Default is the backend of the store.
+        preview (bool, optional): Only the text of the first page (i.e. title, authors, abstract). Default is False.
+
+        Returns:
+        str: The extracted text.
+        """
+        backend = backend or self.backend
+        digest = self.digest(pdf_path)
+        try:
+            with open(self._text_path(digest, backend, preview), "r", encoding="utf-8") as f:
+                text = f.read()
+            with self._lock:
+                self.hits += 1
+            return truncate_text(text, max_chars, max_tokens)
+        except FileNotFoundError:
+            if preview:
+                return truncate_text(self._extract(pdf_path, digest, backend, preview), max_chars, max_tokens)
+            if max_chars is None and max_tokens is None:
+                return self._extract(pdf_path, digest, backend)
+        with self._lock:
+            self.misses += 1
+        return self.extract_fn(pdf_path, backend=backend, max_chars=max_chars, max_tokens=max_tokens)
+
+    def _extract(self, pdf_path, digest, backend, preview=False):
+        """Extract the text (or the first page) of a PDF and save it under its content hash."""
+        text = self.extract_fn(pdf_path, backend=backend, pages=[0] if preview else None)
+        path = self._text_path(digest, backend, preview)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.misses += 1
+        return text
+
+    def stats(self):
+        """
+        Return the hit/miss counters of the store.
+
+        Returns:
+        dict: Number of hits, misses and the hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,166 @@
+import sys
+sys.dont_write_bytecode = True
+
+import threading
+from dataclasses import dataclass, field
+
+import database
+
+
+# ----------------------------------------------------SNAPSHOT---------------------------------------------------------------------- #
+@dataclass(frozen=True)
+class UserProfile:
+    """
+    Snapshot of everything the chat needs to know about a user.
+
+    Attributes:
+    user_id (int): The ID of the user.
+    version (int): Version stamp of the snapshot; it changes every time the profile is invalidated.
+    gender (str): The gender of the user.
+    language (str): The primary language of the user.
+    current_courses (list): (course, topic) pairs of the courses the user is enrolled in.
+    previous_courses (list): (course, topic) pairs of the courses the user was enrolled in.
+    preferred_time (str): The preferred time to study (HH-MM), if any.
+    min_per_day (int): The minimum number of minutes the user wants to study per day, if any.
+    """
+    user_id: int
+    version: int
+    gender: str
+    language: str
+    current_courses: list = field(default_factory=list)
+    previous_courses: list = field(default_factory=list)
+    preferred_time: str = None
+    min_per_day: int = None
+
+    @property
+    def system_context(self):
+        """The system message that opens every conversation with this user."""
+        return f"""You are a TeacherBot named Aurora.
+                                    You speak in very motherly tone and you are trying to help
+                                    user with their struggles in studying. User's gender is {self.gender}
+                                    User's preffered language of speaking is {self.language}, explain only in
+                                    {self.language} unless user asks to speak another language or speaks another language.
+                                    The user is enrolled in following courses {self.current_courses}.
+                                    The user was enrolled in following courses
+                                    {self.previous_courses}"""
+
+
+def load_profile(user_id, version):
+    """
+    Build the profile snapshot of a user from the database.
+
+    Parameters:
+    user_id (int): The ID of the user.
+    version (int): The version stamp given to the snapshot.
+
+    Returns:
+    UserProfile: The snapshot of the user's profile.
+    """
+    user_courses_curr = database.fetch_all("""SELECT cs.Name, t.Name
+                                              FROM user_courses u
+                                              JOIN course cs ON u.CourseID = cs.CourseID
+                                              JOIN course_topic ct ON cs.CourseID = ct.CourseID
+                                              JOIN topic t ON ct.TopicID = t.TopicID
+                                              WHERE u.UserID = ?""", (user_id,))
+
+    language = database.fetch_value("""SELECT l.Language
+                                       FROM user_language ul
+                                       JOIN languages l ON ul.LanguageID = l.LanguageID
+                                       WHERE ul.UserID = ? AND ul.PrimaryLanguage = 1""", (user_id,))
+
+    previous_courses = database.fetch_all("""SELECT cs.Name, t.Name
+                                             FROM previous_courses u
+                                             JOIN course cs ON u.CourseID = cs.CourseID
+                                             JOIN course_topic ct ON cs.CourseID = ct.CourseID
+                                             JOIN topic t ON ct.TopicID = t.TopicID
+                                             WHERE u.UserID = ?""", (user_id,))
+
+    client = database.get_client(user_id)
+    gender = client.gender if client else None
+    preferred_time = client.preferred_time if client else None
+    min_per_day = client.min_per_day if client else None
+
+    return UserProfile(user_id=user_id, version=version, gender=gender, language=language,
+                       current_courses=user_courses_curr, previous_courses=previous_courses,
+                       preferred_time=preferred_time, min_per_day=min_per_day)
+
+
+# ----------------------------------------------------CACHE---------------------------------------------------------------------- #
+class ProfileCache:
+    """
+    Process-wide cache of user profile snapshots, keyed by UserID.
+
+    A snapshot is built once (per login) and reused on every Streamlit rerun. Every code path that
+    writes to a user's profile must call `invalidate` (or `patch`), which bumps the version stamp
+    of that user so the next `get` returns fresh data.
+
+    Attributes:
+    loader (callable): Function (user_id, version) -> UserProfile building a snapshot.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self._snapshots = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        Return the snapshot of a user, building it if missing or outdated.
+
+        Parameters:
+        user_id (int): The ID of the user.
+
+        Returns:
+        UserProfile: The current snapshot of the user's profile.
+        """
+        with self._lock:
+            version = self._versions.setdefault(user_id, 0)
+            snapshot = self._snapshots.get(user_id)
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        snapshot = self.loader(user_id, version)
+        with self._lock:
+            # Only keep it if nobody invalidated the profile while it was being built
+            if self._versions.get(user_id) == version:
+                self._snapshots[user_id] = snapshot
+        return snapshot
+
+    def invalidate(self, user_id):
+        """
+        Drop the snapshot of a user and bump its version stamp.
+
+        Parameters:
+        user_id (int): The ID of the user whose profile changed.
+
+        Returns:
+        int: The new version stamp.
+        """
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._snapshots.pop(user_id, None)
+            return self._versions[user_id]
+
+    def patch(self, user_id, **changes):
+        """
+        Update fields of a cached snapshot in place of a full rebuild.
+
+        Parameters:
+        user_id (int): The ID of the user whose profile changed.
+        **changes: The snapshot fields to replace.
+
+        Returns:
+        None
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(user_id)
+            version = self._versions.get(user_id, 0) + 1
+            self._versions[user_id] = version
+            if snapshot is None:
+                return
+            values = {**snapshot.__dict__, **changes, "version": version}
+            self._snapshots[user_id] = UserProfile(**values)
+
+
+profile_cache = ProfileCache(load_profile)
@@ -0,0 +1,158 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+
+import database
+
+
+# ----------------------------------------------------ROWS---------------------------------------------------------------------- #
+@dataclass(frozen=True)
+class BankedQuestion:
+    """A row of the `question_bank` table, with the fields of a `QuizzQuestion`."""
+    question_id: int
+    question: str
+    options: str
+    answer: str
+
+
+def section_hash(section):
+    """Return the SHA-256 hash of the text of a document section."""
+    return hashlib.sha256(section.encode("utf-8")).hexdigest()
+
+
+# ----------------------------------------------------QUESTION_BANK---------------------------------------------------------------------- #
+class QuestionBank:
+    """
+    Store of the generated quiz questions, in the `question_bank` table of the app database.
+
+    Questions are saved with the content hash of their document, the hash of the section they were
+    generated from and the id of their topic, so a quiz on a document that was already quizzed (by any
+    user) reuses its questions. `question_seen` records the questions shown to every user, so a user is
+    only served questions they have not seen, and `quiz_requests` records where the questions of every
+    quiz came from.
+
+    Attributes:
+    db_path (str): The path to the database.
+    """
+
+    def __init__(self, db_path=database.DB_PATH):
+        self.db_path = db_path
+
+    def sample(self, document_hash, section, user_id, limit):
+        """
+        Draw random questions of a section that a user has not seen yet.
+
+        Parameters:
+        document_hash (str): The content hash of the document.
+        section (str): The content hash of the section.
+        user_id (int or None): The user (None draws among all the questions).
+        limit (int): Maximum number of questions.
+
+        Returns:
+        list: The `BankedQuestion`s.
+        """
+        return database.fetch_all("""SELECT QuestionID, Question, Options, Answer FROM question_bank
+                                     WHERE DocumentHash = ? AND SectionHash = ?
+                                       AND QuestionID NOT IN (SELECT QuestionID FROM question_seen WHERE UserID = ?)
+                                     ORDER BY RANDOM() LIMIT ?""",
+                                  (document_hash, section, user_id, limit), row_type=BankedQuestion, db_path=self.db_path)
+
+    def add(self, document_hash, section, topic_id, questions, user_id=None):
+        """
+        Save new questions of a section (a question already saved for that section is kept once).
+
+        Parameters:
+        document_hash (str): The content hash of the document.
+        section (str): The content hash of the section.
+        topic_id (int or None): The `topic` id of the document.
+        questions (list): The questions (objects with `question`, `options` and `answer` attributes).
+        user_id (int, optional): The user the questions are for: the saved ones they have already seen are
+                                 not returned (a question generated again may match one of them).
+
+        Returns:
+        tuple: (the saved questions as `BankedQuestion`s, in the same order, number of rows inserted).
+        """
+        now = time.time()
+        with database.transaction(self.db_path) as cursor:
+            cursor.executemany("""INSERT OR IGNORE INTO question_bank
+                                  (DocumentHash, SectionHash, TopicID, Question, Options, Answer, CreatedAt)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                               [(document_hash, section, topic_id, q.question, q.options, q.answer, now) for q in questions])
+            # Summed over the rows of executemany; an ignored duplicate counts 0
+            inserted = max(cursor.rowcount, 0)
+        texts = [q.question for q in questions]
+        saved = {row.question: row for row in database.fetch_all(
+            f"""SELECT QuestionID, Question, Options, Answer FROM question_bank
+                WHERE DocumentHash = ? AND SectionHash = ? AND Question IN ({database.placeholders(texts)})
+                  AND QuestionID NOT IN (SELECT QuestionID FROM question_seen WHERE UserID = ?)""",
+            (document_hash, section, *texts, user_id), row_type=BankedQuestion, db_path=self.db_path)}
+        return [saved[text] for text in dict.fromkeys(texts) if text in saved], inserted
+
+    def mark_seen(self, user_id, question_ids):
+        """Record that questions were shown to a user."""
+        now = time.time()
+        with database.transaction(self.db_path) as cursor:
+            cursor.executemany("INSERT OR IGNORE INTO question_seen (UserID, QuestionID, SeenAt) VALUES (?, ?, ?)",
+                               [(user_id, question_id, now) for question_id in question_ids])
+
+    def record_request(self, user_id, document_hash, from_bank, generated, llm_calls, llm_calls_avoided):
+        """
+        Record where the questions of a quiz came from.
+
+        Parameters:
+        user_id (int or None): The user who asked for the quiz.
+        document_hash (str): The content hash of the document.
+        from_bank (int): Number of questions drawn from the bank.
+        generated (int): Number of questions generated.
+        llm_calls (int): Number of generation requests sent.
+        llm_calls_avoided (int): Number of sections fully served from the bank.
+
+        Returns:
+        None
+        """
+        with database.transaction(self.db_path) as cursor:
+            cursor.execute("""INSERT INTO quiz_requests
+                              (UserID, DocumentHash, RequestedAt, FromBank, Generated, LLMCalls, LLMCallsAvoided)
+                              VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                           (user_id, document_hash, time.time(), from_bank, generated, llm_calls, llm_calls_avoided))
+
+    def stats(self, since=None):
+        """
+        Report the size of the bank and how much the quizzes drew from it.
+
+        Parameters:
+        since (float, optional): Only count the quizzes asked after this Unix time. Default is all of them.
+
+        Returns:
+        dict: Questions and documents in the bank, quizzes, questions from the bank and generated,
+              bank hit rate, LLM calls sent and avoided.
+        """
+        questions, documents = database.fetch_one("SELECT COUNT(*), COUNT(DISTINCT DocumentHash) FROM question_bank",
+                                                  db_path=self.db_path)
+        quizzes, from_bank, generated, calls, avoided = database.fetch_one(
+            """SELECT COUNT(*), COALESCE(SUM(FromBank), 0), COALESCE(SUM(Generated), 0),
+                      COALESCE(SUM(LLMCalls), 0), COALESCE(SUM(LLMCallsAvoided), 0)
+               FROM quiz_requests WHERE RequestedAt >= ?""", (since or 0,), db_path=self.db_path)
+        return {"questions": questions,
+                "documents": documents,
+                "quizzes": quizzes,
+                "from_bank": from_bank,
+                "generated": generated,
+                "hit_rate": from_bank / (from_bank + generated) if from_bank + generated else 0.0,
+                "llm_calls": calls,
+                "llm_calls_avoided": avoided}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the question bank hit rate and the LLM calls it saved.")
+    parser.add_argument("--db", default=database.DB_PATH, help="Path to the SQLite database")
+    parser.add_argument("--days", type=float, default=None, help="Only count the quizzes of the last N days")
+    args = parser.parse_args()
+
+    since = time.time() - args.days * 86400 if args.days else None
+    print(json.dumps(QuestionBank(args.db).stats(since), indent=2))
@@ -0,0 +1,177 @@
+import sys
+sys.dont_write_bytecode = True
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from langchain_core.exceptions import OutputParserException
+from pydantic import ValidationError
+
+from question_bank import section_hash
+from summarize import split_sections
+
+
+# ----------------------------------------------------SECTIONS---------------------------------------------------------------------- #
+def pick_sections(sections, n_sections):
+    """
+    Choose at most `n_sections` sections spread evenly over a document.
+
+    Parameters:
+    sections (list): The sections of the document, in order.
+    n_sections (int): Maximum number of sections.
+
+    Returns:
+    list: (index in the document, section) pairs, in order.
+    """
+    if len(sections) <= n_sections:
+        return list(enumerate(sections))
+    if n_sections == 1:
+        return [(len(sections) // 2, sections[len(sections) // 2])]
+    indexes = sorted({round(i * (len(sections) - 1) / (n_sections - 1)) for i in range(n_sections)})
+    return [(i, sections[i]) for i in indexes]
+
+
+# ----------------------------------------------------DE-DUPLICATION---------------------------------------------------------------------- #
+def drop_near_duplicates(questions, encode_fn, threshold=0.9):
+    """
+    Remove the questions that are near-duplicates of an earlier one.
+
+    Parameters:
+    questions (list): The questions (objects with a `question` attribute), in order of preference.
+    encode_fn (callable): Function mapping a list of texts to an (n, dim) array of embeddings.
+    threshold (float, optional): Cosine similarity from which two questions are duplicates. Default is 0.9.
+
+    Returns:
+    list: The kept questions, in their order.
+    """
+    if len(questions) < 2:
+        return list(questions)
+    vectors = np.asarray(encode_fn([q.question for q in questions]), dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+    kept = []
+    for i in range(len(questions)):
+        if not kept or similarity[i, kept].max() < threshold:
+            kept.append(i)
+    return [questions[i] for i in kept]
+
+
+# ----------------------------------------------------ENGINE---------------------------------------------------------------------- #
+class QuizEngine:
+    """
+    Quiz generation over the whole of a document, at the latency of one request.
+
+    The document is split into sections of at most `section_tokens` tokens and at most `max_sections`
+    of them, spread evenly over the document, are sent at the same time (`max_workers` requests in
+    flight), each asked for its share of the questions. The questions of all the sections are then
+    de-duplicated by the cosine similarity of their embeddings and interleaved section by section, so
+    a quiz cut to `n_questions` still covers the whole document.
+
+    With a question bank, every section first draws the questions the user has not seen from the bank
+    and only the shortfall is generated; the generated questions are saved in the bank for the next quiz.
+
+    Attributes:
+    generate_fn (callable): (section text, number of questions) -> list of questions, i.e. with `QuizzChain`.
+    encode_fn (callable): Function mapping a list of texts to an (n, dim) array of embeddings.
+    n_questions (int): Maximum number of questions of a quiz.
+    max_sections (int): Maximum number of sections a quiz is drawn from.
+    section_tokens (int): Maximum number of tokens of a section.
+    max_workers (int): Maximum number of requests in flight.
+    oversample (float): Extra questions asked for, to make up for the duplicates dropped.
+    dedupe_threshold (float): Cosine similarity from which two questions are duplicates.
+    bank (QuestionBank): The store of the generated questions (None to always generate).
+    """
+
+    def __init__(self, generate_fn, encode_fn, n_questions=10, max_sections=5, section_tokens=3000, max_workers=5,
+                 oversample=1.3, dedupe_threshold=0.9, bank=None):
+        self.generate_fn = generate_fn
+        self.encode_fn = encode_fn
+        self.n_questions = n_questions
+        self.max_sections = max_sections
+        self.section_tokens = section_tokens
+        self.max_workers = max_workers
+        self.oversample = oversample
+        self.dedupe_threshold = dedupe_threshold
+        self.bank = bank
+
+    def sections(self, text):
+        """Return the (index, section) pairs a quiz on `text` is drawn from."""
+        return pick_sections(split_sections(text, self.section_tokens), self.max_sections)
+
+    def _generate(self, section, n_questions):
+        """Generate the questions of a section; a section whose answer cannot be parsed gives no question."""
+        try:
+            return list(self.generate_fn(section, n_questions))
+        except (OutputParserException, ValidationError):
+            # The other sections still make a quiz; API errors (auth, rate limit, network) are raised
+            return []
+
+    def generate(self, text, n_questions=None, user_id=None, document_hash=None, topic_id=None):
+        """
+        Create a quiz on a document.
+
+        Parameters:
+        text (str): The text of the document.
+        n_questions (int, optional): Maximum number of questions. Default is the `n_questions` of the engine.
+        user_id (int, optional): The user, whose seen questions are not drawn from the bank again.
+        document_hash (str, optional): The content hash of the document; the bank is only used with it.
+        topic_id (int, optional): The `topic` id the new questions are saved with.
+
+        Returns:
+        list: The questions, interleaved section by section (may be fewer than asked, or empty if no
+              section gave a question).
+        """
+        n_questions = n_questions or self.n_questions
+        sections = [section for _, section in self.sections(text)]
+        if not sections:
+            return []
+        per_section = max(1, math.ceil(n_questions * self.oversample / len(sections)))
+
+        # The bank is read and written from this thread: only the generation runs in the pool
+        use_bank = self.bank is not None and document_hash is not None
+        keys = [section_hash(section) for section in sections]
+        banked = [self.bank.sample(document_hash, key, user_id, per_section) if use_bank else [] for key in keys]
+        shortfalls = [per_section - len(questions) for questions in banked]
+        todo = [i for i, shortfall in enumerate(shortfalls) if shortfall > 0]
+        generated = [[] for _ in sections]
+        inserted = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(todo)))) as pool:
+            for i, questions in zip(todo, pool.map(lambda i: self._generate(sections[i], shortfalls[i]), todo)):
+                if use_bank and questions:
+                    saved, count = self.bank.add(document_hash, keys[i], topic_id, questions, user_id)
+                    # A question generated again may be one of the unseen ones already drawn for this section
+                    drawn = {q.question_id for q in banked[i]}
+                    questions = [q for q in saved if q.question_id not in drawn]
+                    inserted += count
+                generated[i] = questions
+        by_section = [old + new for old, new in zip(banked, generated)]
+
+        # Round-robin over the sections, so the first questions, the ones kept, cover the whole document
+        interleaved = [questions[rank] for rank in range(max(len(q) for q in by_section))
+                       for questions in by_section if rank < len(questions)]
+        quiz = drop_near_duplicates(interleaved, self.encode_fn, self.dedupe_threshold)[:n_questions]
+
+        if use_bank:
+            # Also recorded when no question came out, as the requests were sent
+            if user_id is not None:
+                self.bank.mark_seen(user_id, [q.question_id for q in quiz])
+            self.bank.record_request(user_id, document_hash,
+                                     from_bank=sum(len(questions) for questions in banked),
+                                     generated=inserted,
+                                     llm_calls=len(todo), llm_calls_avoided=len(sections) - len(todo))
+        return quiz
+
+
+def format_quiz(questions):
+    """
+    Write a quiz as chat text: the numbered questions with their options, then the answers.
+
+    Parameters:
+    questions (list): The questions (objects with `question`, `options` and `answer` attributes).
+
+    Returns:
+    str: The quiz, in Markdown.
+    """
+    body = "\n\n".join(f"**{i}. {q.question}**\n\n{q.options}" for i, q in enumerate(questions, 1))
+    answers = ", ".join(f"{i}. {q.answer}" for i, q in enumerate(questions, 1))
+    return f"{body}\n\n**Answers:** {answers}"
@@ -0,0 +1,156 @@
+import sys
+sys.dont_write_bytecode = True
+
+import sqlite3
+import threading
+import time
+
+import database
+
+
+# ----------------------------------------------------LOOKUP_TABLE---------------------------------------------------------------------- #
+class LookupTable:
+    """
+    Bidirectional name <-> id index of one reference table.
+
+    Names are matched case-insensitively. When several rows share a name (i.e. the same course given by
+    two providers) the name resolves to the lowest id, like `SELECT ... WHERE Name = ?` did.
+
+    Attributes:
+    ids (dict): Lower-cased name -> id.
+    names (dict): Id -> name, as stored in the database.
+    extras (dict): Id -> tuple of the extra columns of the row (i.e. the country of a city).
+    """
+
+    def __init__(self, rows):
+        self.ids = {}
+        self.names = {}
+        self.extras = {}
+        for id_, name, *extra in sorted(rows, key=lambda row: row[0]):
+            self.names[id_] = name
+            self.extras[id_] = tuple(extra)
+            if name is not None:
+                self.ids.setdefault(name.lower(), id_)
+
+    def __getitem__(self, name):
+        """Return the id of a name, raising KeyError if it is unknown."""
+        return self.ids[name.lower()]
+
+    def __contains__(self, name):
+        return isinstance(name, str) and name.lower() in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+    def id_of(self, name, default=None):
+        """Return the id of a name, or `default` if it is unknown."""
+        if name is None:
+            return default
+        return self.ids.get(name.lower(), default)
+
+    def name_of(self, id_, default=None):
+        """Return the name of an id, or `default` if it is unknown."""
+        return self.names.get(id_, default)
+
+    def all_names(self):
+        """Return the distinct names of the table, sorted."""
+        return sorted({name for name in self.names.values() if name is not None})
+
+
+# ----------------------------------------------------REFERENCE_DATA---------------------------------------------------------------------- #
+TABLES = {
+    "cities": "SELECT CityID, CityName, Country FROM city",
+    "languages": "SELECT LanguageID, Language FROM languages",
+    "learning_styles": "SELECT LearningID, Name FROM learning_style",
+    "courses": "SELECT CourseID, Name FROM course",
+    "topics": "SELECT TopicID, Name FROM topic",
+}
+
+
+class ReferenceData:
+    """
+    Process-wide index of the lookup tables (cities, languages, learning styles, courses and topics).
+
+    The tables are loaded once, on first use, and shared by every session and thread. Resolving a name
+    is then a dict hit instead of a table scan. The index keeps its own connection and compares
+    `PRAGMA data_version` (at most every `check_interval` seconds): it changes whenever another connection
+    commits to the database, in which case the tables are loaded again. Writes that must be visible
+    immediately can call `invalidate`.
+
+    Attributes:
+    db_path (str): The path to the database.
+    check_interval (float): Minimum number of seconds between two version checks.
+    """
+
+    def __init__(self, db_path=database.DB_PATH, check_interval=1.0):
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self._tables = None
+        self._version = None
+        self._checked_at = 0.0
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _data_version(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def _load(self):
+        """Load every lookup table through the index's connection."""
+        return {name: LookupTable(self._connection.execute(sql).fetchall()) for name, sql in TABLES.items()}
+
+    def _current(self):
+        """Return the loaded tables, reloading them if the database changed since the last load."""
+        now = time.monotonic()
+        tables = self._tables
+        if tables is not None and now - self._checked_at < self.check_interval:
+            return tables
+
+        with self._lock:
+            version = self._data_version()
+            if self._tables is None or version != self._version:
+                self._tables = self._load()
+                self._version = version
+            self._checked_at = now
+            return self._tables
+
+    def invalidate(self):
+        """Drop the loaded tables, so the next lookup loads them again."""
+        with self._lock:
+            self._tables = None
+
+    def table(self, name):
+        """
+        Return the index of a lookup table.
+
+        Parameters:
+        name (str): One of "cities", "languages", "learning_styles", "courses" or "topics".
+
+        Returns:
+        LookupTable: The current index of the table.
+        """
+        return self._current()[name]
+
+    @property
+    def cities(self):
+        return self.table("cities")
+
+    @property
+    def languages(self):
+        return self.table("languages")
+
+    @property
+    def learning_styles(self):
+        return self.table("learning_styles")
+
+    @property
+    def courses(self):
+        return self.table("courses")
+
+    @property
+    def topics(self):
+        return self.table("topics")
+
+
+reference_data = ReferenceData()
@@ -2,15 +2,22 @@ import sys
 sys.dont_write_bytecode = True
 
 from dotenv import load_dotenv
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer, util
 import os
-import pdfplumber
 import streamlit as st
-from selenium import webdriver      # automate web browser interaction
-from selenium.webdriver.common.by import By
+from pdf_text_store import PdfTextStore
+from pdf_extract import FAST_BACKEND, LAYOUT_BACKEND, PAGE_READERS, extract_text
+from doc_index import DocumentIndex
+from summarize import MapReduceSummarizer
+from quiz_engine import QuizEngine, format_quiz
+from question_bank import QuestionBank
+from reference_data import reference_data
+from resources import registry
+from llm_cache import llm_cache, make_key
+import threading
 import time
-from selenium.webdriver.chrome.options import Options
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
 
 # ----------------------------------------------------ENVIRONMENT-------------------------------------------------------------------------- #
 # Load the API key from the environment variables
@@ -18,13 +25,9 @@ load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 if api_key is None:
     raise ValueError("The OPENAI_API_KEY environment variable is not set.")
-client = OpenAI()
+# The OpenAI client and the embedding model are built on first use, see `resources.registry`
 
 # ----------------------------------------------------FUNCTIONS-------------------------------------------------------------------------- #
-# Load a pre-trained model for embeddings
-model = SentenceTransformer('all-MiniLM-L6-v2')  # You can choose another model based on your use case
-
-
 def compute_similarity(user_input_text, pdf_text):
     """
     Compute similarity between user input and PDF text.
@@ -36,6 +39,9 @@ def compute_similarity(user_input_text, pdf_text):
     Returns:
     float: The similarity score between the user input and the PDF text.
     """
+    from sentence_transformers import util
+    model = registry.get("embedding_model")
+
     # Generate embeddings
     user_embedding = model.encode(user_input_text, convert_to_tensor=True)
     pdf_embedding = model.encode(pdf_text, convert_to_tensor=True)
@@ -47,7 +53,7 @@ def compute_similarity(user_input_text, pdf_text):
     return similarity.item()
 
 
-def get_completion_from_messages(messages, model="gpt-4o-mini", temperature=0.15, **kwargs):
+def get_completion_from_messages(messages, model="gpt-4o-mini", temperature=0.15, cache_route=None, **kwargs):
     """
     Generate a completion response from a chat model based on the provided messages.
 
@@ -56,21 +62,142 @@ def get_completion_from_messages(messages, model="gpt-4o-mini", temperature=0.15
     model (str, optional): The model to use for generating the response. Default is "gpt-4o-mini".
     temperature (float, optional): The degree of randomness in the model's output. 
                                    Lower values make the output more deterministic. Default is 0.15.
+    cache_route (str, optional): Name under which the call may be served from the response cache
+                                 (see `llm_cache`). Default is None, i.e. never cached.
     **kwargs: Additional parameters to customize the API request.
 
     Returns:
     str: The content of the model's response message.
     """
+    use_cache = llm_cache.should_cache(cache_route, temperature)
+    if use_cache:
+        key = make_key(model, messages, temperature, **kwargs)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+
     # Create a chat completion request to the OpenAI API
-    response = client.chat.completions.create(
+    response = registry.get("openai_client").chat.completions.create(
         model=model,
         messages=messages,
         temperature=temperature,  # this is the degree of randomness of the model's output
         **kwargs,
     )
 
+    content = response.choices[0].message.content
+    if use_cache and content is not None:
+        usage = response.usage
+        llm_cache.put(key, content, route=cache_route, model=model,
+                      prompt_tokens=usage.prompt_tokens if usage else 0,
+                      completion_tokens=usage.completion_tokens if usage else 0)
+
     # Return the content of the first choice from the response
-    return response.choices[0].message.content
+    return content
+
+
+def stream_completion_from_messages(messages, model="gpt-4o-mini", temperature=0.15, cache_route=None, **kwargs):
+    """
+    Stream a completion response from a chat model, delta by delta.
+
+    Same parameters as `get_completion_from_messages`, but the text is yielded as soon as it is
+    generated, so the user sees the beginning of long answers without waiting for the end.
+    A cached response is yielded at once; a streamed one is only cached if it was read to the end.
+
+    Parameters:
+    messages (list): A list of message dictionaries that represent the conversation history.
+    model (str, optional): The model to use for generating the response. Default is "gpt-4o-mini".
+    temperature (float, optional): The degree of randomness in the model's output. Default is 0.15.
+    cache_route (str, optional): Name under which the call may be served from the response cache.
+    **kwargs: Additional parameters to customize the API request.
+
+    Yields:
+    str: The successive pieces of the model's response message.
+    """
+    use_cache = llm_cache.should_cache(cache_route, temperature)
+    if use_cache:
+        key = make_key(model, messages, temperature, **kwargs)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        # Ask for the token usage in the last chunk, to account for the tokens later hits save
+        kwargs = {**kwargs, "stream_options": {"include_usage": True}}
+
+    stream = registry.get("openai_client").chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        stream=True,
+        **kwargs,
+    )
+
+    pieces, usage = [], None
+    for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            pieces.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+
+    if use_cache and pieces:
+        llm_cache.put(key, "".join(pieces), route=cache_route, model=model,
+                      prompt_tokens=usage.prompt_tokens if usage else 0,
+                      completion_tokens=usage.completion_tokens if usage else 0)
+
+
+class TimeToFirstTokenStats:
+    """
+    Process-wide record of the time to first token, per route.
+
+    Attributes:
+    samples (dict): Route name -> list of times to first token, in seconds.
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds):
+        with self._lock:
+            self.samples.setdefault(str(route), []).append(seconds)
+
+    def summary(self):
+        """
+        Summarize the recorded times.
+
+        Returns:
+        dict: Route name -> count, mean, p50 and p95 of the time to first token (seconds).
+        """
+        with self._lock:
+            samples = {route: sorted(times) for route, times in self.samples.items()}
+        return {route: {"count": len(times),
+                        "mean": sum(times) / len(times),
+                        "p50": times[len(times) // 2],
+                        "p95": times[min(len(times) - 1, int(len(times) * 0.95))]}
+                for route, times in samples.items()}
+
+
+ttft_stats = TimeToFirstTokenStats()
+
+
+def record_time_to_first_token(route, chunks, start):
+    """
+    Pass the chunks of a response through, recording when the first one arrives.
+
+    Parameters:
+    route (str): The name of the route producing the response.
+    chunks (iterator): The pieces of the response.
+    start (float): `time.perf_counter()` when the user message was received.
+
+    Yields:
+    str: The same pieces, unchanged.
+    """
+    first = True
+    for chunk in chunks:
+        if first:
+            ttft_stats.record(route, time.perf_counter() - start)
+            first = False
+        yield chunk
 
 
 def injection_check(user_input, delimiter="####"):
@@ -116,7 +243,7 @@ def injection_check(user_input, delimiter="####"):
     ]
 
     # Get the model's reponse to check for prompt injection
-    response = get_completion_from_messages(messages, max_tokens=1)
+    response = get_completion_from_messages(messages, max_tokens=1, cache_route="injection_check")
 
     # Return as a boolean whether prompt injection is indicated or not
     return response.upper() == "Y"
@@ -139,19 +266,88 @@ def harmful_check(user_input, self_harm=False):
     """
 
     # Send the user input to the moderation model for analysis
-    response = client.moderations.create(input=user_input, model="text-moderation-latest")
-    moderation_output = response.results[0]
+    moderation_output = moderate(user_input)
 
     # Check for self-harm-related categories if `self_harm` is true
     if self_harm:
-        return (moderation_output.categories.self_harm_intent or
-                moderation_output.categories.self_harm or
-                moderation_output.categories.self_harm_instructions)
+        return is_self_harm(moderation_output)
 
     # Return whether input flagged was harmful or not
     return moderation_output.flagged
 
 
+def moderate(user_input):
+    """
+    Send the user input to the moderation model, in a single request.
+
+    Parameters:
+    user_input (str): The input message from the user.
+
+    Returns:
+    Moderation: The moderation result (flag and categories) for the input.
+    """
+    response = registry.get("openai_client").moderations.create(input=user_input, model="text-moderation-latest")
+    return response.results[0]
+
+
+def is_self_harm(moderation_output):
+    """
+    Check the self-harm categories of a moderation result.
+
+    Parameters:
+    moderation_output (Moderation): The result returned by `moderate`.
+
+    Returns:
+    bool: True if any self-harm category was detected, False otherwise.
+    """
+    return bool(moderation_output.categories.self_harm_intent or
+                moderation_output.categories.self_harm or
+                moderation_output.categories.self_harm_instructions)
+
+
+@dataclass(frozen=True)
+class SafetyVerdict:
+    """
+    Result of the safety gate for one user message.
+
+    Attributes:
+    injection (bool): True if the user is attempting prompt injection.
+    harmful (bool): True if the moderation model flagged the message.
+    self_harm (bool): True if any self-harm category was detected.
+    """
+    injection: bool
+    harmful: bool
+    self_harm: bool
+
+
+# Shared pool for the safety checks, so no threads are created per message
+_safety_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="aurora-safety")
+
+
+def safety_gate(user_input, delimiter="####"):
+    """
+    Run every safety check on a user message concurrently and return a single verdict.
+
+    The prompt-injection check (a chat completion) and one moderation request run at the same time,
+    and the categories of that moderation request are reused for both the harmful and the self-harm
+    decisions. The gate therefore costs about one API round trip instead of three sequential ones.
+
+    Parameters:
+    user_input (str): The input message from the user.
+    delimiter (str, optional): A string used to delimit the user input in the injection check. Default is "####".
+
+    Returns:
+    SafetyVerdict: The injection, harmful and self-harm decisions for the message.
+    """
+    injection = _safety_pool.submit(injection_check, user_input, delimiter)
+    moderation = _safety_pool.submit(moderate, user_input)
+
+    moderation_output = moderation.result()
+    return SafetyVerdict(injection=injection.result(),
+                         harmful=bool(moderation_output.flagged),
+                         self_harm=is_self_harm(moderation_output))
+
+
 def preprocess_text(text):
     """
     Preprocess the extracted text to remove extra spaces and new lines.
@@ -166,27 +362,156 @@ def preprocess_text(text):
     return text
 
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a PDF file using `pdfplumber`.
+# Extraction backend of every route (and of the relevance scoring of the uploads): the fast text layer
+# where plain text is enough, the layout-faithful one where the arrangement of the page matters.
+# AURORA_PDF_BACKEND=<backend> uses one backend everywhere.
+PDF_BACKENDS = {
+    "scoring": FAST_BACKEND,
+    "creating_quizzes": FAST_BACKEND,
+    "creating_flashcards": FAST_BACKEND,
+    "summarize_file": FAST_BACKEND,
+    "generate_citation": LAYOUT_BACKEND,  # reads the first page only: title block and authors
+    "aurora_related": LAYOUT_BACKEND,
+}
 
-    The function opens a PDF file and extracts text from each page,
-    concatenating the text into a single string.
+
+def pdf_backend(route):
+    """
+    Return the PDF extraction backend of a route.
+
+    Parameters:
+    route (str): The route name (or "scoring" for the relevance scoring of the uploads).
+
+    Returns:
+    str: A key of `pdf_extract.PAGE_READERS`.
+    """
+    backend = os.getenv("AURORA_PDF_BACKEND") or PDF_BACKENDS.get(route, FAST_BACKEND)
+    if backend not in PAGE_READERS:
+        raise ValueError(f"Unknown PDF backend: {backend} (expected one of {sorted(PAGE_READERS)})")
+    return backend
+
+
+def extract_text_from_pdf(pdf_path, backend=LAYOUT_BACKEND, pages=None, max_chars=None, max_tokens=None):
+    """Extract text from a PDF file.
+
+    The pages are joined once at the end. With a budget or a page selection, the pages are read here
+    one by one and the parsing stops as soon as the budget is used up. Otherwise the pages of a long
+    PDF are read in parallel by the PDF process pool; a short one is read here, page by page, as
+    starting the workers would cost more than it saves.
 
     Parameters:
     pdf_path (str): The file path to the PDF from which text will be extracted.
+    backend (str, optional): The extraction backend, i.e. `pdf_backend(route)`. Default is "pdfplumber".
+    pages (iterable, optional): The 0-based indexes of the pages to read, i.e. [0] for a preview. Default is every page.
+    max_chars (int, optional): Maximum number of characters to extract. Default is no limit.
+    max_tokens (int, optional): Maximum number of tokens to extract (gpt-4o tokenizer). Default is no limit.
 
     Returns:
-    str: The extracted text from the entire PDF.
+    str: The extracted text from the PDF (or from its beginning, within the budget).
     """
+    kwargs = {"pages": pages, "max_chars": max_chars, "max_tokens": max_tokens}
+    try:
+        return extract_text(pdf_path, backend=backend, pool=registry.get("pdf_pool"), **kwargs)
+    except BrokenProcessPool:
+        # The workers could not start (or died): read the file here
+        return extract_text(pdf_path, backend=backend, **kwargs)
 
-    # Open pdf using `pdfplumber` and append extracted text from current page by iterating through each page 
-    with pdfplumber.open(pdf_path) as pdf:
-        text = ""
-        for page in pdf.pages:
-            text += page.extract_text()
 
-    # Return the whole extracted text from the PDF
-    return text
+# Extracted texts are saved once per file content and backend, and shared by every route
+pdf_text_store = PdfTextStore(os.path.join("files", "cache", "pdf_text"), extract_text_from_pdf,
+                              backend=pdf_backend("scoring"))
+
+
+# Long documents are summarized section by section, AURORA_SUMMARY_WORKERS requests at a time;
+# the partial summaries are saved per section, so summarizing a file again only runs the final request
+summarizer = MapReduceSummarizer(os.path.join("files", "cache", "summaries"), get_completion_from_messages,
+                                 section_tokens=int(os.getenv("AURORA_SUMMARY_SECTION_TOKENS", "6000")),
+                                 max_workers=int(os.getenv("AURORA_SUMMARY_WORKERS", "4")))
+
+
+def encode_texts(texts, batch_size=64):
+    """
+    Embed a list of texts with the sentence-transformer model.
+
+    Parameters:
+    texts (list): The texts to embed.
+    batch_size (int, optional): Number of texts encoded per forward pass. Default is 64.
+
+    Returns:
+    numpy.ndarray: An (n, dim) array of normalized embeddings.
+    """
+    return registry.get("embedding_model").encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+
+
+def generate_quiz_questions(section, n_questions):
+    """
+    Create quiz questions on one section of a document with `QuizzChain`.
+
+    Parameters:
+    section (str): The text of the section.
+    n_questions (int): Number of questions to create.
+
+    Returns:
+    list: The `QuizzQuestion`s.
+    """
+    from agents.common import get_chain
+    from agents.agent_quizz import QuizzChain
+    return get_chain(QuizzChain).invoke({"customer_input": section, "n_questions": n_questions}).questions
+
+
+def document_topic_id(text, topic_names=None):
+    """
+    Return the `topic` id whose name is the closest to the beginning of a document.
+
+    Parameters:
+    text (str): The text of the document.
+    topic_names (list, optional): The candidate topics (i.e. of the user's courses). Default is every topic.
+
+    Returns:
+    int or None: The id of the topic, or None if the table is empty.
+    """
+    topics = reference_data.topics
+    names = [name for name in (topic_names or []) if name in topics] or topics.all_names()
+    if not names:
+        return None
+    if len(names) == 1:
+        return topics.id_of(names[0])
+    vectors = encode_texts([text[:2000]] + names)
+    return topics.id_of(names[int((vectors[1:] @ vectors[0]).argmax())])
+
+
+# Quizzes are drawn from AURORA_QUIZ_SECTIONS sections spread over the document, generated in parallel,
+# and the near-duplicate questions are dropped by comparing their embeddings. Generated questions are
+# kept in the question bank, so the next quiz on the same document draws the unseen ones from it.
+quiz_engine = QuizEngine(generate_quiz_questions, encode_texts,
+                         n_questions=int(os.getenv("AURORA_QUIZ_QUESTIONS", "10")),
+                         max_sections=int(os.getenv("AURORA_QUIZ_SECTIONS", "5")),
+                         bank=QuestionBank() if os.getenv("AURORA_QUESTION_BANK", "1") == "1" else None)
+
+
+# Chunk embeddings of the uploaded PDFs, computed once per file content.
+# A document scores the mean of its 3 best chunks, so the whole file is compared and not only its first page.
+document_index = DocumentIndex(os.path.join("files", "cache", "doc_index"), encode_texts, pdf_text_store,
+                               mode="chunk", aggregate="mean", top_k=3)
+
+
+def find_most_relevant_pdf(user_input_text, pdf_files):
+    """
+    Find the PDF whose content is the most similar to the user input.
+
+    The index is first synced with `pdf_files` (only the chunks of new or changed files are embedded),
+    then all chunks are scored with a single query encode and one matrix-vector product.
+
+    Parameters:
+    user_input_text (str): The input provided by the user.
+    pdf_files (list): The paths of the candidate PDF files.
+
+    Returns:
+    str or None: The path of the most relevant PDF, or None if no PDF has a positive similarity.
+    """
+    document_index.sync(pdf_files)
+    most_relevant_pdf, _ = document_index.most_relevant(user_input_text)
+    return most_relevant_pdf
 
 
 def generate_flashcards_using_openai(text):
@@ -203,14 +528,40 @@ def generate_flashcards_using_openai(text):
     dict: A dictionary where keys are concepts and values are their corresponding definitions.
     """
 
+    # Get OpenAI's response for key-value pairs (concepts and definitions), shown while it is generated
+    openai_response = st.write_stream(stream_flashcards(text))
+
+    # Parse the response into a dictionary
+    return parse_flashcards(openai_response)
+
+
+def stream_flashcards(text):
+    """
+    Stream OpenAI's flashcards (concept: definition lines) for the given text.
+
+    Parameters:
+    text (str): The input text to be used for generating flashcards.
+
+    Yields:
+    str: The successive pieces of the model's response.
+    """
     # Prepare the system message to instruct the model on generating flashcards 
     messages = [{"role": "system", "content": "You are an AI that helps generate flashcards from a given text. Extract key concepts and definitions from the provided text. Make the key value pairs separated by ':'"}]
-    messages.append({"role": "user", "content": text})
+    messages.append({"role": "user", "content": preprocess_text(text)})
 
-    # Get OpenAI's response for key-value pairs (concepts and definitions)
-    openai_response = get_completion_from_messages(messages, temperature=0.3)
-    st.write(openai_response)
+    return stream_completion_from_messages(messages, temperature=0.3)
 
+
+def parse_flashcards(openai_response):
+    """
+    Parse the flashcards generated by OpenAI into a dictionary.
+
+    Parameters:
+    openai_response (str): The model's response, formatted as "Concept: Definition" lines.
+
+    Returns:
+    dict: A dictionary where keys are concepts and values are their corresponding definitions.
+    """
     # Parse the response into a dictionary (assuming it's formatted as key-value pairs)
     flashcards = {}
     try:
@@ -265,6 +616,11 @@ def send_it(reciever, text, caption="NEW AURORA BOT SUGGESTION"):
     Returns:
     - bool: True if email was sent successfully, False if any error occurred during the process.
     """
+    # Selenium is only needed here, so it is not imported with the rest of the module
+    from selenium import webdriver      # automate web browser interaction
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.chrome.options import Options
+
     try:
         # Open link in browser
         browser = webdriver.Chrome(options=Options())
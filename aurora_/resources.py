@@ -0,0 +1,225 @@
+import sys
+sys.dont_write_bytecode = True
+
+import importlib
+import os
+import threading
+
+
+# ----------------------------------------------------REGISTRY---------------------------------------------------------------------- #
+class ResourceRegistry:
+    """
+    Process-wide registry of heavy objects, created lazily on first use.
+
+    Every resource is registered with a factory (a function without arguments). Nothing is built at
+    registration time: the first call to `get` builds the object and every later call, from any thread
+    or Streamlit rerun, gets the same instance. A lock per resource guarantees that it is only built once.
+
+    Attributes:
+    None public; use `register`, `get`, `is_loaded` and `warm_up`.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        """
+        Register (or replace) the factory of a resource.
+
+        Parameters:
+        name (str): The name of the resource.
+        factory (callable): Function without arguments that builds the resource.
+
+        Returns:
+        None
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+            self._instances.pop(name, None)
+
+    def get(self, name):
+        """
+        Return a resource, building it on first use.
+
+        Parameters:
+        name (str): The name of the resource.
+
+        Returns:
+        object: The shared instance of the resource.
+        """
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+
+        try:
+            lock = self._locks[name]
+        except KeyError:
+            raise KeyError(f"Unknown resource: {name}") from None
+
+        with lock:
+            if name not in self._instances:
+                self._instances[name] = self._factories[name]()
+            return self._instances[name]
+
+    def get_or_register(self, name, factory):
+        """
+        Return a resource, registering its factory first if the name is unknown.
+
+        Parameters:
+        name (str): The name of the resource.
+        factory (callable): Function without arguments that builds the resource, used only if it is not registered yet.
+
+        Returns:
+        object: The shared instance of the resource.
+        """
+        with self._lock:
+            if name not in self._factories:
+                self._factories[name] = factory
+                self._locks[name] = threading.Lock()
+        return self.get(name)
+
+    def is_loaded(self, name):
+        """Return True if the resource was already built."""
+        return name in self._instances
+
+    def reset(self, name):
+        """Drop the built instance of a resource, so the next `get` builds it again."""
+        self._instances.pop(name, None)
+
+    def warm_up(self, names=None, background=True):
+        """
+        Build resources ahead of their first use.
+
+        Parameters:
+        names (list, optional): The resources to build. Default is every registered resource.
+        background (bool, optional): If True, build them in a daemon thread and return immediately.
+
+        Returns:
+        threading.Thread or None: The warm-up thread, if `background` is True.
+        """
+        names = list(self._factories) if names is None else list(names)
+
+        def build():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Warm-up of '{name}' failed: {e}")
+
+        if not background:
+            build()
+            return None
+        thread = threading.Thread(target=build, name="aurora-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+
+registry = ResourceRegistry()
+
+
+# ----------------------------------------------------FACTORIES---------------------------------------------------------------------- #
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+PAPER_INDEX_NAME = "total"
+VECTOR_STORE_DIR = os.path.join("files", "vector_store")
+
+
+def _embedding_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+
+def _http_client():
+    # One pool of keep-alive connections shared by every OpenAI call (chat model, tools, moderation)
+    import httpx
+    return httpx.Client(limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+                        timeout=httpx.Timeout(60.0, connect=10.0))
+
+
+def _openai_client():
+    from openai import OpenAI
+    return OpenAI(http_client=registry.get("http_client"))
+
+
+def _chat_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model="gpt-4o-mini", http_client=registry.get("http_client"))
+
+
+def _paper_embeddings():
+    # AURORA_VECTOR_EMBEDDINGS=local embeds the papers with the local model, so the local backend runs offline
+    if os.getenv("AURORA_VECTOR_EMBEDDINGS", "openai") == "local":
+        from local_vector_store import SentenceTransformerEmbeddings
+        return SentenceTransformerEmbeddings(registry.get("embedding_model"))
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model="text-embedding-3-small", http_client=registry.get("http_client"))
+
+
+def paper_embeddings_name():
+    """Name of the model behind "paper_embeddings", recorded in the local index to catch a change of model."""
+    return EMBEDDING_MODEL_NAME if os.getenv("AURORA_VECTOR_EMBEDDINGS", "openai") == "local" else "text-embedding-3-small"
+
+
+def _paper_vector_store():
+    # AURORA_VECTOR_BACKEND=local searches the memory-mapped index in files/vector_store instead of Pinecone
+    if os.getenv("AURORA_VECTOR_BACKEND", "pinecone") == "local":
+        from local_vector_store import LocalVectorStore
+        return LocalVectorStore(os.path.join(VECTOR_STORE_DIR, PAPER_INDEX_NAME), registry.get("paper_embeddings"),
+                                paper_embeddings_name())
+
+    from langchain_pinecone import PineconeVectorStore
+    from pinecone import Pinecone
+    index = Pinecone().Index(PAPER_INDEX_NAME)
+    return PineconeVectorStore(index=index, embedding=registry.get("paper_embeddings"))
+
+
+def _paper_retrieval():
+    # One search per query at the lowest threshold of the paper agents (resource 0.5, citation 0.65), k=10 for both
+    from retrieval import RetrievalService
+    return RetrievalService(registry.get("paper_vector_store"), k=10, min_threshold=0.5)
+
+
+def _pdf_pool():
+    # Workers are only spawned when a long PDF is extracted; AURORA_PDF_WORKERS caps their number
+    from pdf_extract import make_pool
+    return make_pool(max_workers=int(os.getenv("AURORA_PDF_WORKERS", "0")) or None,
+                     max_memory_mb=int(os.getenv("AURORA_PDF_WORKER_MEMORY_MB", "2048")))
+
+
+def _route_layer():
+    # The OpenAI-encoded RouteLayer of files/layer.json, unless AURORA_ROUTER=local opts in to the local router
+    if os.getenv("AURORA_ROUTER", "layer") != "local":
+        from semantic_router import RouteLayer
+        return RouteLayer.from_json("files/layer.json")
+
+    # The local router embeds files/intentions.json once and is rebuilt only when that file changes
+    from local_router import LocalRouter
+    model = registry.get("embedding_model")
+    encode = lambda texts: model.encode(texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+    return LocalRouter.load_or_build(os.path.join("files", "cache", "router"), os.path.join("files", "intentions.json"),
+                                     encode, EMBEDDING_MODEL_NAME)
+
+
+def _agent_executor(module_name):
+    def factory():
+        return importlib.import_module(module_name).build_agent_executor()
+    return factory
+
+
+registry.register("embedding_model", _embedding_model)
+registry.register("http_client", _http_client)
+registry.register("openai_client", _openai_client)
+registry.register("chat_llm", _chat_llm)
+registry.register("paper_embeddings", _paper_embeddings)
+registry.register("paper_vector_store", _paper_vector_store)
+registry.register("paper_retrieval", _paper_retrieval)
+registry.register("pdf_pool", _pdf_pool)
+registry.register("route_layer", _route_layer)
+registry.register("userinfo_agent", _agent_executor("agents.agent_userinfo"))
+registry.register("resource_agent", _agent_executor("agents.agent_resource"))
+registry.register("citation_agent", _agent_executor("agents.agent_citations"))
+registry.register("quizz_agent", _agent_executor("agents.agent_quizz"))
@@ -0,0 +1,104 @@
+import sys
+sys.dont_write_bytecode = True
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+# ----------------------------------------------------RETRIEVAL---------------------------------------------------------------------- #
+class RetrievalService:
+    """
+    Paper search shared by the resource and the citation agents.
+
+    Both agents search the same index with the same k and only differ by their relevance threshold. The
+    service runs one search per query at the lowest threshold (`min_threshold`) and keeps the scored
+    documents for `ttl` seconds, so when a turn reaches both agents the query is embedded and searched
+    once and each agent filters the shared result with its own threshold. Concurrent searches of the
+    same query wait for the one already running instead of starting their own.
+
+    Attributes:
+    vector_store (VectorStore): The LangChain vector store of the papers (Pinecone or local).
+    k (int): Number of documents fetched per search.
+    min_threshold (float): Relevance threshold of the shared search (the lowest one the agents use).
+    ttl (float): How long a result is reused, in seconds (about one turn).
+    max_queries (int): Maximum number of results kept.
+    """
+
+    def __init__(self, vector_store, k=10, min_threshold=0.5, ttl=120.0, max_queries=64):
+        self.vector_store = vector_store
+        self.k = k
+        self.min_threshold = min_threshold
+        self.ttl = ttl
+        self.max_queries = max_queries
+        self.searches = 0
+        self.reused = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _scored(self, query):
+        """Return the (document, relevance) pairs of a query, searching only if no fresh result is kept."""
+        key = " ".join(query.split())
+        now = time.monotonic()
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._results.move_to_end(key)
+                self.reused += 1
+                future = entry[1]
+                owner = False
+            else:
+                future = Future()
+                self._results[key] = (now, future)
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_queries:
+                    self._results.popitem(last=False)
+                self.searches += 1
+                owner = True
+
+        if owner:
+            try:
+                future.set_result(self.vector_store.similarity_search_with_relevance_scores(
+                    query, k=self.k, score_threshold=self.min_threshold))
+            except BaseException as e:
+                # A failed search is not kept: the next call tries again
+                with self._lock:
+                    if self._results.get(key, (None, None))[1] is future:
+                        del self._results[key]
+                future.set_exception(e)
+        return future.result()
+
+    def search(self, query, score_threshold, k=None):
+        """
+        Return the documents of a query whose relevance reaches a threshold.
+
+        Parameters:
+        query (str): The query.
+        score_threshold (float): The relevance threshold of the caller.
+        k (int, optional): Maximum number of documents. Default is the `k` of the service.
+
+        Returns:
+        list: The documents, most relevant first.
+        """
+        k = self.k if k is None else k
+        if score_threshold < self.min_threshold or k > self.k:
+            # Outside what the shared search fetches: search directly
+            return [doc for doc, _ in self.vector_store.similarity_search_with_relevance_scores(
+                query, k=k, score_threshold=score_threshold)]
+        return [doc for doc, score in self._scored(query) if score >= score_threshold][:k]
+
+    def clear(self):
+        """Forget every kept result (i.e. after the index was re-ingested)."""
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        """
+        Return the counters of the service.
+
+        Returns:
+        dict: Number of searches run and of searches served from a kept result.
+        """
+        with self._lock:
+            return {"searches": self.searches, "reused": self.reused, "kept": len(self._results)}
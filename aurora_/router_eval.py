@@ -0,0 +1,244 @@
+import sys
+sys.dont_write_bytecode = True
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from local_router import LocalRouter, NONE_LABEL, load_intentions, stratified_split
+
+
+# ----------------------------------------------------ENCODERS---------------------------------------------------------------------- #
+class EmbeddingRecording:
+    """
+    Embeddings of a fixed set of texts, saved to disk so the router can be evaluated offline.
+
+    `encode` serves the recorded texts from memory; a text that was not recorded is encoded with
+    `fallback_fn` (and recorded), or raises a KeyError when there is no fallback, so an offline run
+    never reaches the model silently.
+
+    Attributes:
+    texts (list): The recorded texts.
+    matrix (np.ndarray): Their (n, dim) embeddings, in the same order.
+    fallback_fn (callable or None): Encoder used for the texts that were not recorded.
+    """
+
+    def __init__(self, texts, matrix, fallback_fn=None):
+        self.texts = list(texts)
+        self.matrix = np.asarray(matrix, dtype=np.float32)
+        self.fallback_fn = fallback_fn
+        self._rows = {text: i for i, text in enumerate(self.texts)}
+
+    @classmethod
+    def record(cls, texts, encode_fn, batch_size=256):
+        """Encode distinct texts in batches and record them, keeping `encode_fn` as the fallback."""
+        texts = list(dict.fromkeys(texts))
+        matrix = np.concatenate([np.asarray(encode_fn(texts[i:i + batch_size]), dtype=np.float32)
+                                 for i in range(0, len(texts), batch_size)])
+        return cls(texts, matrix, encode_fn)
+
+    def encode(self, texts):
+        missing = [t for t in dict.fromkeys(texts) if t not in self._rows]
+        if missing:
+            if self.fallback_fn is None:
+                raise KeyError(f"{len(missing)} texts are not in the recording, i.e. {missing[0]!r}")
+            self.matrix = np.concatenate([self.matrix, np.asarray(self.fallback_fn(missing), dtype=np.float32)])
+            for text in missing:
+                self._rows[text] = len(self.texts)
+                self.texts.append(text)
+        return self.matrix[[self._rows[t] for t in texts]]
+
+    def save(self, path):
+        """Write the recording as a compressed .npz file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(path, texts=np.array(self.texts, dtype=object), matrix=self.matrix)
+
+    @classmethod
+    def load(cls, path, fallback_fn=None):
+        data = np.load(path, allow_pickle=True)
+        return cls(data["texts"].tolist(), data["matrix"], fallback_fn)
+
+
+def local_encoder(model_name):
+    """Return the encode function of a local sentence-transformer."""
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name)
+    return lambda texts: model.encode(texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+
+
+# ----------------------------------------------------METRICS---------------------------------------------------------------------- #
+def classification_report(truth, predicted, labels):
+    """
+    Compute the accuracy, per-route precision/recall/F1 and the confusion matrix.
+
+    Parameters:
+    truth (list): The expected routes (NONE_LABEL for no route).
+    predicted (list): The predicted routes.
+    labels (list): Every route, NONE_LABEL included.
+
+    Returns:
+    dict: "accuracy", "macro_f1", "routes" and "confusion" (confusion[expected][predicted] = count).
+    """
+    index = {label: i for i, label in enumerate(labels)}
+    confusion = np.zeros((len(labels), len(labels)), dtype=np.int64)
+    np.add.at(confusion, ([index[t] for t in truth], [index[p] for p in predicted]), 1)
+
+    true_positives = np.diag(confusion).astype(float)
+    predicted_count = confusion.sum(axis=0)
+    support = confusion.sum(axis=1)
+    precision = np.divide(true_positives, predicted_count, out=np.zeros(len(labels)), where=predicted_count > 0)
+    recall = np.divide(true_positives, support, out=np.zeros(len(labels)), where=support > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(len(labels)), where=precision + recall > 0)
+
+    return {"accuracy": round(float(true_positives.sum() / max(len(truth), 1)), 4),
+            "macro_f1": round(float(f1[support > 0].mean()) if (support > 0).any() else 0.0, 4),
+            "routes": {label: {"precision": round(float(precision[i]), 4),
+                               "recall": round(float(recall[i]), 4),
+                               "f1": round(float(f1[i]), 4),
+                               "support": int(support[i])}
+                       for i, label in enumerate(labels)},
+            "confusion": {label: {other: int(confusion[i, j]) for j, other in enumerate(labels) if confusion[i, j]}
+                          for i, label in enumerate(labels)}}
+
+
+def measure_latency(route_fn, messages, n_requests, concurrency):
+    """
+    Route `n_requests` single messages from `concurrency` threads, as concurrent chat sessions would.
+
+    Parameters:
+    route_fn (callable): The router, called with one message.
+    messages (list): The messages, cycled through.
+    n_requests (int): Number of calls.
+    concurrency (int): Number of threads calling the router.
+
+    Returns:
+    dict: Latency percentiles in milliseconds and throughput in messages per second.
+    """
+    def timed(message):
+        start = time.perf_counter()
+        route_fn(message)
+        return (time.perf_counter() - start) * 1000
+
+    route_fn(messages[0])
+    workload = [messages[i % len(messages)] for i in range(n_requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = np.array(list(pool.map(timed, workload)))
+    elapsed = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"requests": n_requests,
+            "concurrency": concurrency,
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "mean_ms": round(float(latencies.mean()), 3),
+            "throughput_per_s": round(n_requests / elapsed, 1)}
+
+
+def compare(report, baseline):
+    """Return the changes of accuracy, macro F1 and per-route F1 against a baseline report."""
+    changes = {"accuracy": round(report["accuracy"] - baseline["accuracy"], 4),
+               "macro_f1": round(report["macro_f1"] - baseline["macro_f1"], 4),
+               "routes_f1": {}}
+    for route, metrics in report["routes"].items():
+        if route in baseline["routes"]:
+            changes["routes_f1"][route] = round(metrics["f1"] - baseline["routes"][route]["f1"], 4)
+    return changes
+
+
+# ----------------------------------------------------EVALUATION---------------------------------------------------------------------- #
+def evaluate(samples, encoder, latency_encode_fn=None, test_size=0.15, seed=0, top_k=5, aggregation="sum",
+             n_requests=500, concurrency=1):
+    """
+    Build a local router on the training split and evaluate it on the test split.
+
+    Parameters:
+    samples (list): (message, route name or None) pairs.
+    encoder (EmbeddingRecording): Embeddings of the messages; the whole set is encoded in one batch.
+    latency_encode_fn (callable, optional): Encoder used for the latency run. Default is the recording,
+                                            which leaves out the encode time of the model.
+    test_size (float, optional): Share of every route kept for the test set.
+    seed (int, optional): Seed of the split.
+    top_k (int, optional): Nearest utterances voting in the router.
+    aggregation (str, optional): Aggregation of the votes.
+    n_requests (int, optional): Number of single-message calls timed.
+    concurrency (int, optional): Number of threads calling the router.
+
+    Returns:
+    dict: The report.
+    """
+    train, test = stratified_split(samples, test_size, seed)
+    router = LocalRouter.build(encoder.encode, train, top_k=top_k, aggregation=aggregation)
+
+    choices = router.route_batch([message for message, _ in test])
+    truth = [label or NONE_LABEL for _, label in test]
+    predicted = [choice.name or NONE_LABEL for choice in choices]
+    report = classification_report(truth, predicted, router.routes + [NONE_LABEL])
+
+    router.encode_fn = latency_encode_fn or encoder.encode
+    report["latency"] = measure_latency(router, [message for message, _ in test], n_requests, concurrency)
+    report["config"] = {"train": len(train), "test": len(test), "test_size": test_size, "seed": seed,
+                        "top_k": top_k, "aggregation": aggregation,
+                        "thresholds": {r: round(float(t), 4) for r, t in zip(router.routes, router.thresholds)}}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the local router: per-route precision/recall, confusion, latency.")
+    parser.add_argument("--intentions", default=os.path.join("files", "intentions.json"), help="Labelled utterances")
+    parser.add_argument("--encoder", choices=["local", "recorded"], default="local",
+                        help="'local' runs the sentence-transformer; 'recorded' only reads --recording (offline)")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Sentence-transformer of the local encoder")
+    parser.add_argument("--recording", default=os.path.join("files", "cache", "router_embeddings.npz"),
+                        help="Recorded embeddings, read with --encoder recorded and written with --save-recording")
+    parser.add_argument("--save-recording", action="store_true", help="Save the embeddings of the local encoder")
+    parser.add_argument("--test-size", type=float, default=0.15, help="Share of every route kept for the test set")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the split")
+    parser.add_argument("--top-k", type=int, default=5, help="Nearest utterances voting in the router")
+    parser.add_argument("--aggregation", choices=["mean", "sum", "max"], default="sum", help="Aggregation of the votes")
+    parser.add_argument("--requests", type=int, default=500, help="Single-message calls timed")
+    parser.add_argument("--concurrency", type=int, default=1, help="Threads calling the router")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of printing it")
+    parser.add_argument("--baseline", help="Previous JSON report to compare with")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="Exit with an error if the accuracy drops more than this below --baseline")
+    parser.add_argument("--min-accuracy", type=float, default=None, help="Exit with an error below this accuracy")
+    args = parser.parse_args()
+
+    samples = load_intentions(args.intentions)
+    latency_encode_fn = None
+    if args.encoder == "recorded":
+        encoder = EmbeddingRecording.load(args.recording)
+    else:
+        latency_encode_fn = local_encoder(args.model)
+        encoder = EmbeddingRecording.record([message for message, _ in samples], latency_encode_fn)
+        if args.save_recording:
+            encoder.save(args.recording)
+
+    report = evaluate(samples, encoder, latency_encode_fn, args.test_size, args.seed, args.top_k, args.aggregation,
+                      args.requests, args.concurrency)
+    report["config"].update({"encoder": args.encoder, "model": args.model})
+
+    failures = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["changes"] = compare(report, json.load(f))
+        if args.max_regression is not None and -report["changes"]["accuracy"] > args.max_regression:
+            failures.append(f"accuracy dropped by {-report['changes']['accuracy']:.4f}")
+    if args.min_accuracy is not None and report["accuracy"] < args.min_accuracy:
+        failures.append(f"accuracy {report['accuracy']:.4f} is below {args.min_accuracy}")
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Accuracy {report['accuracy']:.4f}, macro F1 {report['macro_f1']:.4f}, "
+              f"p95 {report['latency']['p95_ms']} ms; report written to {args.output}")
+    else:
+        print(text)
+    if failures:
+        sys.exit("Router check failed: " + "; ".join(failures))
@@ -0,0 +1,247 @@
+import sys
+sys.dont_write_bytecode = True
+
+import json
+import os
+import threading
+import time
+import numpy as np
+
+# ----------------------------------------------------INDEX_GENERATION---------------------------------------------------------------------- #
+GENERATIONS_DIR = os.path.join("files", "cache", "index_generations")
+
+
+def index_generation(index_name):
+    """
+    Return the generation stamp of a vector index.
+
+    The stamp changes every time the index is re-ingested (see `bump_index_generation`), so anything
+    derived from its content, like cached answers, can tell it is outdated.
+
+    Parameters:
+    index_name (str): The name of the vector index (i.e. the Pinecone index "total").
+
+    Returns:
+    str: The current generation of the index ("0" if it was never bumped).
+    """
+    try:
+        with open(os.path.join(GENERATIONS_DIR, f"{index_name}.json"), "r", encoding="utf-8") as f:
+            return str(json.load(f)["generation"])
+    except (OSError, ValueError, KeyError):
+        return "0"
+
+
+def bump_index_generation(index_name):
+    """
+    Mark a vector index as re-ingested, invalidating the answers cached on top of it.
+
+    Parameters:
+    index_name (str): The name of the vector index.
+
+    Returns:
+    str: The new generation of the index.
+    """
+    os.makedirs(GENERATIONS_DIR, exist_ok=True)
+    generation = f"{time.time_ns()}"
+    path = os.path.join(GENERATIONS_DIR, f"{index_name}.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"generation": generation}, f)
+    os.replace(path + ".tmp", path)
+    return generation
+
+
+def document_ids(documents):
+    """
+    Return the ids of retrieved documents, falling back to their file path when the store gives no id.
+
+    Parameters:
+    documents (list): The retrieved LangChain documents.
+
+    Returns:
+    list: The distinct ids, in retrieval order.
+    """
+    ids = [getattr(doc, "id", None) or doc.metadata.get("file_path") for doc in documents]
+    return list(dict.fromkeys(i for i in ids if i))
+
+
+# ----------------------------------------------------SEMANTIC_CACHE---------------------------------------------------------------------- #
+class SemanticCache:
+    """
+    Cache of RAG answers, looked up by the meaning of the question instead of its exact text.
+
+    Every entry keeps the normalized embedding of a question, the answer and the ids of the documents
+    the answer was based on. A new question is embedded once and compared with every stored question in
+    a single matrix-vector product; if the best cosine similarity reaches `threshold`, the stored answer
+    is returned without retrieval nor generation. Entries expire after `ttl` seconds, the least recently
+    used one is evicted when the cache is full, and the whole cache is dropped when the generation of the
+    underlying index changes.
+
+    Attributes:
+    name (str): The name of the cache, for the statistics.
+    encode_fn (callable): Function mapping a list of texts to an (n, dim) array of embeddings.
+    index_name (str): The vector index the answers come from.
+    threshold (float): Minimum cosine similarity to reuse an answer.
+    max_entries (int): Maximum number of cached answers.
+    ttl (float): Lifetime of an entry, in seconds.
+    enabled (bool): Global switch of the cache.
+    """
+
+    def __init__(self, name, encode_fn, index_name, threshold=0.92, max_entries=512, ttl=24 * 3600, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self.encode_fn = encode_fn
+        self.index_name = index_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._matrix = None
+        self._entries = []
+        self._created = np.zeros(0)
+        self._last_used = np.zeros(0)
+        self._generation = index_generation(self.index_name)
+
+    def _embed(self, question):
+        vector = np.asarray(self.encode_fn([question]), dtype=np.float32)[0]
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _check_generation(self):
+        """Drop every entry if the index was re-ingested since they were stored."""
+        if index_generation(self.index_name) != self._generation:
+            self._clear()
+
+    def lookup(self, question, embedding=None):
+        """
+        Find a cached answer for a question.
+
+        Parameters:
+        question (str): The question.
+        embedding (np.ndarray, optional): The normalized embedding of the question, if already computed.
+
+        Returns:
+        tuple: (answer or None, sources or None, best similarity, embedding of the question).
+        """
+        if embedding is None:
+            embedding = self._embed(question)
+        now = time.time()
+        with self._lock:
+            self._check_generation()
+            if self._matrix is None:
+                self.misses += 1
+                return None, None, 0.0, embedding
+
+            scores = self._matrix @ embedding
+            scores[now - self._created > self.ttl] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None, None, float(scores[best]), embedding
+
+            self._last_used[best] = now
+            self.hits += 1
+            answer, sources = self._entries[best]
+            return answer, sources, float(scores[best]), embedding
+
+    def store(self, question, answer, sources, embedding=None):
+        """
+        Add an answer to the cache, evicting expired entries and then the least recently used one.
+
+        Parameters:
+        question (str): The question.
+        answer (str): The answer given to it.
+        sources (list): The ids of the documents the answer was based on.
+        embedding (np.ndarray, optional): The normalized embedding of the question, if already computed.
+
+        Returns:
+        None
+        """
+        if embedding is None:
+            embedding = self._embed(question)
+        now = time.time()
+        with self._lock:
+            self._check_generation()
+            if self._matrix is not None:
+                keep = now - self._created <= self.ttl
+                if keep.sum() >= self.max_entries:
+                    keep[np.argmin(np.where(keep, self._last_used, np.inf))] = False
+                if not keep.all():
+                    self._matrix = self._matrix[keep] if keep.any() else None
+                    self._entries = [e for e, k in zip(self._entries, keep) if k]
+                    self._created = self._created[keep]
+                    self._last_used = self._last_used[keep]
+
+            row = embedding[None, :].astype(np.float32)
+            self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+            self._entries.append((answer, list(sources)))
+            self._created = np.append(self._created, now)
+            self._last_used = np.append(self._last_used, now)
+
+    def get_or_compute(self, question, compute_fn):
+        """
+        Return the cached answer of a question, or compute and cache it.
+
+        Parameters:
+        question (str): The question.
+        compute_fn (callable): Function question -> (answer, source ids), run on a miss.
+
+        Returns:
+        str: The answer.
+        """
+        if not self.enabled:
+            return compute_fn(question)[0]
+        answer, _, _, embedding = self.lookup(question)
+        if answer is not None:
+            return answer
+        answer, sources = compute_fn(question)
+        # Answers without any supporting document are not worth reusing
+        if sources:
+            self.store(question, answer, sources, embedding=embedding)
+        return answer
+
+    def invalidate(self):
+        """Drop every cached answer."""
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        """
+        Return the counters of the cache.
+
+        Returns:
+        dict: Number of entries, hits, misses and the hit rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"name": self.name,
+                    "entries": len(self._entries),
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+# ----------------------------------------------------CONFIGURATION---------------------------------------------------------------------- #
+# AURORA_SEMANTIC_CACHE=0 turns the answer caches off. AURORA_SEMANTIC_CACHE_THRESHOLD is the cosine similarity
+# (between all-MiniLM-L6-v2 embeddings) above which two questions get the same answer: lower it to reuse more
+# answers, at the cost of answering slightly different questions the same way.
+def make_semantic_cache(name, encode_fn, index_name):
+    """
+    Build a semantic cache configured from the environment.
+
+    Parameters:
+    name (str): The name of the cache.
+    encode_fn (callable): Function mapping a list of texts to an (n, dim) array of embeddings.
+    index_name (str): The vector index the answers come from.
+
+    Returns:
+    SemanticCache: The cache.
+    """
+    return SemanticCache(name, encode_fn, index_name,
+                         threshold=float(os.getenv("AURORA_SEMANTIC_CACHE_THRESHOLD", "0.92")),
+                         max_entries=int(os.getenv("AURORA_SEMANTIC_CACHE_MAX_ENTRIES", "512")),
+                         ttl=float(os.getenv("AURORA_SEMANTIC_CACHE_TTL", str(24 * 3600))),
+                         enabled=os.getenv("AURORA_SEMANTIC_CACHE", "1") == "1")
@@ -0,0 +1,177 @@
+import sys
+sys.dont_write_bytecode = True
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_extract import token_encoding
+
+MAP_PROMPT = """You summarize one section of a longer document that a student uploaded.
+Keep every main concept, definition, result and example of the section, in plain and precise words.
+Do not add an introduction or a conclusion: the summaries of all the sections are combined afterwards."""
+
+COMBINE_PROMPT = """You receive the summaries of consecutive sections of a longer document.
+Merge them into one summary that keeps every main concept, definition, result and example, in order,
+without repeating what several sections share."""
+
+
+# ----------------------------------------------------SECTIONS---------------------------------------------------------------------- #
+def split_sections(text, section_tokens, encoding=None):
+    """
+    Split a text into consecutive sections of at most `section_tokens` tokens.
+
+    Sections are cut between lines when possible, so a paragraph is only split when it is longer than
+    a section by itself.
+
+    Parameters:
+    text (str): The text to split.
+    section_tokens (int): Maximum number of tokens per section.
+    encoding (tiktoken.Encoding, optional): The tokenizer. Default is the one of the gpt-4o models.
+
+    Returns:
+    list: The sections, in order.
+    """
+    encoding = encoding or token_encoding()
+    sections, current, current_tokens = [], [], 0
+    for line in text.splitlines(keepends=True):
+        ids = encoding.encode(line, disallowed_special=())
+        if current and current_tokens + len(ids) > section_tokens:
+            sections.append("".join(current))
+            current, current_tokens = [], 0
+        # A line longer than a section is cut at token boundaries
+        while len(ids) > section_tokens:
+            sections.append(encoding.decode(ids[:section_tokens]))
+            ids = ids[section_tokens:]
+        if ids:
+            current.append(encoding.decode(ids))
+            current_tokens += len(ids)
+    if current:
+        sections.append("".join(current))
+    return [section for section in sections if section.strip()]
+
+
+# ----------------------------------------------------SUMMARIZER---------------------------------------------------------------------- #
+class MapReduceSummarizer:
+    """
+    Map-reduce summarization of documents longer than what one request should carry.
+
+    The text is split into sections of at most `section_tokens` tokens, the sections are summarized
+    concurrently by at most `max_workers` requests (map), and the partial summaries are merged the same
+    way until they fit in `reduce_tokens` (reduce). The final answer is then written from the partial
+    summaries by the caller, so it can be streamed in the tone of its route. A short document skips the
+    map step and is sent as it is.
+
+    Every partial summary is saved under the hash of its model, prompt and section, so summarizing the
+    same document again only runs the final request.
+
+    Attributes:
+    cache_dir (str): The folder where the partial summaries are saved.
+    complete_fn (callable): (messages, model=..., temperature=...) -> text, i.e. `get_completion_from_messages`.
+    model (str): The model of the partial summaries.
+    section_tokens (int): Maximum number of tokens of a section.
+    reduce_tokens (int): Maximum number of tokens of the partial summaries sent to the final request.
+    max_workers (int): Maximum number of requests in flight.
+    hits (int): Number of partial summaries read from the cache.
+    misses (int): Number of partial summaries requested.
+    """
+
+    def __init__(self, cache_dir, complete_fn, model="gpt-4o-mini", section_tokens=6000, reduce_tokens=12000,
+                 max_workers=4):
+        self.cache_dir = cache_dir
+        self.complete_fn = complete_fn
+        self.model = model
+        self.section_tokens = section_tokens
+        self.reduce_tokens = reduce_tokens
+        self.max_workers = max_workers
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, prompt, section):
+        return hashlib.sha256("\0".join((self.model, prompt, section)).encode("utf-8")).hexdigest()
+
+    def _summarize_section(self, prompt, section):
+        """Return the summary of one section, from the cache or from one request."""
+        path = os.path.join(self.cache_dir, f"{self._key(prompt, section)}.txt")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                summary = f.read()
+            with self._lock:
+                self.hits += 1
+            return summary
+        except FileNotFoundError:
+            pass
+
+        messages = [{"role": "system", "content": prompt}, {"role": "user", "content": section}]
+        summary = self.complete_fn(messages, model=self.model, temperature=0)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(summary)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.misses += 1
+        return summary
+
+    def _map(self, prompt, sections):
+        """Summarize sections concurrently, keeping their order."""
+        if len(sections) == 1:
+            return [self._summarize_section(prompt, sections[0])]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(sections))) as pool:
+            return list(pool.map(lambda section: self._summarize_section(prompt, section), sections))
+
+    def partial_summaries(self, text):
+        """
+        Reduce a text to consecutive partial summaries that fit in `reduce_tokens` tokens together.
+
+        Parameters:
+        text (str): The text of the document.
+
+        Returns:
+        list: The text itself, as the only item, if it already fits; the partial summaries otherwise.
+        """
+        encoding = token_encoding()
+        if len(encoding.encode(text, disallowed_special=())) <= self.reduce_tokens:
+            return [text]
+        summaries = self._map(MAP_PROMPT, split_sections(text, self.section_tokens, encoding))
+        while len(summaries) > 1 and sum(len(encoding.encode(s, disallowed_special=())) for s in summaries) > self.reduce_tokens:
+            # Merge neighbouring summaries in groups of one section, so every round divides their number
+            groups = split_sections("\n\n".join(summaries), self.section_tokens, encoding)
+            if len(groups) >= len(summaries):
+                break
+            summaries = self._map(COMBINE_PROMPT, groups)
+        return summaries
+
+    def final_messages(self, text, system_message):
+        """
+        Build the messages of the final summary request.
+
+        Parameters:
+        text (str): The text of the document.
+        system_message (str): The instructions of the final answer (i.e. the tone of the route).
+
+        Returns:
+        list: The messages, with the document itself or its partial summaries as the user message.
+        """
+        summaries = self.partial_summaries(text)
+        if len(summaries) == 1 and summaries[0] is text:
+            content = text
+        else:
+            content = ("The document is long: here are the summaries of its consecutive parts.\n\n"
+                       + "\n\n".join(f"Part {i + 1}:\n{summary}" for i, summary in enumerate(summaries)))
+        return [{"role": "system", "content": system_message}, {"role": "user", "content": content}]
+
+    def stats(self):
+        """
+        Return the cache counters of the partial summaries.
+
+        Returns:
+        dict: Number of hits, misses and the hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0}
@@ -1,8 +1,10 @@
 import streamlit as st
-from langchain_community.utilities.sql_database import SQLDatabase
 import datetime
 import re
 import sqlite3
+import database
+from profile_cache import profile_cache
+from reference_data import reference_data
 
 # functions to validate the inserted values in registering
 
@@ -21,85 +23,80 @@ def is_valid_email(email):
     return re.match(pattern, email) is not None
 
 
-def check_if_email_exists(email, db):
+def check_if_email_exists(email):
     '''
     Checks if email provided exists in the Database.
 
     Parameters:
     - email (str): The email address inserted by the user.
-    - db (database): Database containing information on users and courses from Aurora.
 
     Returns:
     - bool: True, if the email exists in the clients table from the Database; otherwise, False.
     '''
-    return email in [a[0] for a in eval(db.run("SELECT email FROM clients"))]
+    return database.fetch_one("SELECT 1 FROM clients WHERE Email = ?", (email,)) is not None
 
 
-def check_if_username_exists(username, db):
+def check_if_username_exists(username):
     '''
     Checks if username provided exists in the Database.
 
     Parameters:
     - username (str): The unique username inserted by the user.
-    - db (database): Database containing information on users and courses from Aurora.
 
     Returns:
     - bool: True, if the username exists in the clients table from the Database; otherwise, False.
     '''
-    return username in [a[0] for a in eval(db.run("SELECT username FROM clients"))]
+    return database.fetch_one("SELECT 1 FROM clients WHERE Username = ?", (username,)) is not None
 
 
-def check_if_phone_exists(phone, db):
+def check_if_phone_exists(phone):
     '''
     Checks if phone number provided exists in the Database.
 
     Parameters:
     - phone (str): The unique phone number inserted by the user.
-    - db (database): Database containing information on users and courses from Aurora.
 
     Returns:
     - bool: True, if phone simultaneously exists in the Database (withour country code),
             does not contain any other value besides numbers, and contains the country code; otherwise, False.
     '''
-    t1 = phone.replace("+", "") in [a[0].replace("+", "") for a in eval(db.run("SELECT phonenumber FROM clients"))]
+    t1 = database.fetch_one("SELECT 1 FROM clients WHERE REPLACE(PhoneNumber, '+', '') = ?",
+                            (phone.replace("+", ""),)) is not None
     t2 = len(re.findall(re.compile("[+\d]\d+"), phone)) == 0
     t3 = re.findall(re.compile("[+\d]\d+"), phone)[0] != phone
     return t1 and t2 and t3
 
 
-def verify_user(email, password, db):
+def verify_user(email, password):
     '''
     Checks if user credentials are valid (the password matches the user email from the Database).
 
     Parameters:
     - email (str): The email address inserted by the user.
     - password (str): The password inserted by the user.
-    - db (database): Database containing information on users and courses from Aurora.
 
     Returns:
     - bool: True, if the password inputted matches the password corresponding to the email in clients table from Database.
     '''
-    return password == eval(db.run(f"SELECT password FROM clients WHERE email = '{email}'"))[0][0]
+    return password == database.fetch_value("SELECT Password FROM clients WHERE Email = ?", (email,))
 
 
-def get_user_details(email, db):
+def get_user_details(email):
     '''
     Retrieves the user details (user id and username) from the Database, with the provided email correspondent.
 
     Parameters:
     - email (str): The email address inserted by the user.
-    - db (database): Database containing information on users and courses from Aurora.
 
     Returns:
-    - dictionary: dictionary with the user_id and username correspondent to the inputted email.
+    - UserDetails: the user_id and username correspondent to the inputted email.
     '''
-    user_id = eval(db.run(f"SELECT UserID FROM clients WHERE email = '{email}'"))[0][0]
-    username = eval(db.run(f"SELECT username FROM clients WHERE email = '{email}'"))[0][0]
-    return {"user_id": user_id, "username": username}
+    return database.fetch_one("SELECT UserID, Username FROM clients WHERE Email = ?", (email,),
+                              row_type=database.UserDetails)
 
 
 # Function to handle login
-def try_login(email, password, db):
+def try_login(email, password):
     """
     Authenticates the user with the provided email and password.
 
@@ -113,18 +110,20 @@ def try_login(email, password, db):
     if not email or not password:
         st.error('Please, fill all fields.')
         return False
-    elif not check_if_email_exists(email, db):
+    elif not check_if_email_exists(email):
         st.error('Email is not registered.')
         return False
-    elif not verify_user(email, password, db):
+    elif not verify_user(email, password):
         st.error('Incorrect password. Please, try again.')
         return False
     else:
         st.success('Login successful!')
-        user_details = get_user_details(email, db)
-        st.session_state.user_id = user_details["user_id"]
+        user_details = get_user_details(email)
+        # Build a fresh profile snapshot for this login
+        profile_cache.invalidate(user_details.user_id)
+        st.session_state.user_id = user_details.user_id
         st.session_state.logged_in = True
-        st.session_state.username = user_details["username"]
+        st.session_state.username = user_details.username
         st.session_state.useremail = email
         st.balloons()
         return True
@@ -171,62 +170,47 @@ def add_user(name_, email, password, username, date_birth, gender, phone, minute
     Returns:
     - bool: True if the user is successfully added to the database, False otherwise.
     '''
-    # Connect to the Database
-    db = SQLDatabase.from_uri(f'sqlite:///{db_path}')
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-
     city = city.split(",")[0]
 
-    # Try to add new user to the database
+    # Try to add new user to the database, in a single transaction (all rows or none)
     try:
-        # Insert user details into client table
-        cursor.execute(
-            f"INSERT INTO clients (Name, Email, Password, Username, DateOfBirth, Gender, PhoneNumber, MinPerDay, PreferredTime, CityID) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (name_, email, password, username, date_birth, gender.split("[")[-1].replace("]", ""),
-             phone, minuter_per_day,
-             pref_time, eval(db.run(f"SELECT CityID From city WHERE CityName = '{city}'"))[0][0]
-            ))
-        connection.commit()
-
-        id_ = eval(db.run(f"SELECT UserID FROM clients WHERE Email = '{email}'"))[0][0]
-
-        # Set user's primary language to language table
-        cursor.execute(
-            f"INSERT INTO user_language (UserID, LanguageID, PrimaryLanguage) VALUES (?, ?, 1)",
-            (id_, eval(db.run(f"SELECT LanguageID From languages WHERE Language = '{language}'"))[0][0])
-        )
-        connection.commit()
-
-        # Set preferred learning styles in learning_style table
-        for ls in learning_styles:
+        with database.transaction(db_path) as cursor:
+            # Insert user details into client table
             cursor.execute(
-            f"INSERT INTO user_learning_style (UserID, LearningID) VALUES (?, ?)",
-             (id_, eval(db.run(f"SELECT LearningID From learning_style WHERE Name = '{ls}'"))[0][0])
-            )
-            connection.commit()
+                f"INSERT INTO clients (Name, Email, Password, Username, DateOfBirth, Gender, PhoneNumber, MinPerDay, PreferredTime, CityID) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name_, email, password, username, date_birth, gender.split("[")[-1].replace("]", ""),
+                 phone, minuter_per_day,
+                 pref_time, reference_data.cities.id_of(city)
+                ))
+
+            id_ = cursor.lastrowid
 
-        # Add previous courses and respective GPA to previous_courses table
-        for pc in prev_course:
+            # Set user's primary language to language table
             cursor.execute(
-            f"INSERT INTO previous_courses (UserID, CourseID, GPA) VALUES (?, ?, 0.0)",
-            (id_, eval(db.run(f"SELECT CourseID FROM course WHERE Name = '{pc}'"))[0][0]) 
+                f"INSERT INTO user_language (UserID, LanguageID, PrimaryLanguage) VALUES (?, ?, 1)",
+                (id_, reference_data.languages.id_of(language))
             )
-            connection.commit()
 
-        for cc in curr_course:
-            cursor.execute(
-            f"INSERT INTO user_courses (UserID, CourseID) VALUES (?, ?)",
-            (id_, eval(db.run(f"SELECT CourseID FROM course WHERE Name = '{cc}'"))[0][0])
+            # Set preferred learning styles in learning_style table
+            cursor.executemany(
+                f"INSERT INTO user_learning_style (UserID, LearningID) VALUES (?, ?)",
+                [(id_, reference_data.learning_styles.id_of(ls)) for ls in learning_styles]
+            )
+
+            # Add previous courses and respective GPA to previous_courses table
+            cursor.executemany(
+                f"INSERT INTO previous_courses (UserID, CourseID, GPA) VALUES (?, ?, 0.0)",
+                [(id_, reference_data.courses.id_of(pc)) for pc in prev_course]
+            )
+
+            cursor.executemany(
+                f"INSERT INTO user_courses (UserID, CourseID) VALUES (?, ?)",
+                [(id_, reference_data.courses.id_of(cc)) for cc in curr_course]
             )
-            connection.commit()
         return True
     except sqlite3.OperationalError as e:
         st.error(f"Error: {e}")
         return False
-    finally:
-        cursor.close()
-        connection.close()
 
 
 def app():
@@ -244,15 +228,12 @@ def app():
     """
     # Connect to Database
     db_path = 'files/aurora.db'
-    # Create a SQLDatabase object
-    db = SQLDatabase.from_uri(f'sqlite:///{db_path}')
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
 
-    available_languages = sorted([a[0] for a in eval(db.run("SELECT language FROM languages"))])
-    available_learning_styles = sorted([a[0] for a in eval(db.run("SELECT name FROM learning_style"))])
-    available_city = sorted([", ".join(el) for el in eval(db.run("SELECT CityName, Country FROM city"))])
-    available_courses = sorted(list(set([el[0] for el in eval(db.run("""SELECT Name FROM course"""))])))
+    cities = reference_data.cities
+    available_languages = reference_data.languages.all_names()
+    available_learning_styles = reference_data.learning_styles.all_names()
+    available_city = sorted([", ".join((name, *cities.extras[id_])) for id_, name in cities.names.items()])
+    available_courses = reference_data.courses.all_names()
 
     # Show welcome page if already logged in
     if st.session_state.get('logged_in', False):
@@ -271,32 +252,40 @@ def app():
 
         st.write('If you would like to edit the GPA in your previous courses, click "Edit Courses".')
 
-        user_prev_courses = sorted(list(set(el[0] for el in eval(db.run(f'''SELECT cs.Name
-                                                FROM (SELECT * FROM clients c WHERE c.UserID = {st.session_state.user_id}) c
-                                                JOIN previous_courses u ON c.UserID = u.UserID
-                                                JOIN course cs ON u.CourseID = cs.CourseID''')))))
+        # Current GPA of each previous course, to prefill the editor
+        user_prev_courses = dict(sorted(database.fetch_all('''SELECT cs.Name, u.GPA
+                                                              FROM previous_courses u
+                                                              JOIN course cs ON u.CourseID = cs.CourseID
+                                                              WHERE u.UserID = ?''', (st.session_state.user_id,))))
 
-        # User wants to edit their courses
+        # User wants to edit their courses: the editor stays open across the reruns until it is submitted
         if st.button('Edit Courses'):
+            st.session_state.editing_courses = True
+
+        if st.session_state.get('editing_courses'):
             with st.form('Previous Courses GPA'):
-                for pc in user_prev_courses:
+                gpa_updates = []
+                for pc, current_gpa in user_prev_courses.items():
                     # Fetch CourseID from the Courses table based on the course name
-                    cursor.execute(f"SELECT CourseID FROM course WHERE Name = ?", (pc,))
-                    course_id = cursor.fetchone()
+                    course_id = reference_data.courses.id_of(pc)
 
                     # For each course in user_prev_courses
                     if course_id:
-                        course_id = course_id[0]
-                        # Insert the value for course GPA
-                        gpa_value = st.number_input(f"Your GPA in {pc}", min_value=0.0, max_value=4.0, format="%0.2f")
-
-                        # Update the GPA value into the previous_courses table
-                        cursor.execute(
-                            "UPDATE previous_courses SET GPA = ? WHERE UserID = ? AND CourseID = ?",
-                            (st.session_state.user_id, course_id, gpa_value))
-                        connection.commit()
-
-                st.form_submit_button('Update')
+                        # Insert the value for course GPA, starting from the saved one
+                        gpa_value = st.number_input(f"Your GPA in {pc}", min_value=0.0, max_value=4.0,
+                                                    value=float(current_gpa or 0.0), format="%0.2f")
+                        gpa_updates.append((gpa_value, st.session_state.user_id, course_id))
+
+                # Only the submitted values are written: the other reruns just render the form
+                if st.form_submit_button('Update'):
+                    # Update the GPA values into the previous_courses table, in one transaction
+                    if gpa_updates:
+                        with database.transaction(db_path) as cursor:
+                            cursor.executemany(
+                                "UPDATE previous_courses SET GPA = ? WHERE UserID = ? AND CourseID = ?", gpa_updates)
+                        profile_cache.invalidate(st.session_state.user_id)
+                    st.session_state.editing_courses = False
+                    st.rerun()
 
     # Show 'Login/SignUp' option and create the forms
     else:
@@ -352,13 +341,13 @@ def app():
                 elif (len(password) < 8) or ("'" in password):
                     st.error('Password must be at least 8 characters')
                     st.session_state.register_in = False
-                elif check_if_email_exists(email, db):
+                elif check_if_email_exists(email):
                     st.error('Email already registered.')
                     st.session_state.register_in = False
-                elif check_if_username_exists(username, db):
+                elif check_if_username_exists(username):
                     st.error('Username already registered.')
                     st.session_state.register_in = False
-                elif check_if_phone_exists(phone, db):
+                elif check_if_phone_exists(phone):
                     st.error('Phone number already registered.')
                     st.session_state.register_in = False
                 else:
@@ -382,7 +371,7 @@ def app():
 
                 # Make sure values inserted are valid
                 if submit:
-                    try_login(email, password, db)
+                    try_login(email, password)
 
         # Show welcome message when logged in
         if st.session_state.logged_in:
@@ -3,13 +3,14 @@ sys.dont_write_bytecode = True
 
 import streamlit as st
 from streamlit_option_menu import option_menu
-import about, account, home
 import os
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="streamlit")
 
 import sys
+# The project root must be importable before the pages, since they use its shared modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import about, account, home
 import session
 
 # Now you can import res_fun